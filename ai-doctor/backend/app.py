@@ -1,20 +1,112 @@
-from flask import Flask, app
+import re
+import time
+
+from flask import Flask, app, g, request
 from flask_cors import CORS
 
+from src.ai import diagnosis_orchestrator, endpoint_pool, transport
+from src.core import lifecycle
+from src.core import logger as logging_setup
 from src.core.config import config
+from src.core.jobs import jobs
 from src.core.logger import logger
+from src.core.metrics import HTTP_LATENCY, HTTP_REQUESTS
+from src.core.request_context import (
+    PRIORITY_NORMAL,
+    get_request_id,
+    get_stages,
+    set_priority,
+    start_request,
+)
+from src.core.runtime_config import start_replanner
 from src.api.routes import api_bp
-from src.api.routes import api_bp, admin_bp
+from src.api.routes import api_bp, admin_bp, model_manager
+
+
+def start_background_services() -> None:
+    """Per-process background work: model warm-up, keep-alive and re-planning.
+
+    Called by ``create_app`` for the dev server and from gunicorn's
+    ``post_fork`` hook in production, since threads started in the preloading
+    master do not survive ``fork()``.
+    """
+    # Load planned models in the background; startup does not wait for them
+    if config.MODEL_WARMUP:
+        model_manager.start()
+
+    def on_replan(changed):
+        # Not built yet: it reads the new plan when it is
+        orchestrator = diagnosis_orchestrator.peek_orchestrator()
+        if orchestrator is not None:
+            orchestrator.apply_models()
+        model_manager.warm_async(changed)
+
+    # Switch to smaller models under memory pressure instead of swapping
+    start_replanner(config.MODEL_REPLAN_INTERVAL, on_replan)
+
 
+# Logging first, so the other hooks' messages reach the new writer thread
+lifecycle.register_after_fork(logging_setup.after_fork)
+lifecycle.register_after_fork(diagnosis_orchestrator.after_fork)
+lifecycle.register_after_fork(jobs.after_fork)
+lifecycle.register_after_fork(transport.close_all)
+lifecycle.register_after_fork(endpoint_pool.after_fork)
+lifecycle.register_shutdown(logging_setup.stop)  # runs last: hooks run in reverse
+lifecycle.register_shutdown(transport.close_all)
+lifecycle.register_shutdown(lambda: jobs.shutdown(config.SHUTDOWN_TIMEOUT))
 
-def create_app() -> Flask:
+
+_REQUEST_ID_RE = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+
+def create_app(start_background: bool = True) -> Flask:
     app = Flask(__name__)
     app.config["SECRET_KEY"] = config.SECRET_KEY
+    # Small headroom over the image limit for the multipart framing
+    app.config["MAX_CONTENT_LENGTH"] = config.MAX_UPLOAD_BYTES + 64 * 1024
     CORS(app, resources={r"/api/*": {"origins": "*"}})
 
     app.register_blueprint(api_bp)
     app.register_blueprint(admin_bp)
 
+    if start_background:
+        start_background_services()
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+        # Reuse a caller-supplied id (e.g. from a proxy) so logs join up across services
+        incoming = request.headers.get("X-Request-ID", "")
+        start_request(incoming if _REQUEST_ID_RE.fullmatch(incoming) else None)
+        # Server threads are reused; never inherit the previous request's priority
+        set_priority(PRIORITY_NORMAL)
+
+    @app.after_request
+    def record_request(response):
+        # Label by URL rule, not raw path, to keep label cardinality bounded
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=str(response.status_code))
+        start = g.pop("request_start", None)
+        if start is not None:
+            elapsed = time.perf_counter() - start
+            HTTP_LATENCY.observe(elapsed, route=route, method=request.method)
+            if config.LOG_SLOW_REQUEST_MS and elapsed * 1000 >= config.LOG_SLOW_REQUEST_MS:
+                stages = get_stages()
+                logger.warning(
+                    "Slow request %s %s: %.0f ms (%s)",
+                    request.method,
+                    route,
+                    elapsed * 1000,
+                    ", ".join(f"{k}={v}" for k, v in stages.items()) or "no stages",
+                    extra={
+                        "status": response.status_code,
+                        "duration_ms": round(elapsed * 1000, 2),
+                        "stages": stages,
+                    },
+                )
+        response.headers["X-Request-ID"] = get_request_id()
+        return response
+
     @app.errorhandler(500)
     def handle_500(err):
         logger.exception("Internal error: %s", err)
@@ -26,4 +118,5 @@ def create_app() -> Flask:
 if __name__ == "__main__":
     app = create_app()
     logger.info("Starting offline AI server on %s:%s", config.API_HOST, config.API_PORT)
+    # Development server only; see gunicorn.conf.py for production
     app.run(host=config.API_HOST, port=config.API_PORT, debug=config.DEBUG)
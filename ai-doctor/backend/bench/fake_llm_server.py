@@ -0,0 +1,254 @@
+"""Local stand-in for an OpenAI-compatible /v1/chat/completions server.
+
+Used by the benchmark harness so the backend can be load-tested without any
+real model loaded. Latency, generation speed and failure rate are
+configurable; streaming (``stream: true``) and the ``usage`` field are
+supported.
+
+    python -m bench.fake_llm_server --port 11500 --latency 0.2 --tokens-per-sec 40
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+REASONING_REPLY = {
+    "severity": "low",
+    "care_level": "self-care",
+    "red_flags": [],
+    "diagnoses": [
+        {"name": "Common cold", "probability": 0.6, "reasons": "Fever with cough and runny nose."},
+        {"name": "Influenza", "probability": 0.3, "reasons": "Fever and body aches."},
+    ],
+    "medications": ["paracetamol"],
+    "doctor_note": "Likely viral upper respiratory infection.",
+    "disclaimer": "This is not a medical diagnosis.",
+}
+
+VISION_REPLY = {
+    "rash_type": "maculopapular",
+    "location": "forearm",
+    "severity": "mild",
+    "infection_risk": "low",
+    "doctor_note": "Small red rash without signs of infection.",
+}
+
+EXPLANATION = (
+    "Your symptoms most likely point to a common cold. This usually gets better on its own "
+    "within a week. Rest, drink fluids and watch for any worsening. This is not certain, so "
+    "please see a real doctor if you feel worse or the fever lasts more than three days."
+)
+
+
+class FakeLLMSettings:
+    def __init__(
+        self,
+        latency: float = 0.1,
+        tokens_per_sec: float = 50.0,
+        failure_rate: float = 0.0,
+        jitter: float = 0.0,
+    ):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.failure_rate = failure_rate
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+
+
+def _pick_reply(body: Dict[str, Any]) -> str:
+    messages = body.get("messages") or []
+    system = str(messages[0].get("content", "")) if messages else ""
+    user_content = messages[-1].get("content") if messages else ""
+    if body.get("response_format"):
+        # Schema-constrained request: a grammar-sampling server returns bare JSON
+        return json.dumps(REASONING_REPLY)
+    if "clinician" in system:
+        return "```json\n" + json.dumps(REASONING_REPLY) + "\n```"
+    if isinstance(user_content, list) or "image" in system.lower():
+        return json.dumps(VISION_REPLY)
+    return EXPLANATION
+
+
+def _prompt_tokens(body: Dict[str, Any]) -> int:
+    return max(1, len(json.dumps(body.get("messages", []))) // 4)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "FakeLLM/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def settings(self) -> FakeLLMSettings:
+        return self.server.settings  # type: ignore[attr-defined]
+
+    def log_message(self, format, *args):  # noqa: A002 - keep the server quiet
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/v1/models", "/api/tags", "/health"):
+            self._send_json(200, {"object": "list", "data": [], "models": []})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid json"})
+            return
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": "not found"})
+            return
+
+        settings = self.settings
+        with settings.lock:
+            settings.requests += 1
+            fail = random.random() < settings.failure_rate
+            if fail:
+                settings.failures += 1
+
+        delay = settings.latency + random.uniform(0, settings.jitter)
+        time.sleep(delay)
+        if fail:
+            self._send_json(500, {"error": "injected failure"})
+            return
+
+        reply = _pick_reply(body)
+        words = reply.split(" ")
+        completion_tokens = len(words)
+        usage = {
+            "prompt_tokens": _prompt_tokens(body),
+            "completion_tokens": completion_tokens,
+            "total_tokens": _prompt_tokens(body) + completion_tokens,
+        }
+        per_token = 1.0 / settings.tokens_per_sec if settings.tokens_per_sec > 0 else 0.0
+        model = body.get("model", "fake")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for i, word in enumerate(words):
+                time.sleep(per_token)
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "model": model,
+                    "choices": [
+                        {"index": 0, "delta": {"content": word if i == 0 else " " + word}}
+                    ],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            final = {"id": completion_id, "object": "chat.completion.chunk", "model": model, "choices": [], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+            self.wfile.flush()
+            self.close_connection = True
+            return
+
+        time.sleep(per_token * completion_tokens)
+        self._send_json(
+            200,
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": reply},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            },
+        )
+
+
+class FakeLLMServer:
+    """Run the fake server on a background thread."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **settings: Any):
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.settings = FakeLLMSettings(**settings)  # type: ignore[attr-defined]
+        self._thread: threading.Thread | None = None
+
+    @property
+    def settings(self) -> FakeLLMSettings:
+        return self.httpd.settings  # type: ignore[attr-defined]
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def chat_url(self) -> str:
+        return f"{self.base_url}/v1/chat/completions"
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "FakeLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--latency", type=float, default=0.1, help="fixed delay per request (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay up to N s")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeLLMServer(
+        args.host,
+        args.port,
+        latency=args.latency,
+        tokens_per_sec=args.tokens_per_sec,
+        failure_rate=args.failure_rate,
+        jitter=args.jitter,
+    )
+    print(f"Fake LLM server listening on {server.chat_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Local stand-in for a model mirror (Hugging Face, or a clinic's LAN share).
+
+Serves files under ``--root`` with single-range ``Range`` support, so
+``download_gguf.py`` can be exercised offline. A per-connection bandwidth
+cap and randomly dropped connections simulate a weak link; ``--no-ranges``
+mimics a server that always sends the whole file. ``--linked-etag`` answers
+like a Hugging Face ``resolve`` URL: a redirect carrying the file's SHA-256
+in ``X-Linked-Etag``.
+
+    python -m bench.fake_model_mirror --root /tmp/mirror --port 11600 --rate-kbps 2048 --drop-rate 0.1
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class FakeMirrorSettings:
+    def __init__(
+        self,
+        root: str = ".",
+        rate_kbps: float = 0.0,
+        drop_rate: float = 0.0,
+        ranges: bool = True,
+        linked_etag: bool = False,
+    ):
+        self.root = os.path.abspath(root)
+        self.rate_kbps = rate_kbps
+        self.drop_rate = drop_rate
+        self.ranges = ranges
+        self.linked_etag = linked_etag
+        self.digests: Dict[str, str] = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.range_requests = 0
+        self.drops = 0
+        self.bytes_sent = 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "FakeMirror/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def settings(self) -> FakeMirrorSettings:
+        return self.server.settings  # type: ignore[attr-defined]
+
+    def log_message(self, format, *args):  # noqa: A002 - keep the server quiet
+        pass
+
+    def _resolve(self) -> Optional[str]:
+        rel = self.path.split("?", 1)[0].lstrip("/")
+        path = os.path.abspath(os.path.join(self.settings.root, rel))
+        if not path.startswith(self.settings.root + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def _range(self, size: int) -> Optional[Tuple[int, int]]:
+        header = self.headers.get("Range")
+        if not header or not self.settings.ranges:
+            return None
+        match = _RANGE_RE.match(header.strip())
+        if not match or not (match.group(1) or match.group(2)):
+            return None
+        if match.group(1):
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start, end = max(0, size - int(match.group(2))), size - 1
+        return start, min(end, size - 1)
+
+    def _not_found(self) -> None:
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _redirect(self, path: str) -> None:
+        with self.settings.lock:
+            digest = self.settings.digests.get(path)
+        if digest is None:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+            digest = digest.hexdigest()
+            with self.settings.lock:
+                self.settings.digests[path] = digest
+        self.send_response(302)
+        self.send_header("Location", self.path.split("?", 1)[0] + "?direct=1")
+        self.send_header("X-Linked-Etag", f'"{digest}"')
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def _serve(self, body: bool) -> None:
+        settings = self.settings
+        path = self._resolve()
+        if path is None:
+            self._not_found()
+            return
+        if settings.linked_etag and "direct=1" not in self.path:
+            self._redirect(path)
+            return
+        size = os.path.getsize(path)
+        span = self._range(size)
+        with settings.lock:
+            settings.requests += 1
+            settings.range_requests += span is not None
+
+        if span is not None and span[0] >= size:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        start, end = span if span is not None else (0, size - 1)
+        length = end - start + 1
+        self.send_response(206 if span is not None else 200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(length))
+        if settings.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if span is not None:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if not body:
+            return
+
+        # A dropped connection stops somewhere inside the body
+        cut = random.randint(0, length - 1) if length and random.random() < settings.drop_rate else None
+        per_block = 64 * 1024
+        delay = per_block / (settings.rate_kbps * 1024) if settings.rate_kbps > 0 else 0.0
+        sent = 0
+        with open(path, "rb") as f:
+            f.seek(start)
+            while sent < length:
+                block = f.read(min(per_block, length - sent))
+                if cut is not None and sent + len(block) > cut:
+                    block = block[: cut - sent]
+                try:
+                    self.wfile.write(block)
+                except OSError:
+                    return
+                sent += len(block)
+                with settings.lock:
+                    settings.bytes_sent += len(block)
+                if cut is not None and sent >= cut:
+                    with settings.lock:
+                        settings.drops += 1
+                    self.close_connection = True
+                    return
+                if delay:
+                    time.sleep(delay * len(block) / per_block)
+
+
+class FakeModelMirror:
+    """Run the fake mirror on a background thread."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **settings: Any):
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.settings = FakeMirrorSettings(**settings)  # type: ignore[attr-defined]
+        self._thread: threading.Thread | None = None
+
+    @property
+    def settings(self) -> FakeMirrorSettings:
+        return self.httpd.settings  # type: ignore[attr-defined]
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeModelMirror":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "FakeModelMirror":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11600)
+    parser.add_argument("--root", default=".", help="directory to serve (laid out like models/)")
+    parser.add_argument("--rate-kbps", type=float, default=0.0, help="per-connection cap, KiB/s (0 = none)")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="chance a response is cut short")
+    parser.add_argument("--no-ranges", action="store_true", help="ignore Range headers")
+    parser.add_argument("--linked-etag", action="store_true", help="redirect with X-Linked-Etag like Hugging Face")
+    args = parser.parse_args()
+
+    server = FakeModelMirror(
+        args.host,
+        args.port,
+        root=args.root,
+        rate_kbps=args.rate_kbps,
+        drop_rate=args.drop_rate,
+        ranges=not args.no_ranges,
+        linked_etag=args.linked_etag,
+    )
+    print(f"Fake model mirror serving {server.settings.root} on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""Offline load test for the backend against the fake LLM server.
+
+Starts ``FakeLLMServer``, points every LLM endpoint at it, serves
+``create_app()`` on a local port and drives ``/symptom/analyze`` and
+``/image/analyze`` at a fixed concurrency. Latency percentiles and
+throughput are printed and written to JSON so runs can be compared
+between commits:
+
+    cd ai-doctor/backend
+    python -m bench.load_test --concurrency 8 --requests 200 --output bench/results/head.json
+    python -m bench.load_test --compare bench/results/head.json
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import random
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# backend/src and ai-doctor/src together form the "src" namespace package
+for path in (BACKEND_DIR, os.path.dirname(BACKEND_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from bench.fake_llm_server import FakeLLMServer  # noqa: E402
+
+SYMPTOM_POOL = [
+    "fever",
+    "cough",
+    "runny nose",
+    "headache",
+    "sore throat",
+    "fatigue",
+    "nausea",
+    "rash",
+    "body ache",
+    "diarrhea",
+]
+
+
+def _tiny_png(width: int = 64, height: int = 64) -> bytes:
+    """A valid RGB PNG built with the stdlib only."""
+    row = b"\x00" + bytes([200, 120, 110]) * width
+    raw = row * height
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # Nearest-rank method
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def run_scenario(
+    name: str, send: Callable[[int], int], total: int, concurrency: int
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def one(i: int) -> None:
+        start = time.perf_counter()
+        try:
+            status = str(send(i))
+        except Exception as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+
+    ok = statuses.get("200", 0)
+    return {
+        "scenario": name,
+        "requests": total,
+        "concurrency": concurrency,
+        "ok": ok,
+        "errors": total - ok,
+        "statuses": statuses,
+        "wall_seconds": round(wall, 3),
+        "requests_per_sec": round(total / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(max(latencies) * 1000, 2) if latencies else 0.0,
+        },
+    }
+
+
+def compare(current: Dict[str, Any], baseline_path: str) -> None:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    before = {s["scenario"]: s for s in baseline.get("scenarios", [])}
+    print(f"\nCompared with {baseline_path} ({baseline.get('commit', '?')}):")
+    for scenario in current["scenarios"]:
+        old = before.get(scenario["scenario"])
+        if not old:
+            continue
+        for metric in ("p50", "p95", "p99"):
+            a, b = old["latency_ms"][metric], scenario["latency_ms"][metric]
+            delta = (b - a) / a * 100 if a else 0.0
+            print(f"  {scenario['scenario']:<8} {metric}: {a:>9.1f} -> {b:>9.1f} ms ({delta:+.1f}%)")
+        a, b = old["requests_per_sec"], scenario["requests_per_sec"]
+        delta = (b - a) / a * 100 if a else 0.0
+        print(f"  {scenario['scenario']:<8} rps: {a:>10.2f} -> {b:>10.2f}    ({delta:+.1f}%)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline backend load test")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", default="symptom,image", help="comma list: symptom,image")
+    parser.add_argument("--latency", type=float, default=0.1, help="fake LLM fixed latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--identical", action="store_true", help="send the same symptoms every time")
+    parser.add_argument("--cache", action="store_true", help="leave the response and image caches enabled")
+    parser.add_argument("--fast-path", action="store_true", help="leave the rule-based triage fast path enabled")
+    parser.add_argument("--replicas", type=int, default=1, help="fake LLM servers behind each role")
+    parser.add_argument(
+        "--slow-replica", type=float, default=0.0, help="extra latency (s) on the first replica"
+    )
+    parser.add_argument("--hedge-ms", type=float, default=0.0, help="LLM_HEDGE_AFTER_MS for the run")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to diff against")
+    args = parser.parse_args()
+
+    fakes = [
+        FakeLLMServer(
+            latency=args.latency + (args.slow_replica if i == 0 else 0.0),
+            jitter=args.jitter,
+            tokens_per_sec=args.tokens_per_sec,
+            failure_rate=args.failure_rate,
+        ).start()
+        for i in range(max(1, args.replicas))
+    ]
+
+    # Config is read at import time, so the environment must be set first
+    for key in ("QWEN_REASONING_ENDPOINT", "LLAMA_EXPLAIN_ENDPOINT", "QWEN_VL_ENDPOINT"):
+        os.environ[key] = ",".join(fake.chat_url for fake in fakes)
+    if args.hedge_ms:
+        os.environ["LLM_HEDGE_AFTER_MS"] = str(args.hedge_ms)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if not args.cache:
+        os.environ["RESPONSE_CACHE_ENABLED"] = "False"
+        os.environ["IMAGE_CACHE_ENABLED"] = "False"
+    if not args.fast_path:
+        os.environ["FAST_PATH_ENABLED"] = "False"
+
+    import logging
+
+    import requests
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    from app import create_app
+
+    app = create_app()
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}/api/v1"
+
+    session = requests.Session()
+    png = _tiny_png()
+
+    # Low-RAM tiers plan no vision model; give the fake server one to answer for
+    models = session.get(f"{base}/admin/models", timeout=10).json()["models"]
+    if not models.get("VISION_MODEL"):
+        session.post(f"{base}/admin/models", json={"VISION_MODEL": "fake-vision"}, timeout=10)
+
+    def send_symptom(i: int) -> int:
+        if args.identical:
+            symptoms = ["fever", "cough"]
+        else:
+            symptoms = random.Random(i).sample(SYMPTOM_POOL, 3) + [f"case-{i}"]
+        body = {"symptoms": symptoms, "description": "benchmark", "age": 30, "language": "en"}
+        return session.post(f"{base}/symptom/analyze", json=body, timeout=120).status_code
+
+    def send_image(i: int) -> int:
+        files = {"file": (f"img-{i}.png", io.BytesIO(png), "image/png")}
+        return session.post(f"{base}/image/analyze", files=files, timeout=120).status_code
+
+    senders = {"symptom": send_symptom, "image": send_image}
+    results = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "fake_latency": args.latency,
+            "fake_jitter": args.jitter,
+            "fake_tokens_per_sec": args.tokens_per_sec,
+            "fake_failure_rate": args.failure_rate,
+            "identical": args.identical,
+            "cache": args.cache,
+            "replicas": args.replicas,
+            "slow_replica": args.slow_replica,
+            "hedge_ms": args.hedge_ms,
+        },
+        "scenarios": [],
+    }
+
+    try:
+        for name in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+            if name not in senders:
+                parser.error(f"unknown scenario {name!r}")
+            result = run_scenario(name, senders[name], args.requests, args.concurrency)
+            results["scenarios"].append(result)
+            lat = result["latency_ms"]
+            print(
+                f"{name:<8} {result['requests_per_sec']:>8.2f} req/s  "
+                f"p50 {lat['p50']:>8.1f} ms  p95 {lat['p95']:>8.1f} ms  p99 {lat['p99']:>8.1f} ms  "
+                f"errors {result['errors']}"
+            )
+        results["fake_llm"] = {
+            "requests": sum(fake.settings.requests for fake in fakes),
+            "failures": sum(fake.settings.failures for fake in fakes),
+            "per_replica": [fake.settings.requests for fake in fakes],
+        }
+    finally:
+        server.shutdown()
+        for fake in fakes:
+            fake.stop()
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
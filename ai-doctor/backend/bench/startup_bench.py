@@ -0,0 +1,181 @@
+"""Startup-time benchmark for the backend.
+
+Each run starts a fresh interpreter (nothing imported or cached yet) that
+times the phases a restarted worker goes through:
+
+- ``import_ms``: ``import app``
+- ``create_app_ms``: ``create_app()``
+- ``first_health_ms``: first 200 from ``GET /api/v1/health/status``
+- ``first_analyze_ms``: first ``/symptom/analyze`` against the fake LLM
+  server (this is where the orchestrator and its clients get built)
+- ``process_ready_ms``: process spawn to the first healthy response,
+  interpreter start-up included
+
+Medians over ``--runs`` are printed and written to JSON. ``--compare``
+diffs against an earlier run and, with ``--max-regression``, exits 1 when
+a phase got slower by more than that percentage:
+
+    cd ai-doctor/backend
+    python -m bench.startup_bench --runs 7 --output bench/results/startup.json
+    python -m bench.startup_bench --compare bench/results/startup.json --max-regression 25
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+from bench.load_test import BACKEND_DIR, _git_commit
+from bench.fake_llm_server import FakeLLMServer
+
+PHASES = ("import_ms", "create_app_ms", "first_health_ms", "first_analyze_ms", "process_ready_ms")
+
+# Runs in the child interpreter; prints one JSON line with the phase timings
+_CHILD = r"""
+import json, os, sys, time
+t_spawn = float(os.environ["STARTUP_BENCH_T0"])
+sys.path[:0] = [os.environ["STARTUP_BENCH_BACKEND"], os.path.dirname(os.environ["STARTUP_BENCH_BACKEND"])]
+out = {}
+t = time.perf_counter()
+import app as app_module
+out["import_ms"] = (time.perf_counter() - t) * 1000
+t = time.perf_counter()
+app = app_module.create_app(start_background=False)
+out["create_app_ms"] = (time.perf_counter() - t) * 1000
+client = app.test_client()
+t = time.perf_counter()
+status = client.get("/api/v1/health/status").status_code
+out["first_health_ms"] = (time.perf_counter() - t) * 1000
+out["process_ready_ms"] = (time.time() - t_spawn) * 1000
+out["health_status"] = status
+if os.environ.get("STARTUP_BENCH_ANALYZE") == "1":
+    t = time.perf_counter()
+    resp = client.post(
+        "/api/v1/symptom/analyze",
+        json={"symptoms": ["fever", "cough"], "description": "startup benchmark", "age": 30, "language": "en"},
+    )
+    out["first_analyze_ms"] = (time.perf_counter() - t) * 1000
+    out["analyze_status"] = resp.status_code
+print("STARTUP_BENCH " + json.dumps(out), flush=True)
+os._exit(0)
+"""
+
+
+def run_once(env: Dict[str, str], analyze: bool) -> Dict[str, Any]:
+    env = dict(env, STARTUP_BENCH_ANALYZE="1" if analyze else "0", STARTUP_BENCH_T0=repr(time.time()))
+    proc = subprocess.run(
+        [sys.executable, "-c", _CHILD], env=env, cwd=BACKEND_DIR, capture_output=True, text=True, timeout=120
+    )
+    for line in proc.stdout.splitlines():
+        if line.startswith("STARTUP_BENCH "):
+            return json.loads(line[len("STARTUP_BENCH "):])
+    raise RuntimeError(f"startup run failed (exit {proc.returncode}):\n{proc.stderr[-2000:]}")
+
+
+def summarize(samples: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    summary: Dict[str, Dict[str, float]] = {}
+    for phase in PHASES:
+        values = [s[phase] for s in samples if phase in s]
+        if values:
+            summary[phase] = {
+                "median": round(statistics.median(values), 2),
+                "min": round(min(values), 2),
+                "max": round(max(values), 2),
+            }
+    return summary
+
+
+def compare(current: Dict[str, Any], baseline_path: str, max_regression: float) -> bool:
+    """Print per-phase deltas; False if any phase regressed past ``max_regression`` percent."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    ok = True
+    print(f"\nCompared with {baseline_path} ({baseline.get('commit', '?')}):")
+    for phase, stats in current["phases"].items():
+        old = baseline.get("phases", {}).get(phase)
+        if not old:
+            continue
+        a, b = old["median"], stats["median"]
+        delta = (b - a) / a * 100 if a else 0.0
+        flag = ""
+        if max_regression > 0 and delta > max_regression:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"  {phase:<18} {a:>9.1f} -> {b:>9.1f} ms ({delta:+.1f}%){flag}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backend startup-time benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to start")
+    parser.add_argument("--no-analyze", action="store_true", help="skip the first /symptom/analyze")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to diff against")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.0,
+        help="with --compare, exit 1 if a phase median is this many percent slower",
+    )
+    parser.add_argument(
+        "--max-ready-ms", type=float, default=0.0, help="exit 1 if process_ready_ms median exceeds this"
+    )
+    args = parser.parse_args()
+
+    fake = FakeLLMServer(latency=0.0, tokens_per_sec=0).start()
+    env = dict(os.environ, STARTUP_BENCH_BACKEND=BACKEND_DIR)
+    for key in ("QWEN_REASONING_ENDPOINT", "LLAMA_EXPLAIN_ENDPOINT", "QWEN_VL_ENDPOINT"):
+        env[key] = fake.chat_url
+    env.setdefault("LOG_LEVEL", "WARNING")
+    env["RESPONSE_CACHE_ENABLED"] = "False"
+    env["FAST_PATH_ENABLED"] = "False"
+    env["MODEL_WARMUP"] = "False"
+
+    samples: List[Dict[str, Any]] = []
+    try:
+        # One untimed run so the page cache and .pyc files are warm for all the others
+        run_once(env, analyze=False)
+        for i in range(max(1, args.runs)):
+            sample = run_once(env, analyze=not args.no_analyze)
+            samples.append(sample)
+            print(
+                f"run {i + 1}: import {sample['import_ms']:.1f} ms  create_app {sample['create_app_ms']:.1f} ms  "
+                f"ready {sample['process_ready_ms']:.1f} ms"
+                + (f"  first analyze {sample['first_analyze_ms']:.1f} ms" if "first_analyze_ms" in sample else "")
+            )
+    finally:
+        fake.stop()
+
+    results = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {"runs": len(samples), "analyze": not args.no_analyze, "python": sys.version.split()[0]},
+        "phases": summarize(samples),
+        "samples": samples,
+    }
+    print("\nmedian:")
+    for phase, stats in results["phases"].items():
+        print(f"  {phase:<18} {stats['median']:>9.1f} ms  (min {stats['min']:.1f}, max {stats['max']:.1f})")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    failed = False
+    if args.compare and not compare(results, args.compare, args.max_regression):
+        failed = True
+    ready = results["phases"].get("process_ready_ms", {}).get("median", 0.0)
+    if args.max_ready_ms > 0 and ready > args.max_ready_ms:
+        print(f"process_ready_ms median {ready:.1f} ms exceeds budget {args.max_ready_ms:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""gunicorn settings for the AI Doctor backend.
+
+    cd ai-doctor/backend && gunicorn -c gunicorn.conf.py wsgi:app
+
+The app (model plan, orchestrator, rule indexes) is loaded once in the
+master and shared copy-on-write by forked workers. Worker count follows the
+machine: one process per core, capped by the model tier, because beyond
+that the bottleneck is the LLM server, not Python. Each worker gets an
+equal share of the tier's LLM concurrency so the workers together do not
+oversubscribe it. On SIGTERM a worker reports not-ready at once and stops
+starting new batch cases, then finishes its open requests and running jobs.
+Every setting can be overridden with GUNICORN_* env vars.
+"""
+
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+for path in (BACKEND_DIR, os.path.dirname(BACKEND_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Admin model switches must reach every worker, not only the one that served them
+os.environ.setdefault(
+    "MODEL_OVERRIDES_FILE", os.path.join(tempfile.gettempdir(), "aidoctor-model-overrides.json")
+)
+# Likewise jobs and emergency follow-ups, so a poll can land on any worker
+os.environ.setdefault("JOB_DB", os.path.join(tempfile.gettempdir(), "aidoctor-jobs.db"))
+
+# gunicorn reads every module-level name as a setting, so keep ours private
+from src.core.config import config as _config  # noqa: E402
+from src.core.scheduler import TIER_CONCURRENCY as _TIER_CONCURRENCY  # noqa: E402
+from src.system.capabilities import classify_machine as _classify_machine  # noqa: E402
+from src.system.capabilities import get_cpu_cores as _get_cpu_cores  # noqa: E402
+
+# Upper bound on worker processes per tier
+_TIER_MAX_WORKERS = {"LOW": 2, "MEDIUM": 4, "HIGH": 8}
+
+_tier = _classify_machine()
+_cores = _get_cpu_cores()
+
+
+def _workers() -> int:
+    explicit = int(os.getenv("GUNICORN_WORKERS", 0))
+    if explicit > 0:
+        return explicit
+    if _config.LLM_BACKEND == "llamacpp":
+        # In-process models: every extra worker would hold its own copy
+        return 1
+    return max(1, min(_cores, _TIER_MAX_WORKERS.get(_tier, 2)))
+
+
+bind = os.getenv("GUNICORN_BIND", f"{_config.API_HOST}:{_config.API_PORT}")
+workers = _workers()
+# Requests mostly wait on the LLM server, so threads keep a worker busy
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+preload_app = True
+# A request may legitimately wait for a full LLM read timeout plus queueing
+timeout = int(os.getenv("GUNICORN_TIMEOUT", _config.LLM_READ_TIMEOUT + _config.LLM_QUEUE_TIMEOUT + 30))
+# On SIGTERM open requests finish first, then worker_exit drains the job queue
+# for up to SHUTDOWN_TIMEOUT; the master must not kill the worker before both
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", timeout + _config.SHUTDOWN_TIMEOUT + 5))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 0))
+accesslog = os.getenv("GUNICORN_ACCESSLOG") or None
+loglevel = _config.LOG_LEVEL.lower()
+
+if _config.LLM_MAX_CONCURRENCY <= 0:
+    # Split the tier's LLM slots across processes (each has its own scheduler)
+    _config.LLM_MAX_CONCURRENCY = max(1, _TIER_CONCURRENCY.get(_tier, 1) // workers)
+
+
+def when_ready(server):
+    server.log.info(
+        "AI Doctor: tier %s, %d cores -> %d workers x %d threads, %d LLM slots per worker",
+        _tier,
+        _cores,
+        workers,
+        threads,
+        _config.LLM_MAX_CONCURRENCY,
+    )
+
+
+def post_fork(server, worker):
+    from app import start_background_services
+    from src.core import lifecycle
+
+    lifecycle.after_fork()
+    start_background_services()
+
+
+def post_worker_init(worker):
+    import signal
+
+    from src.core import lifecycle
+
+    handle_exit = worker.handle_exit
+
+    def drain_and_exit(sig, frame):
+        # Start draining as soon as SIGTERM lands, not once open requests have finished
+        lifecycle.begin_drain()
+        handle_exit(sig, frame)
+
+    worker.handle_exit = drain_and_exit
+    # The worker installed its handlers before this hook ran
+    signal.signal(signal.SIGTERM, drain_and_exit)
+
+
+def worker_exit(server, worker):
+    from src.core import lifecycle
+
+    lifecycle.shutdown()
@@ -1,148 +1,282 @@
 """Diagnosis orchestrator using local LLMs only."""
 
 from src.core.config import config
+from src.core.jobs import jobs
 from src.core.logger import logger
+from src.core.metrics import EMERGENCY_SHORTCIRCUITS, JSON_FALLBACKS, JSON_REPAIRS, STAGE_LATENCY
+from src.core.request_context import PRIORITY_EMERGENCY, record_stage, set_priority
 from src.core.runtime_config import get_model
-from .llm_client import LLMClient
-import json
-from typing import Any, Dict, List, Optional
-import base64
-import ollama
-import requests
+from src.core.scheduler import QueueFullError
+from src.core.singleflight import SingleFlight
+from .emergency import EmergencyDetector, emergency_explanation, emergency_structured
+from .image_cache import PerceptualCache, dhash
+from .image_pipeline import describe as describe_image, prepare_image, to_data_url
+from .llm_client import AsyncLLMClient, LLMClient, make_client
+from .response_cache import ResponseCache, make_key
+from .triage_rules import TriageIndex
+from .structured_output import (
+    DIAGNOSIS_SCHEMA,
+    EARLY_FIELDS,
+    IncrementalJSONParser,
+    parse_diagnosis,
+    response_format,
+)
+import asyncio
+import hashlib
 import json
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+# System prompts are module constants so every request sends a byte-identical
+# prefix; servers with prompt caching then skip re-processing it.
+IMAGE_SYSTEM_PROMPT = (
+    "You are a medical image specialist. The image may show rashes, wounds, swelling, or other skin findings.\n"
+    "Describe only what you see on the body (location, color, rash type, swelling, obvious infection signs).\n"
+    "Then summarize your assessment as STRICT JSON with keys:\n"
+    "  rash_type (string),\n"
+    "  location (string),\n"
+    '  severity ("mild"|"moderate"|"severe"),\n'
+    '  infection_risk ("low"|"medium"|"high"),\n'
+    "  doctor_note (string).\n"
+    "Return ONLY the JSON object, nothing else."
+)
+
+REASONING_SYSTEM_PROMPT = (
+    "You are a cautious medical doctor, not a chatbot. "
+    "You receive structured data (JSON) with symptoms, brief history, and optional image findings. "
+    "Your job is to think like a real clinician and produce a compact, structured assessment.\n\n"
+    "You MUST return your medical reasoning as a single JSON object and nothing else. "
+    "The JSON object MUST have exactly these keys, in this order:\n"
+    "  severity: 'low' | 'medium' | 'high' | 'emergency',\n"
+    "  care_level: 'self-care' | 'doctor-within-24h' | 'emergency-now',\n"
+    "  red_flags: [ string ],\n"
+    "  diagnoses: [ { name: string, probability: number (0-1), reasons: string } ],\n"
+    "  medications: [ string ] (simple over-the-counter or common classes ONLY, no dosages),\n"
+    "  doctor_note: string,\n"
+    "  disclaimer: string.\n\n"
+    "Rules:\n"
+    "- Return at most 3 diagnoses.\n"
+    "- Probabilities MUST be between 0 and 1, roughly summing to 1.\n"
+    "- Use short, clinical reasons (1–2 sentences max).\n"
+    "- If the case is clearly mild, suggest self-care and simple meds.\n"
+    "- If there is any risk of serious disease, set severity to 'high' or 'emergency' and care_level accordingly.\n"
+    "- DO NOT list exact dosages, ONLY medication names or classes.\n"
+    "- If image_analysis is present, factor it into your diagnoses and severity.\n"
+    "- You are allowed to sound like a real doctor, but you MUST include a disclaimer."
+)
+
+REPAIR_SYSTEM_PROMPT = (
+    "You fix malformed JSON. Rewrite the user's text as ONE JSON object matching this schema, "
+    "keeping its medical content and inventing nothing. Return only the JSON.\n"
+    + json.dumps(DIAGNOSIS_SCHEMA, sort_keys=True)
+)
+
+EXPLAIN_SYSTEM_PROMPT = (
+    "You are a friendly medical assistant. "
+    "Given structured JSON about likely diagnoses, severity, and care_level, "
+    "explain in simple language suitable for a non-expert. "
+    "Keep it short (3-6 sentences), mention uncertainty, and ALWAYS tell them to see a real doctor. "
+    "Do NOT list drugs or dosages. If language != 'en', translate the explanation."
+)
 
 
 class DiagnosisOrchestrator:
     def __init__(self) -> None:
-        self.reasoner = LLMClient(
+        self.reasoner = make_client(
             endpoint=config.QWEN_REASONING_ENDPOINT,
             model=get_model("REASONING_MODEL"),
         )
 
-        self.explainer = LLMClient(
+        self.explainer = make_client(
             endpoint=config.LLAMA_EXPLAIN_ENDPOINT,
             model=get_model("EXPLAIN_MODEL"),
         )
 
-        self.vision = LLMClient(
+        self.vision = make_client(
             endpoint=config.QWEN_VL_ENDPOINT,
             model=get_model("VISION_MODEL"),
+            local_ok=False,
         )
 
-    def analyze_image_with_ollama(image_bytes: bytes) -> dict:
-        """Use a vision model via Ollama's OpenAI-compatible HTTP API to analyze a medical image."""
-        # Adjust model name to a real vision model you have, e.g. "qwen3-vl"
-        model_name = "qwen3-vl"
-
-        system_prompt = (
-            "You are a medical image specialist. The image may show rashes, wounds, swelling, or other skin findings.\n"
-            "Describe only what you see on the body (location, color, rash type, swelling, obvious infection signs).\n"
-            "Then summarize your assessment as STRICT JSON with keys:\n"
-            "  rash_type (string),\n"
-            "  location (string),\n"
-            '  severity ("mild"|"moderate"|"severe"),\n'
-            '  infection_risk ("low"|"medium"|"high"),\n'
-            "  doctor_note (string).\n"
-            "Return ONLY the JSON object, nothing else."
-        )
-
-        # This assumes Ollama exposes an OpenAI-compatible /v1/chat/completions endpoint with image support
-        url = "http://localhost:11434/v1/chat/completions"
-
-        files = {
-            # many implementations expect image as a separate file; adjust key name if needed
-            "file": ("image.png", image_bytes, "image/png"),
-        }
-
-        data = {
-            "model": model_name,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": "Analyze this medical image."},
-            ],
-        }
-
-        try:
-            resp = requests.post(url, json=data, timeout=60)
-            resp.raise_for_status()
-            result = resp.json()
-            text = result["choices"][0]["message"]["content"].strip()
-        except Exception as e:
-            return {
-                "rash_type": "unknown",
-                "location": "unknown",
-                "severity": "unknown",
-                "infection_risk": "unknown",
-                "doctor_note": f"Vision model error: {e}",
-            }
-
-        # Extract JSON object from the text
-        first = text.find("{")
-        last = text.rfind("}")
-        if first == -1 or last == -1 or last <= first:
-            return {
-                "rash_type": "unknown",
-                "location": "unknown",
-                "severity": "unknown",
-                "infection_risk": "unknown",
-                "doctor_note": text,
-            }
-
-        json_str = text[first : last + 1]
-        try:
-            parsed = json.loads(json_str)
-            return {
-                "rash_type": parsed.get("rash_type", "unknown"),
-                "location": parsed.get("location", "unknown"),
-                "severity": parsed.get("severity", "unknown"),
-                "infection_risk": parsed.get("infection_risk", "unknown"),
-                "doctor_note": parsed.get("doctor_note", text),
-            }
-        except Exception:
-            return {
-                "rash_type": "unknown",
-                "location": "unknown",
-                "severity": "unknown",
-                "infection_risk": "unknown",
-                "doctor_note": text,
-            }
-
-    def _analyze_image(self, image_description: str | None) -> Optional[Dict[str, Any]]:
-        """Use Qwen2.5-VL (or similar) to analyze skin/wound images.
-
-        In practice you will probably send base64 or a URL + text.
-        Here we assume you already converted the image to a short description or URL.
+        self.async_explainer = AsyncLLMClient(self.explainer)
+
+        self._inflight = SingleFlight()
+
+        self.cache: Optional[ResponseCache] = None
+        if config.RESPONSE_CACHE_ENABLED:
+            self.cache = ResponseCache(
+                max_entries=config.RESPONSE_CACHE_MAX_ENTRIES,
+                ttl_seconds=config.RESPONSE_CACHE_TTL,
+                db_path=config.RESPONSE_CACHE_DB or None,
+                disk_max_entries=config.RESPONSE_CACHE_DISK_MAX_ENTRIES,
+            )
+
+        self.image_cache: Optional[PerceptualCache] = None
+        if config.IMAGE_CACHE_ENABLED:
+            self.image_cache = PerceptualCache(
+                max_entries=config.IMAGE_CACHE_MAX_ENTRIES,
+                max_distance=config.IMAGE_CACHE_MAX_DISTANCE,
+            )
+
+        self.emergency: Optional[EmergencyDetector] = None
+        if config.EMERGENCY_SHORTCIRCUIT:
+            self.emergency = EmergencyDetector()
+
+        # Compiled once here; assess() is a few integer ops per request
+        self.triage: Optional[TriageIndex] = None
+        if config.FAST_PATH_ENABLED:
+            self.triage = TriageIndex(
+                min_confidence=config.FAST_PATH_MIN_CONFIDENCE,
+                min_evidence=config.FAST_PATH_MIN_EVIDENCE,
+                max_free_text=config.FAST_PATH_MAX_FREE_TEXT,
+            )
+
+    def after_fork(self) -> None:
+        """Reopen cache connections in a forked worker."""
+        if self.cache is not None:
+            self.cache.reopen()
+
+    def apply_models(self) -> None:
+        """Point the clients at the current runtime_config models.
+
+        Cached responses from a replaced model are dropped, and in-process
+        weights are released once no role uses them.
         """
-        if not config.USE_VL_IMAGES or not image_description:
+        clients = (
+            (self.reasoner, "REASONING_MODEL"),
+            (self.explainer, "EXPLAIN_MODEL"),
+            (self.vision, "VISION_MODEL"),
+        )
+        replaced = []
+        for client, key in clients:
+            model = get_model(key)
+            if model == client.model:
+                continue
+            logger.info("Switching %s from %s to %s", key, client.model, model)
+            if self.cache is not None and client.model:
+                self.cache.invalidate_model(client.model)
+            if self.image_cache is not None and client is self.vision and client.model:
+                self.image_cache.invalidate_model(client.model)
+            replaced.append((client, client.model))
+            client.model = model
+
+        in_use = {client.model for client, _ in clients}
+        for client, old in replaced:
+            if old and old not in in_use and hasattr(client, "release"):
+                client.release(old)
+
+    @staticmethod
+    def _prompt_extra() -> Optional[Dict[str, Any]]:
+        """Request fields asking the server to reuse the cached prompt prefix."""
+        if not config.PROMPT_CACHE:
             return None
+        extra: Dict[str, Any] = {"cache_prompt": True}
+        if config.MODEL_KEEP_ALIVE:
+            extra["keep_alive"] = config.MODEL_KEEP_ALIVE
+        return extra
 
-        system_prompt = (
-            "You are a medical vision assistant. "
-            "Given a description or reference to a skin or wound image plus some text, "
-            "you return a small JSON object describing rash_type, severity, infection_risk. "
-            "Use keys: rash_type, severity, infection_risk, and keep values short."
+    def _cached_chat(
+        self,
+        client: LLMClient,
+        messages: List[Dict[str, str]],
+        payload: Any,
+        language: str = "",
+        extra: Optional[Dict[str, Any]] = None,
+    ) -> Optional[str]:
+        """``client.chat`` behind the response cache, keyed on model + prompt + payload."""
+        extra = extra if extra is not None else self._prompt_extra()
+        if self.cache is None:
+            return client.chat(messages, extra)
+
+        key = make_key(client.model, messages[0]["content"], payload, language)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        text = client.chat(messages, extra)
+        if text:
+            self.cache.set(key, text, model=client.model)
+        return text
+
+    def analyze_image(self, image_bytes: bytes) -> Dict[str, Any]:
+        """Send an uploaded medical image to the vision model (VISION_MODEL).
+
+        The image is downscaled and re-encoded in memory, then submitted as a
+        base64 ``image_url`` part through the shared LLM client. Raises
+        ``ImageDecodeError`` if the upload is not a readable image.
+        """
+        start = time.perf_counter()
+        img, encoded, mime = prepare_image(image_bytes)
+        info = describe_image(len(image_bytes), img, encoded, mime)
+        logger.info(
+            "Vision input %dx%d, %d -> %d bytes",
+            info["width"],
+            info["height"],
+            info["original_bytes"],
+            info["sent_bytes"],
         )
 
+        if not config.USE_VL_IMAGES or not self.vision.model:
+            return self._image_fallback("Vision model is not enabled on this machine.")
+
+        image_hash = None
+        if self.image_cache is not None:
+            image_hash = dhash(img)
+            cached = self.image_cache.get(image_hash, self.vision.model)
+            if cached is not None:
+                return cached
+
         messages = [
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": IMAGE_SYSTEM_PROMPT},
             {
                 "role": "user",
-                "content": f"Image info: {image_description}",
+                "content": [
+                    {"type": "text", "text": "Analyze this medical image."},
+                    {"type": "image_url", "image_url": {"url": to_data_url(encoded, mime)}},
+                ],
             },
         ]
 
-        text = self.vision.chat(messages)
+        text = self.vision.chat(messages, self._prompt_extra())
+        STAGE_LATENCY.observe(time.perf_counter() - start, stage="vision", model=self.vision.model)
         if not text:
-            return None
+            return self._image_fallback("Vision model error: no response from model.")
+        text = text.strip()
+
+        # Extract JSON object from the text
+        first = text.find("{")
+        last = text.rfind("}")
+        if first == -1 or last == -1 or last <= first:
+            return self._image_fallback(text)
 
         try:
-            cleaned = text.strip().strip("`")
-            if cleaned.lower().startswith("json"):
-                cleaned = cleaned[4:].strip()
-            return json.loads(cleaned)
+            parsed = json.loads(text[first : last + 1])
         except Exception:
-            logger.warning("Failed to parse vision JSON: %s", text[:200])
-            return None
+            return self._image_fallback(text)
+
+        assessment = {
+            "rash_type": parsed.get("rash_type", "unknown"),
+            "location": parsed.get("location", "unknown"),
+            "severity": parsed.get("severity", "unknown"),
+            "infection_risk": parsed.get("infection_risk", "unknown"),
+            "doctor_note": parsed.get("doctor_note", text),
+        }
+        # Only parsed assessments are cached; errors and raw text are retried
+        if image_hash is not None:
+            self.image_cache.set(image_hash, self.vision.model, assessment)
+        return assessment
+
+    @staticmethod
+    def _image_fallback(note: str) -> Dict[str, Any]:
+        return {
+            "rash_type": "unknown",
+            "location": "unknown",
+            "severity": "unknown",
+            "infection_risk": "unknown",
+            "doctor_note": note,
+        }
 
     def _reason_with_llm(
         self,
@@ -155,79 +289,93 @@ class DiagnosisOrchestrator:
         if not config.USE_LLM_REASONING:
             return None
 
-        payload = {
+        payload = self._reason_payload(symptoms, free_text, context, image_info)
+        messages = self._reason_messages(payload)
+
+        model = self.reasoner.model
+        key = None
+        if self.cache is not None:
+            key = make_key(model, messages[0]["content"], payload, "")
+            cached = self.cache.get(key)
+            if cached is not None:
+                structured = self._parse_reasoning(cached)
+                structured.pop("_repaired", None)
+                return structured
+
+        text = self.reasoner.chat(messages, self._reason_extra())
+        if not text:
+            return None
+
+        structured = self._parse_reasoning(text)
+        repaired = structured.pop("_repaired", False)
+        # Only cache output that validated; the repaired object is cached so later hits do not repair again
+        if key is not None and "raw_text" not in structured:
+            self.cache.set(key, json.dumps(structured, ensure_ascii=False) if repaired else text, model=model)
+        return structured
+
+    @staticmethod
+    def _reason_payload(
+        symptoms: List[str],
+        free_text: str | None,
+        context: Dict[str, Any],
+        image_info: Optional[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        return {
             "symptoms": symptoms,
             "free_text": free_text or "",
             "patient_context": context,
             "image_analysis": image_info,  # may be None
         }
 
-        system_prompt = (
-            "You are a cautious medical doctor, not a chatbot. "
-            "You receive structured data (JSON) with symptoms, brief history, and optional image findings. "
-            "Your job is to think like a real clinician and produce a compact, structured assessment.\n\n"
-            "You MUST return your medical reasoning inside a single ```json code block. "
-            "The JSON object MUST have exactly these keys:\n"
-            "  diagnoses: [ { name: string, probability: number (0-1), reasons: string } ],\n"
-            "  severity: 'low' | 'medium' | 'high' | 'emergency',\n"
-            "  care_level: 'self-care' | 'doctor-within-24h' | 'emergency-now',\n"
-            "  medications: [ string ] (simple over-the-counter or common classes ONLY, no dosages),\n"
-            "  red_flags: [ string ],\n"
-            "  doctor_note: string,\n"
-            "  disclaimer: string.\n\n"
-            "Rules:\n"
-            "- Return at most 3 diagnoses.\n"
-            "- Probabilities MUST be between 0 and 1, roughly summing to 1.\n"
-            "- Use short, clinical reasons (1–2 sentences max).\n"
-            "- If the case is clearly mild, suggest self-care and simple meds.\n"
-            "- If there is any risk of serious disease, set severity to 'high' or 'emergency' and care_level accordingly.\n"
-            "- DO NOT list exact dosages, ONLY medication names or classes.\n"
-            "- If image_analysis is present, factor it into your diagnoses and severity.\n"
-            "- You are allowed to sound like a real doctor, but you MUST include a disclaimer."
-        )
-
-        messages = [
-            {"role": "system", "content": system_prompt},
+    @staticmethod
+    def _reason_messages(payload: Dict[str, Any]) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": REASONING_SYSTEM_PROMPT},
             {
                 "role": "user",
-                "content": f"INPUT_JSON:\n{json.dumps(payload, ensure_ascii=False)}",
+                "content": f"INPUT_JSON:\n{json.dumps(payload, ensure_ascii=False, sort_keys=True)}",
             },
         ]
 
-        text = self.reasoner.chat(messages)
-        if not text:
-            return None
-
-        text = text.strip()
-
-        # 1) Try to extract a ```json block if present
-        json_block = None
-        if "```json" in text:
-            try:
-                start = text.index("```json") + len("```json")
-                end = text.index("```", start)
-                json_block = text[start:end].strip()
-            except ValueError:
-                json_block = None
-
-        # 2) If we found a JSON block and can parse it, RETURN IT and do NOT fall back
-        if json_block:
-            try:
-                parsed = json.loads(json_block)
-                return parsed
-            except Exception:
-                logger.warning(
-                    "Failed to parse JSON block from LLM: %s", json_block[:300]
-                )
+    def _reason_extra(self) -> Dict[str, Any]:
+        extra = dict(self._prompt_extra() or {})
+        if config.STRUCTURED_OUTPUT:
+            extra["response_format"] = response_format()
+        return extra
 
-        # 3) If whole text looks like JSON, try that
-        if text.startswith("{") and text.endswith("}"):
-            try:
-                return json.loads(text)
-            except Exception:
-                logger.warning("Failed to parse full-text JSON from LLM")
+    def _parse_reasoning(self, text: str) -> Dict[str, Any]:
+        """Validate reasoning output; repair locally, then with a short bounded call.
 
-        # 4) Fallback: wrap raw text
+        A dict with ``_repaired`` set means an extra model call was spent and
+        the result is worth caching in its fixed form.
+        """
+        model = self.reasoner.model
+        structured, how = parse_diagnosis(text)
+        if structured is not None:
+            if how != "ok":
+                JSON_REPAIRS.inc(model=model, kind=how)
+            return structured
+
+        broken = text.strip()
+        for _ in range(max(config.REASONING_REPAIR_ATTEMPTS, 0)):
+            extra = dict(self._reason_extra() or {})
+            extra.update({"temperature": 0, "max_tokens": config.REASONING_REPAIR_MAX_TOKENS})
+            fixed = self.reasoner.chat(
+                [
+                    {"role": "system", "content": REPAIR_SYSTEM_PROMPT},
+                    # The tail is usually what is broken; keep the request short
+                    {"role": "user", "content": broken[-4000:]},
+                ],
+                extra,
+            )
+            structured, _ = parse_diagnosis(fixed or "")
+            if structured is not None:
+                JSON_REPAIRS.inc(model=model, kind="llm")
+                structured["_repaired"] = True
+                return structured
+
+        logger.warning("Reasoning output failed validation and repair: %s", broken[:300])
+        JSON_FALLBACKS.inc(model=model)
         return {
             "diagnoses": [],
             "severity": "unknown",
@@ -236,9 +384,69 @@ class DiagnosisOrchestrator:
             "red_flags": [],
             "doctor_note": "Model did not return structured JSON.",
             "disclaimer": "This explanation was generated by an AI model and may not be accurate. Always consult a qualified doctor.",
-            "raw_text": text,
+            "raw_text": broken,
         }
 
+    def _stream_reason(
+        self,
+        symptoms: List[str],
+        free_text: str | None,
+        context: Dict[str, Any],
+        image_info: Optional[Dict[str, Any]],
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Streaming reasoning; yields ``field`` events, returns the structured dict.
+
+        Triage fields (``EARLY_FIELDS``) are yielded as soon as the model has
+        closed them, before the rest of the assessment is generated.
+        """
+        if not config.USE_LLM_REASONING:
+            return self._reason_fallback()
+
+        payload = self._reason_payload(symptoms, free_text, context, image_info)
+        messages = self._reason_messages(payload)
+        key = None
+        if self.cache is not None:
+            key = make_key(self.reasoner.model, messages[0]["content"], payload, "")
+            cached = self.cache.get(key)
+            if cached is not None:
+                structured = self._parse_reasoning(cached)
+                structured.pop("_repaired", None)
+                for field in EARLY_FIELDS:
+                    if field in structured:
+                        yield "field", {"key": field, "value": structured[field]}
+                return structured
+
+        parser = IncrementalJSONParser()
+        for delta in self.reasoner.stream_chat(messages, self._reason_extra()):
+            for field, value in parser.feed(delta):
+                if field in EARLY_FIELDS:
+                    yield "field", {"key": field, "value": value}
+
+        if not parser.text:
+            return self._reason_fallback()
+
+        structured = self._parse_reasoning(parser.text)
+        repaired = structured.pop("_repaired", False)
+        if key is not None and "raw_text" not in structured:
+            text = json.dumps(structured, ensure_ascii=False) if repaired else parser.text
+            self.cache.set(key, text, model=self.reasoner.model)
+        return structured
+
+    def _explain_messages(
+        self, structured: Dict[str, Any], language: str
+    ) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": EXPLAIN_SYSTEM_PROMPT},
+            {
+                "role": "user",
+                # Language goes last so translations of one result share the longest prefix
+                "content": (
+                    f"STRUCTURED_JSON:\n{json.dumps(structured, ensure_ascii=False, sort_keys=True)}"
+                    f"\nlanguage={language}"
+                ),
+            },
+        ]
+
     def _explain_with_llm(
         self, structured: Dict[str, Any], language: str = "en"
     ) -> Optional[str]:
@@ -246,24 +454,13 @@ class DiagnosisOrchestrator:
         if not config.USE_LLM_EXPLANATION:
             return None
 
-        system_prompt = (
-            "You are a friendly medical assistant. "
-            "Given structured JSON about likely diagnoses, severity, and care_level, "
-            "explain in simple language suitable for a non-expert. "
-            "Keep it short (3-6 sentences), mention uncertainty, and ALWAYS tell them to see a real doctor. "
-            "Do NOT list drugs or dosages. If language != 'en', translate the explanation."
+        return self._cached_chat(
+            self.explainer,
+            self._explain_messages(structured, language),
+            structured,
+            language,
         )
 
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {
-                "role": "user",
-                "content": f"language={language}\nSTRUCTURED_JSON:\n{json.dumps(structured, ensure_ascii=False)}",
-            },
-        ]
-
-        return self.explainer.chat(messages)
-
     def analyze(
         self,
         symptoms: List[str],
@@ -272,40 +469,77 @@ class DiagnosisOrchestrator:
         language: str = "en",
         image_description: str | None = None,
     ) -> Dict[str, Any]:
-        symptoms = [s.strip().lower() for s in symptoms if s and isinstance(s, str)]
+        """Run the staged pipeline: normalize -> image_context -> triage -> reason -> explain.
 
-        image_info = None
-        if image_description:
-            image_info = {
-                "description": image_description,
-            }
+        Emergency red flags short-circuit the pipeline: an ``emergency-now``
+        result is returned straight away and the full analysis runs in the
+        background as a job (``followup_id``, see ``src.core.jobs``). When the rule-based
+        triage stage is confident, reasoning (and, for English, explanation)
+        is answered without an LLM call.
 
-        # later when calling LLM reasoning:
-        reasoning = self._reason_with_llm(
-            symptoms=symptoms,
-            free_text=free_text,
-            context=context,
-            image_info=image_info,
+        Each stage runs exactly once per request. Identical requests that
+        arrive while one is already running share its result.
+        """
+        timings: Dict[str, float] = {}
+
+        request = self._run_stage(
+            "normalize",
+            timings,
+            self._stage_normalize,
+            symptoms,
+            free_text,
+            context,
+            language,
+            image_description,
         )
-        structured = self._reason_with_llm(symptoms, free_text, context, image_info)
 
-        if not structured:
-            structured = {
-                "diagnoses": [],
-                "severity": "unknown",
-                "care_level": "doctor-within-24h",
-                "red_flags": [],
-                "disclaimers": [
-                    "This system could not confidently analyze your symptoms.",
-                    "Please consult a qualified doctor for proper diagnosis.",
-                ],
-            }
+        matches = self._run_stage("emergency", timings, self._stage_emergency, request)
+        if matches:
+            return self._emergency_result(request, matches, timings, [request["language"]])
+
+        key = self._request_key(request)
+        result, shared = self._inflight.do(
+            key, lambda: self._run_pipeline(request, timings)
+        )
+        if shared:
+            logger.info("Shared in-flight diagnosis result (key=%s)", key[:12])
+            result = dict(result)
+        return result
+
+    def _run_pipeline(
+        self, request: Dict[str, Any], timings: Dict[str, float], fast_path: bool = True
+    ) -> Dict[str, Any]:
+        image_info = self._run_stage(
+            "image_context", timings, self._stage_image_context, request["image_description"]
+        )
+
+        fast = None
+        if fast_path:
+            fast = self._run_stage("triage", timings, self._stage_triage, request, image_info)
+        if fast:
+            structured = fast["structured"]
+        else:
+            structured = self._run_stage(
+                "reason",
+                timings,
+                self._stage_reason,
+                request["symptoms"],
+                request["free_text"],
+                request["context"],
+                image_info,
+            )
+
+        if fast and request["language"] == "en":
+            explanation = fast["explanation"]
+        else:
+            explanation = self._run_stage(
+                "explain", timings, self._explain_with_llm, structured, request["language"]
+            )
 
-        explanation = self._explain_with_llm(structured, language)
         result: Dict[str, Any] = {
             "status": "success",
             "structured": structured,
-            "language": language,
+            "language": request["language"],
         }
 
         if image_info:
@@ -314,4 +548,412 @@ class DiagnosisOrchestrator:
         if explanation:
             result["explanation"] = explanation
 
+        result["timings_ms"] = dict(timings)
+        logger.info(
+            "Diagnosis pipeline timings (ms): %s",
+            ", ".join(f"{k}={v}" for k, v in timings.items()),
+            extra={"stages": dict(timings)},
+        )
+        return result
+
+    def analyze_stream(
+        self,
+        symptoms: List[str],
+        free_text: str | None,
+        context: Dict[str, Any],
+        language: str = "en",
+        image_description: str | None = None,
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Streaming variant of ``analyze``.
+
+        Yields ``(event, data)`` pairs: ``emergency`` first if red flags are
+        found (the stream then carries on with the full analysis), ``field``
+        for each triage field (severity, care_level, red_flags) as soon as the
+        model closes it, ``reasoning`` once the structured assessment is
+        ready, ``token`` for each explanation delta, then ``done`` with the
+        same shape ``analyze`` returns.
+        """
+        timings: Dict[str, float] = {}
+
+        request = self._run_stage(
+            "normalize",
+            timings,
+            self._stage_normalize,
+            symptoms,
+            free_text,
+            context,
+            language,
+            image_description,
+        )
+        matches = self._run_stage("emergency", timings, self._stage_emergency, request)
+        if matches:
+            self._count_emergency(matches)
+            set_priority(PRIORITY_EMERGENCY)
+            yield "emergency", {
+                "structured": emergency_structured(matches, config.EMERGENCY_NUMBER),
+                "explanation": emergency_explanation(request["language"], config.EMERGENCY_NUMBER),
+            }
+
+        image_info = self._run_stage(
+            "image_context", timings, self._stage_image_context, request["image_description"]
+        )
+        fast = None
+        if not matches:
+            fast = self._run_stage("triage", timings, self._stage_triage, request, image_info)
+        if fast:
+            structured = fast["structured"]
+            for field in EARLY_FIELDS:
+                yield "field", {"key": field, "value": structured[field]}
+        else:
+            start = time.perf_counter()
+            structured = yield from self._stream_reason(
+                request["symptoms"],
+                request["free_text"],
+                request["context"],
+                image_info,
+            )
+            self._record_stage("reason", timings, start)
+        if matches:
+            structured = self._enforce_emergency(structured, matches)
+        yield "reasoning", {"structured": structured, "image_analysis": image_info}
+
+        parts: List[str] = []
+        if fast and request["language"] == "en":
+            parts.append(fast["explanation"])
+            yield "token", {"text": fast["explanation"]}
+        elif config.USE_LLM_EXPLANATION:
+            start = time.perf_counter()
+            messages = self._explain_messages(structured, request["language"])
+            key = None
+            cached = None
+            if self.cache is not None:
+                key = make_key(
+                    self.explainer.model,
+                    messages[0]["content"],
+                    structured,
+                    request["language"],
+                )
+                cached = self.cache.get(key)
+
+            if cached is not None:
+                parts.append(cached)
+                yield "token", {"text": cached}
+            else:
+                for delta in self.explainer.stream_chat(messages, self._prompt_extra()):
+                    parts.append(delta)
+                    yield "token", {"text": delta}
+                if key is not None and parts:
+                    self.cache.set(key, "".join(parts), model=self.explainer.model)
+            self._record_stage("explain", timings, start)
+
+        result: Dict[str, Any] = {
+            "status": "success",
+            "structured": structured,
+            "language": request["language"],
+        }
+        if image_info:
+            result["image_analysis"] = image_info
+        if parts:
+            result["explanation"] = "".join(parts)
+        result["timings_ms"] = dict(timings)
+        yield "done", result
+
+    async def analyze_async(
+        self,
+        symptoms: List[str],
+        free_text: str | None,
+        context: Dict[str, Any],
+        languages: List[str],
+        image_description: str | None = None,
+    ) -> Dict[str, Any]:
+        """Like ``analyze`` but explains in several languages concurrently.
+
+        Reasoning runs once; the explanations fan out against the explain
+        endpoint together, so latency is bounded by the slowest language.
+        Returns ``explanations`` keyed by language.
+        """
+        languages = list(dict.fromkeys(l for l in languages if l)) or ["en"]
+        timings: Dict[str, float] = {}
+
+        request = self._run_stage(
+            "normalize",
+            timings,
+            self._stage_normalize,
+            symptoms,
+            free_text,
+            context,
+            languages[0],
+            image_description,
+        )
+        matches = self._run_stage("emergency", timings, self._stage_emergency, request)
+        if matches:
+            return self._emergency_result(request, matches, timings, languages)
+
+        image_info = self._run_stage(
+            "image_context", timings, self._stage_image_context, request["image_description"]
+        )
+
+        fast = self._run_stage("triage", timings, self._stage_triage, request, image_info)
+        if fast:
+            structured = fast["structured"]
+        else:
+            start = time.perf_counter()
+            structured = await asyncio.to_thread(
+                self._stage_reason,
+                request["symptoms"],
+                request["free_text"],
+                request["context"],
+                image_info,
+            )
+            self._record_stage("reason", timings, start)
+
+        start = time.perf_counter()
+        texts = await asyncio.gather(
+            *(
+                self._fast_text(fast["explanation"])
+                if fast and language == "en"
+                else self._explain_async(structured, language)
+                for language in languages
+            )
+        )
+        self._record_stage("explain", timings, start)
+
+        explanations = {
+            language: text for language, text in zip(languages, texts) if text
+        }
+
+        result: Dict[str, Any] = {
+            "status": "success",
+            "structured": structured,
+            "language": languages[0],
+            "languages": languages,
+        }
+        if image_info:
+            result["image_analysis"] = image_info
+        if explanations:
+            result["explanations"] = explanations
+            if languages[0] in explanations:
+                result["explanation"] = explanations[languages[0]]
+        result["timings_ms"] = dict(timings)
+        return result
+
+    @staticmethod
+    async def _fast_text(text: str) -> str:
+        return text
+
+    async def _explain_async(
+        self, structured: Dict[str, Any], language: str
+    ) -> Optional[str]:
+        if not config.USE_LLM_EXPLANATION:
+            return None
+
+        messages = self._explain_messages(structured, language)
+        key = None
+        if self.cache is not None:
+            key = make_key(self.explainer.model, messages[0]["content"], structured, language)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        text = await self.async_explainer.chat(messages, self._prompt_extra())
+        if text and key is not None:
+            self.cache.set(key, text, model=self.explainer.model)
+        return text
+
+    # ---- pipeline stages ----
+
+    def _run_stage(self, name: str, timings: Dict[str, float], fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self._record_stage(name, timings, start)
+
+    def _record_stage(self, name: str, timings: Dict[str, float], start: float) -> None:
+        elapsed = time.perf_counter() - start
+        timings[name] = round(elapsed * 1000, 2)
+        record_stage(name, timings[name])
+        STAGE_LATENCY.observe(elapsed, stage=name, model=self._stage_model(name))
+
+    def _stage_model(self, name: str) -> str:
+        client = {"reason": self.reasoner, "explain": self.explainer}.get(name)
+        return client.model if client else ""
+
+    @staticmethod
+    def _stage_normalize(
+        symptoms: List[str],
+        free_text: str | None,
+        context: Dict[str, Any],
+        language: str,
+        image_description: str | None,
+    ) -> Dict[str, Any]:
+        return {
+            # Sorted and de-duplicated so equivalent requests share cache keys
+            "symptoms": sorted(
+                {s.strip().lower() for s in symptoms if s and isinstance(s, str)}
+            ),
+            "free_text": free_text,
+            "context": context,
+            "language": language or "en",
+            "image_description": image_description,
+        }
+
+    @staticmethod
+    def _stage_image_context(image_description: str | None) -> Optional[Dict[str, Any]]:
+        # No model call here; image inference is timed as "vision" in analyze_image
+        if not image_description:
+            return None
+        return {"description": image_description}
+
+    def _stage_reason(
+        self,
+        symptoms: List[str],
+        free_text: str | None,
+        context: Dict[str, Any],
+        image_info: Optional[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        structured = self._reason_with_llm(symptoms, free_text, context, image_info)
+        if structured:
+            return structured
+        return self._reason_fallback()
+
+    def _stage_emergency(self, request: Dict[str, Any]) -> List[Dict[str, str]]:
+        if self.emergency is None:
+            return []
+        return self.emergency.detect(
+            list(request["symptoms"]) + [request["free_text"], request["image_description"]]
+        )
+
+    @staticmethod
+    def _count_emergency(matches: List[Dict[str, str]]) -> None:
+        for category in {m["category"] for m in matches}:
+            EMERGENCY_SHORTCIRCUITS.inc(category=category)
+
+    def _emergency_result(
+        self,
+        request: Dict[str, Any],
+        matches: List[Dict[str, str]],
+        timings: Dict[str, float],
+        languages: List[str],
+    ) -> Dict[str, Any]:
+        """Immediate ``emergency-now`` answer; the LLM analysis follows in the background."""
+        self._count_emergency(matches)
+        explanations = {
+            language: emergency_explanation(language, config.EMERGENCY_NUMBER)
+            for language in languages
+        }
+        result: Dict[str, Any] = {
+            "status": "success",
+            "emergency": True,
+            "structured": emergency_structured(matches, config.EMERGENCY_NUMBER),
+            "language": languages[0],
+            "explanation": explanations[languages[0]],
+        }
+        if len(languages) > 1:
+            result["languages"] = languages
+            result["explanations"] = explanations
+        if config.EMERGENCY_FOLLOWUP and config.USE_LLM_REASONING:
+            followup_id = self._start_followup(request, matches)
+            if followup_id:
+                result["followup_id"] = followup_id
+
+        result["timings_ms"] = dict(timings)
+        elapsed = sum(timings.values())
+        if elapsed > config.EMERGENCY_LATENCY_BUDGET_MS:
+            logger.warning(
+                "Emergency short-circuit took %.1f ms (budget %.0f ms)",
+                elapsed,
+                config.EMERGENCY_LATENCY_BUDGET_MS,
+            )
+        logger.info(
+            "Emergency short-circuit (%s) in %.2f ms",
+            ", ".join(m["phrase"] for m in matches),
+            elapsed,
+        )
+        return result
+
+    @staticmethod
+    def _enforce_emergency(
+        structured: Dict[str, Any], matches: List[Dict[str, str]]
+    ) -> Dict[str, Any]:
+        """The LLM may refine the assessment but never downgrade an emergency."""
+        structured = dict(structured)
+        structured["severity"] = "emergency"
+        structured["care_level"] = "emergency-now"
+        flags = list(structured.get("red_flags") or [])
+        structured["red_flags"] = flags + [m["phrase"] for m in matches if m["phrase"] not in flags]
+        return structured
+
+    def _start_followup(self, request: Dict[str, Any], matches: List[Dict[str, str]]) -> Optional[str]:
+        """Queue the full analysis as a background job; its id is the followup_id."""
+        try:
+            job = jobs.submit(
+                self._followup,
+                request,
+                matches,
+                kind="emergency-followup",
+                priority=PRIORITY_EMERGENCY,
+            )
+        except QueueFullError as e:
+            # The emergency answer stands on its own; only the follow-up is lost
+            logger.warning("Emergency follow-up not queued: %s", e)
+            return None
+        return job["job_id"]
+
+    def _followup(self, request: Dict[str, Any], matches: List[Dict[str, str]]) -> Dict[str, Any]:
+        set_priority(PRIORITY_EMERGENCY)
+        result = self._run_pipeline(request, {}, fast_path=False)
+        result["structured"] = self._enforce_emergency(result["structured"], matches)
+        result["emergency"] = True
         return result
+
+    def _stage_triage(
+        self, request: Dict[str, Any], image_info: Optional[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        if self.triage is None:
+            return None
+        return self.triage.assess(
+            request["symptoms"], request["free_text"], request["context"] or {}, image_info
+        )
+
+    @staticmethod
+    def _reason_fallback() -> Dict[str, Any]:
+        return {
+            "diagnoses": [],
+            "severity": "unknown",
+            "care_level": "doctor-within-24h",
+            "red_flags": [],
+            "disclaimers": [
+                "This system could not confidently analyze your symptoms.",
+                "Please consult a qualified doctor for proper diagnosis.",
+            ],
+        }
+
+    @staticmethod
+    def _request_key(request: Dict[str, Any]) -> str:
+        canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+_instance: Optional[DiagnosisOrchestrator] = None
+_instance_lock = threading.Lock()
+
+
+def get_orchestrator() -> DiagnosisOrchestrator:
+    """The process-wide orchestrator, built on first use rather than at import."""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = DiagnosisOrchestrator()
+    return _instance
+
+
+def peek_orchestrator() -> Optional[DiagnosisOrchestrator]:
+    """The orchestrator if it has been built (e.g. for metrics), without building it."""
+    return _instance
+
+
+def after_fork() -> None:
+    if _instance is not None:
+        _instance.after_fork()
@@ -0,0 +1,215 @@
+"""Emergency red-flag detection ahead of any LLM call.
+
+Phrases (English and Bangla) are compiled once into an Aho-Corasick
+automaton, so one pass over the symptoms and free text finds every match
+regardless of how many phrases there are. The check runs in microseconds
+and never touches the scheduler, so an emergency answer cannot queue behind
+ordinary traffic.
+"""
+
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# category -> phrases
+EMERGENCY_PHRASES: Dict[str, Tuple[str, ...]] = {
+    "cardiac": (
+        "chest pain",
+        "chest tightness",
+        "crushing chest",
+        "heart attack",
+        "বুকে ব্যথা",
+        "বুক ব্যথা",
+    ),
+    "breathing": (
+        "breathing difficulty",
+        "difficulty breathing",
+        "trouble breathing",
+        "shortness of breath",
+        "short of breath",
+        "can't breathe",
+        "cannot breathe",
+        "not breathing",
+        "choking",
+        "শ্বাসকষ্ট",
+        "শ্বাস নিতে কষ্ট",
+    ),
+    "bleeding": (
+        "heavy bleeding",
+        "severe bleeding",
+        "bleeding won't stop",
+        "vomiting blood",
+        "coughing blood",
+        "coughing up blood",
+        "রক্তক্ষরণ",
+        "রক্ত বমি",
+    ),
+    "neurological": (
+        "unconscious",
+        "unresponsive",
+        "passed out",
+        "seizure",
+        "convulsion",
+        "convulsions",
+        "stroke",
+        "face drooping",
+        "slurred speech",
+        "sudden weakness",
+        "paralysis",
+        "অজ্ঞান",
+        "খিঁচুনি",
+        "স্ট্রোক",
+    ),
+    "other": (
+        "anaphylaxis",
+        "severe allergic reaction",
+        "throat swelling",
+        "swollen throat",
+        "poisoning",
+        "overdose",
+        "suicidal",
+        "suicide",
+        "snake bite",
+        "snakebite",
+        "severe burn",
+        "সাপে কামড়",
+        "বিষ খেয়েছে",
+        "আত্মহত্যা",
+    ),
+}
+
+# "no chest pain" / "denies chest pain" are not emergencies
+_NEGATIONS_BEFORE = {"no", "not", "without", "denies", "denied", "never"}
+# Bangla negation follows the phrase: "বুকে ব্যথা নেই"
+_NEGATIONS_AFTER = {"নেই", "নাই", "না"}
+_NEGATION_WINDOW = 3
+_SCOPE_BREAKS = {"but", "and", "however", "though", "now", "আর", "কিন্তু"}
+
+_WORD_SEP = re.compile(r"[\s,.;:!?/()\"]+")
+
+
+def _normalize(text: str) -> str:
+    return _WORD_SEP.sub(" ", text.lower().replace("’", "'")).strip()
+
+
+class EmergencyDetector:
+    """Aho-Corasick automaton over ``EMERGENCY_PHRASES``."""
+
+    def __init__(self, phrases: Optional[Dict[str, Tuple[str, ...]]] = None):
+        phrases = phrases or EMERGENCY_PHRASES
+        # Node 0 is the root; each node: transitions, failure link, outputs
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, str]]] = [[]]
+
+        for category, terms in phrases.items():
+            for term in terms:
+                self._add(_normalize(term), category)
+        self._build()
+
+    def _add(self, phrase: str, category: str) -> None:
+        node = 0
+        for ch in phrase:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((phrase, category))
+
+    def _build(self) -> None:
+        # Breadth-first, so a node's failure target is always finished first;
+        # root children keep failure link 0
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _scan(self, text: str) -> List[Tuple[str, str, int]]:
+        """All ``(phrase, category, start)`` occurrences on word boundaries."""
+        found = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for phrase, category in self._out[node]:
+                start = i - len(phrase) + 1
+                end = i + 1
+                if (start == 0 or text[start - 1] == " ") and (end == len(text) or text[end] == " "):
+                    found.append((phrase, category, start))
+        return found
+
+    @staticmethod
+    def _negated(text: str, phrase: str, start: int) -> bool:
+        after = text[start + len(phrase):].split()[:1]
+        if _NEGATIONS_AFTER.intersection(after):
+            return True
+        # A conjunction ends the negation's scope: "no fever but chest pain"
+        for token in reversed(text[:start].split()[-_NEGATION_WINDOW:]):
+            if token in _SCOPE_BREAKS:
+                return False
+            if token in _NEGATIONS_BEFORE:
+                return True
+        return False
+
+    def detect(self, texts: Iterable[Optional[str]]) -> List[Dict[str, str]]:
+        """Return ``[{"phrase", "category"}]`` for every non-negated match."""
+        matches: List[Dict[str, str]] = []
+        seen = set()
+        for raw in texts:
+            if not raw or not isinstance(raw, str):
+                continue
+            text = _normalize(raw)
+            for phrase, category, start in self._scan(text):
+                if phrase in seen or self._negated(text, phrase, start):
+                    continue
+                seen.add(phrase)
+                matches.append({"phrase": phrase, "category": category})
+        return matches
+
+
+EMERGENCY_EXPLANATIONS: Dict[str, str] = {
+    "en": (
+        "Your symptoms may be a medical emergency. Call {number} or go to the nearest "
+        "hospital emergency department now. Do not wait for a more detailed assessment."
+    ),
+    "bn": (
+        "আপনার উপসর্গগুলো জরুরি অবস্থার লক্ষণ হতে পারে। এখনই {number} নম্বরে কল করুন "
+        "অথবা নিকটস্থ হাসপাতালের জরুরি বিভাগে যান। বিস্তারিত মূল্যায়নের জন্য অপেক্ষা করবেন না।"
+    ),
+}
+
+
+def emergency_structured(matches: List[Dict[str, str]], number: str) -> Dict[str, object]:
+    """Structured assessment returned before (and instead of waiting for) the LLM."""
+    return {
+        "severity": "emergency",
+        "care_level": "emergency-now",
+        "red_flags": [m["phrase"] for m in matches],
+        "diagnoses": [],
+        "medications": [],
+        "doctor_note": (
+            f"Emergency red flags detected ({', '.join(sorted({m['category'] for m in matches}))}). "
+            f"Seek emergency care immediately (call {number})."
+        ),
+        "disclaimer": (
+            "This is an automatic safety check, not a diagnosis. "
+            "When in doubt, always seek emergency care."
+        ),
+        "source": "emergency-rules",
+    }
+
+
+def emergency_explanation(language: str, number: str) -> str:
+    template = EMERGENCY_EXPLANATIONS.get(language, EMERGENCY_EXPLANATIONS["en"])
+    return template.format(number=number)
@@ -0,0 +1,317 @@
+"""Replica selection for LLM endpoints.
+
+Each role's ``*_ENDPOINT`` may list several comma-separated URLs (e.g. one
+Ollama per inference box). A pool picks the replica with the fewest
+outstanding requests, skips replicas a background probe found unreachable,
+and trips a per-replica circuit breaker after consecutive failures so one
+stuck server fails fast instead of stalling every request until the read
+timeout. State lives on ``Replica`` objects shared by URL, so every client
+and pool that talks to the same server sees the same load and health.
+"""
+
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+from src.core.config import config
+from src.core.logger import logger
+from src.core.metrics import registry
+from src.core.scheduler import QueueFullError, get_scheduler
+
+BREAKER_OPENED = registry.counter(
+    "aidoctor_llm_breaker_open_total", "Times a replica's circuit breaker opened.", ("endpoint",)
+)
+LLM_HEDGES = registry.counter(
+    "aidoctor_llm_hedges_total", "Hedged LLM requests by outcome.", ("outcome",)
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def parse_endpoints(value: str) -> List[str]:
+    """Split a comma-separated endpoint setting into normalized URLs."""
+    urls: List[str] = []
+    for part in (value or "").split(","):
+        url = part.strip().rstrip("/")
+        if url and url not in urls:
+            urls.append(url)
+    return urls
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class Replica:
+    """One server: load, health and circuit-breaker state."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.origin = _origin(url)
+        self.outstanding = 0
+        self.healthy = True
+        self.state = CLOSED
+        self.failures = 0  # consecutive
+        self.opened_at = 0.0
+        self.trial_inflight = False
+        self.trial_owner: Optional[object] = None  # the request making the half-open trial
+        self.latency_avg = 0.0  # EWMA, seconds
+        self.requests = 0
+        self.errors = 0
+        self.probed = False
+
+    def available(self, now: float) -> bool:
+        """Caller holds the pool lock."""
+        if not self.healthy:
+            return False
+        if self.state == OPEN and now - self.opened_at >= config.LLM_BREAKER_COOLDOWN:
+            self.state = HALF_OPEN
+            self.end_trial()
+        if self.state == HALF_OPEN:
+            # Exactly one trial request decides whether the breaker closes
+            return not self.trial_inflight
+        return self.state == CLOSED
+
+    def end_trial(self) -> None:
+        """Caller holds the pool lock."""
+        self.trial_inflight = False
+        self.trial_owner = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "breaker": self.state,
+            "outstanding": self.outstanding,
+            "consecutive_failures": self.failures,
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_latency_seconds": round(self.latency_avg, 4),
+        }
+
+
+_lock = threading.Lock()
+_replicas: Dict[str, Replica] = {}
+_pools: Dict[str, "EndpointPool"] = {}
+_prober: Optional[threading.Thread] = None
+
+
+class EndpointPool:
+    """The replicas behind one ``*_ENDPOINT`` setting."""
+
+    def __init__(self, name: str, replicas: List[Replica]):
+        self.name = name
+        self.replicas = replicas
+        self._rr = itertools.count()
+
+    @property
+    def size(self) -> int:
+        return len(self.replicas)
+
+    @property
+    def urls(self) -> List[str]:
+        return [r.url for r in self.replicas]
+
+    def total_slots(self) -> int:
+        return sum(get_scheduler(r.url).max_concurrency for r in self.replicas)
+
+    def pick(
+        self, exclude: Iterable[Replica] = (), idle_only: bool = False, owner: Optional[object] = None
+    ) -> Optional[Replica]:
+        """Least-outstanding available replica.
+
+        Returns None when every replica not in ``exclude`` is unavailable
+        (so a failover has nowhere to go); raises ``QueueFullError`` when
+        nothing at all is available. ``idle_only`` restricts the choice to
+        replicas with a free slot (a hedge must not queue behind others).
+        ``owner`` identifies the request (any object unique to it): if the
+        pick is a half-open replica's trial, only that owner's ``track`` and
+        ``record`` end it.
+        """
+        if self.size > 1:
+            _ensure_prober()
+        excluded = set(id(r) for r in exclude)
+        now = time.monotonic()
+        with _lock:
+            candidates = [r for r in self.replicas if id(r) not in excluded and r.available(now)]
+            if idle_only:
+                candidates = [
+                    r for r in candidates if r.outstanding < get_scheduler(r.url).max_concurrency
+                ]
+            if not candidates:
+                if excluded or idle_only:
+                    return None
+                raise QueueFullError(self.name, "unavailable", retry_after=self._retry_after(now))
+            # Rotate before the stable sort so ties spread across replicas
+            offset = next(self._rr) % len(candidates)
+            candidates = candidates[offset:] + candidates[:offset]
+            replica = min(
+                candidates,
+                key=lambda r: (
+                    r.outstanding / get_scheduler(r.url).max_concurrency,
+                    r.latency_avg,
+                ),
+            )
+            if replica.state == HALF_OPEN:
+                replica.trial_inflight = True
+                replica.trial_owner = owner
+            return replica
+
+    def _retry_after(self, now: float) -> int:
+        remaining = [
+            config.LLM_BREAKER_COOLDOWN - (now - r.opened_at) for r in self.replicas if r.state == OPEN
+        ]
+        return max(1, int(min(remaining))) if remaining else max(1, int(config.LLM_HEALTH_INTERVAL))
+
+    @contextmanager
+    def track(self, replica: Replica, owner: Optional[object] = None):
+        """Count the request as outstanding on ``replica`` (queued time included).
+
+        Also ends ``owner``'s half-open trial if it never reached ``record``
+        (e.g. the replica's queue was full), so the next request can make it.
+        """
+        with _lock:
+            replica.outstanding += 1
+        try:
+            yield replica
+        finally:
+            with _lock:
+                replica.outstanding -= 1
+                if replica.trial_inflight and replica.trial_owner is owner:
+                    replica.end_trial()
+
+    def record(
+        self, replica: Replica, ok: bool, latency: Optional[float] = None, owner: Optional[object] = None
+    ) -> None:
+        """Feed a request outcome into the replica's breaker and latency average.
+
+        Failures count their elapsed time too, so a replica that times out
+        looks slow to ``pick`` even before its breaker opens. While the
+        replica is half-open only the trial's ``owner`` decides the breaker;
+        requests sent before it opened just update the counters.
+        """
+        with _lock:
+            replica.requests += 1
+            if latency is not None:
+                replica.latency_avg = (
+                    latency if not replica.latency_avg else 0.8 * replica.latency_avg + 0.2 * latency
+                )
+            if replica.state == HALF_OPEN:
+                if not (replica.trial_inflight and replica.trial_owner is owner):
+                    replica.errors += not ok
+                    return
+                replica.end_trial()
+            if ok:
+                if replica.state != CLOSED:
+                    logger.info("LLM replica %s recovered; circuit closed", replica.url)
+                replica.state = CLOSED
+                replica.failures = 0
+                return
+
+            replica.errors += 1
+            replica.failures += 1
+            threshold = config.LLM_BREAKER_FAILURES
+            trip = replica.state == HALF_OPEN or (threshold > 0 and replica.failures >= threshold)
+            if trip and replica.state != OPEN:
+                replica.state = OPEN
+                replica.opened_at = time.monotonic()
+                BREAKER_OPENED.inc(endpoint=replica.origin)
+                logger.warning(
+                    "LLM replica %s failed %d times in a row; circuit open for %.0fs",
+                    replica.url,
+                    replica.failures,
+                    config.LLM_BREAKER_COOLDOWN,
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        with _lock:
+            return {"name": self.name, "replicas": [r.to_dict() for r in self.replicas]}
+
+
+def get_pool(endpoint: str) -> EndpointPool:
+    """Return the pool for a (possibly comma-separated) endpoint setting, creating it once."""
+    pool = _pools.get(endpoint)
+    if pool is not None:
+        return pool
+    urls = parse_endpoints(endpoint)
+    with _lock:
+        pool = _pools.get(endpoint)
+        if pool is None:
+            replicas = []
+            for url in urls:
+                replica = _replicas.get(url)
+                if replica is None:
+                    replica = _replicas[url] = Replica(url)
+                replica.probed = replica.probed or len(urls) > 1
+                replicas.append(replica)
+            pool = EndpointPool(",".join(r.origin for r in replicas), replicas)
+            _pools[endpoint] = pool
+            if len(replicas) > 1:
+                logger.info("LLM endpoint pool %s: %d replicas", pool.name, len(replicas))
+        return pool
+
+
+def all_stats() -> List[Dict[str, Any]]:
+    with _lock:
+        replicas = list(_replicas.values())
+        return [r.to_dict() for r in replicas]
+
+
+# ---- health probing ----
+
+
+def _probe(replica: Replica) -> bool:
+    """Any HTTP answer below 500 means the server is up (the path may be unsupported)."""
+    from . import transport
+
+    try:
+        resp = transport.get_session(replica.url).get(
+            replica.origin + config.LLM_HEALTH_PATH, timeout=config.LLM_HEALTH_TIMEOUT
+        )
+        return resp.status_code < 500
+    except Exception:
+        return False
+
+
+def _probe_loop() -> None:
+    while True:
+        with _lock:
+            replicas = [r for r in _replicas.values() if r.probed]
+        for replica in replicas:
+            up = _probe(replica)
+            with _lock:
+                changed = up != replica.healthy
+                replica.healthy = up
+            if changed:
+                if up:
+                    logger.info("LLM replica %s is reachable again", replica.url)
+                else:
+                    logger.warning("LLM replica %s failed its health check", replica.url)
+        time.sleep(config.LLM_HEALTH_INTERVAL)
+
+
+def _ensure_prober() -> None:
+    # Started lazily by the first multi-replica pick, so forked workers get their own
+    global _prober
+    if config.LLM_HEALTH_INTERVAL <= 0 or (_prober is not None and _prober.is_alive()):
+        return
+    with _lock:
+        if _prober is None or not _prober.is_alive():
+            _prober = threading.Thread(target=_probe_loop, name="llm-health", daemon=True)
+            _prober.start()
+
+
+def after_fork() -> None:
+    """Fresh lock and counters in a forked child; the prober restarts on demand."""
+    global _lock, _prober
+    _lock = threading.Lock()
+    _prober = None
+    for replica in _replicas.values():
+        replica.outstanding = 0
+        replica.end_trial()
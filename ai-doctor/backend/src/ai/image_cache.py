@@ -0,0 +1,96 @@
+"""Perceptual-hash cache for vision assessments.
+
+Retakes and re-crops of the same photo hash to nearby 64-bit difference
+hashes (dHash), so a lookup returns the stored assessment of any cached
+image within ``max_distance`` bits. Memory is bounded by an LRU over at
+most ``max_entries`` hashes; a linear XOR/popcount scan over that many
+integers costs microseconds next to a vision inference.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from src.core.logger import logger
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+def dhash(img: "Image.Image", hash_size: int = 8) -> int:
+    """64-bit difference hash of an image (robust to rescaling and recompression)."""
+    from PIL import Image
+
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+class PerceptualCache:
+    def __init__(self, max_entries: int = 1024, max_distance: int = 6) -> None:
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        # hash -> (model, assessment)
+        self._entries: "OrderedDict[int, Tuple[str, Dict[str, Any]]]" = OrderedDict()
+        self._stats = {"exact_hits": 0, "near_hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, image_hash: int, model: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(image_hash)
+            if entry is not None and entry[0] == model:
+                self._entries.move_to_end(image_hash)
+                self._stats["exact_hits"] += 1
+                return dict(entry[1])
+
+            best_key, best_distance = None, self.max_distance + 1
+            for key, (entry_model, _) in self._entries.items():
+                if entry_model != model:
+                    continue
+                distance = (key ^ image_hash).bit_count()
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+
+            if best_key is None:
+                self._stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(best_key)
+            self._stats["near_hits"] += 1
+            logger.info("Image cache near-duplicate hit (distance=%d)", best_distance)
+            return dict(self._entries[best_key][1])
+
+    def set(self, image_hash: int, model: str, assessment: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[image_hash] = (model, dict(assessment))
+            self._entries.move_to_end(image_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate_model(self, model: str) -> int:
+        with self._lock:
+            keys = [k for k, (m, _) in self._entries.items() if m == model]
+            for k in keys:
+                del self._entries[k]
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["max_entries"] = self.max_entries
+            stats["max_distance"] = self.max_distance
+        lookups = stats["exact_hits"] + stats["near_hits"] + stats["misses"]
+        hits = stats["exact_hits"] + stats["near_hits"]
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
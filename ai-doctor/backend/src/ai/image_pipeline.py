@@ -0,0 +1,78 @@
+"""In-memory preprocessing of uploaded images for the vision model.
+
+Uploads are decoded, EXIF-rotated, downscaled to the vision model's input
+size and re-encoded (JPEG or WebP) before being sent as a base64 data URL.
+Smaller payloads mean far less vision prefill on CPU.
+"""
+
+import base64
+import io
+from typing import TYPE_CHECKING, Any, Dict, Tuple
+
+from src.core.config import config
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+_MIME = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+class ImageDecodeError(ValueError):
+    """Raised when an upload is not a decodable image."""
+
+
+def _pil():
+    """Import Pillow on first use; it is not needed to start the server."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    # Refuse decompression bombs well before they reach the resize step
+    Image.MAX_IMAGE_PIXELS = 64_000_000
+    return Image, ImageOps, UnidentifiedImageError
+
+
+def prepare_image(
+    image_bytes: bytes,
+    max_side: int | None = None,
+    fmt: str | None = None,
+    quality: int | None = None,
+) -> Tuple["Image.Image", bytes, str]:
+    """Decode, normalize and re-encode an upload.
+
+    Returns (normalized PIL image, encoded bytes, mime type).
+    """
+    max_side = max_side or config.VISION_IMAGE_MAX_SIDE
+    fmt = (fmt or config.VISION_IMAGE_FORMAT).upper()
+    if fmt not in _MIME:
+        fmt = "JPEG"
+    quality = quality or config.VISION_IMAGE_QUALITY
+    Image, ImageOps, UnidentifiedImageError = _pil()
+
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        # For JPEGs, let the decoder downscale by a power of two up front
+        img.draft("RGB", (max_side, max_side))
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGB")
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise ImageDecodeError(f"Unsupported or corrupt image: {e}") from e
+
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    out = io.BytesIO()
+    img.save(out, format=fmt, quality=quality, optimize=fmt == "JPEG")
+    return img, out.getvalue(), _MIME[fmt]
+
+
+def to_data_url(encoded: bytes, mime: str) -> str:
+    return f"data:{mime};base64,{base64.b64encode(encoded).decode('ascii')}"
+
+
+def describe(original_size: int, img: "Image.Image", encoded: bytes, mime: str) -> Dict[str, Any]:
+    """Small summary of the preprocessing for logs and responses."""
+    return {
+        "original_bytes": original_size,
+        "sent_bytes": len(encoded),
+        "width": img.width,
+        "height": img.height,
+        "mime": mime,
+    }
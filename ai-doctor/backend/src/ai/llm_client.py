@@ -1,21 +1,36 @@
 """Simple OpenAI-style client for local LLM servers (e.g. Ollama)."""
 
-import requests
-from typing import Optional, Dict, Any
+import asyncio
+import contextvars
+import json
+import queue
+import threading
+import time
+from typing import Optional, Dict, Any, Iterator, List, Tuple
+from src.core.config import config
 from src.core.logger import logger
+from src.core.metrics import LLM_FAILURES, LLM_REQUESTS, record_usage
+from src.core.scheduler import QueueFullError, get_scheduler
+from . import transport
+from .endpoint_pool import LLM_HEDGES, Replica, get_pool, parse_endpoints
 
 
 class LLMClient:
+    """Client for one role; ``endpoint`` may list several comma-separated replicas."""
+
     def __init__(self, endpoint: str, model: str, api_key: str | None = None):
-        self.endpoint = endpoint.rstrip("/")
+        self.endpoint = ",".join(parse_endpoints(endpoint))
         self.model = model
         self.api_key = api_key
+        self.pool = get_pool(self.endpoint) if self.endpoint else None
 
-    def chat(self, messages: list[dict[str, str]], extra: Optional[Dict[str, Any]] = None) -> Optional[str]:
-        if not self.endpoint or not self.model:
-            logger.warning("LLMClient called without endpoint or model")
-            return None
+    def per_replica(self) -> List["LLMClient"]:
+        """One single-replica client per URL (e.g. to warm every server)."""
+        if self.pool is None or self.pool.size <= 1:
+            return [self]
+        return [LLMClient(url, self.model, self.api_key) for url in self.pool.urls]
 
+    def _request(self, messages: list[dict[str, str]], extra: Optional[Dict[str, Any]]):
         body: Dict[str, Any] = {
             "model": self.model,
             "messages": messages,
@@ -26,14 +41,347 @@ class LLMClient:
         headers: Dict[str, str] = {}
         if self.api_key:
             headers["Authorization"] = f"Bearer {self.api_key}"
+        return body, headers
+
+    def chat(self, messages: list[dict[str, str]], extra: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        if not self.endpoint or not self.model:
+            logger.warning("LLMClient called without endpoint or model")
+            return None
+
+        body, headers = self._request(messages, extra)
+        if config.LLM_HEDGE_AFTER_MS > 0 and self.pool.size > 1:
+            return self._hedged_chat(body, headers)
+
+        # Fail over to another replica on connection errors / 5xx / a full queue
+        tried: List[Replica] = []
+        queue_full: Optional[QueueFullError] = None
+        # ``tried`` is unique to this request, so it also marks the request as
+        # the owner of any half-open trial it is picked for
+        replica = self.pool.pick(owner=tried)
+        while replica is not None:
+            tried.append(replica)
+            try:
+                content, retryable = self._call(replica, body, headers, owner=tried)
+            except QueueFullError as e:
+                queue_full, content, retryable = e, None, True
+            if content is not None or not retryable:
+                return content
+            replica = self.pool.pick(exclude=tried, owner=tried)
+        if queue_full is not None:
+            # Every replica was busy or down; let the API answer 429/503
+            raise queue_full
+        return None
+
+    def _call(
+        self,
+        replica: Replica,
+        body: Dict[str, Any],
+        headers: Dict[str, str],
+        sent: Optional[threading.Event] = None,
+        owner: Optional[object] = None,
+    ) -> Tuple[Optional[str], bool]:
+        """One request to one replica. Returns ``(content, retryable)``.
+
+        ``sent`` is set once the request has a slot and goes on the wire;
+        ``owner`` is the request as passed to ``pool.pick``.
+        """
+        # QueueFullError propagates so the caller can try another replica
+        with self.pool.track(replica, owner), get_scheduler(replica.url).slot():
+            if sent is not None:
+                sent.set()
+            start = time.perf_counter()
+            try:
+                resp = transport.post(replica.url, json=body, headers=headers)
+            except Exception as e:
+                logger.exception("LLM request failed for model %s at %s: %s", self.model, replica.url, e)
+                self.pool.record(replica, ok=False, latency=time.perf_counter() - start, owner=owner)
+                self._record_failure(type(e).__name__)
+                return None, True
+            elapsed = time.perf_counter() - start
 
-        try:
-            resp = requests.post(self.endpoint, json=body, headers=headers, timeout=60)
             if not resp.ok:
-                logger.error("LLM error (%s): %s", self.model, resp.text[:300])
-                return None
-            data = resp.json()
-            return data["choices"][0]["message"]["content"]
-        except Exception as e:
-            logger.exception("LLM request failed for model %s: %s", self.model, e)
+                logger.error("LLM error (%s @ %s): %s", self.model, replica.url, resp.text[:300])
+                server_fault = resp.status_code >= 500
+                # A 4xx (e.g. unknown model) says nothing about the replica's health
+                self.pool.record(replica, ok=not server_fault, latency=elapsed, owner=owner)
+                self._record_failure(f"http_{resp.status_code}")
+                return None, server_fault
+            self.pool.record(replica, ok=True, latency=elapsed, owner=owner)
+
+            try:
+                data = resp.json()
+                # A reply with no text (null content) is still a successful call
+                content = data["choices"][0]["message"].get("content") or ""
+            except Exception as e:
+                logger.exception("LLM response from %s unreadable for model %s: %s", replica.url, self.model, e)
+                self._record_failure(type(e).__name__)
+                return None, False
+
+        LLM_REQUESTS.inc(model=self.model, outcome="ok")
+        record_usage(self.model, data.get("usage"), data.get("timings"))
+        return content, False
+
+    def _hedged_chat(self, body: Dict[str, Any], headers: Dict[str, str]) -> Optional[str]:
+        """Send to a second, idle replica if the first has not answered
+        within LLM_HEDGE_AFTER_MS of going on the wire.
+
+        Time spent queued for a slot does not count, so a busy pool is not
+        flooded with hedges. The first successful answer wins; the loser
+        runs to completion in the background.
+        """
+        results: "queue.Queue[Tuple[Replica, Optional[str], bool, Optional[BaseException]]]" = queue.Queue()
+
+        def launch(replica: Replica) -> threading.Event:
+            ctx = contextvars.copy_context()
+            sent = threading.Event()
+
+            def run() -> None:
+                try:
+                    results.put((replica, *ctx.run(self._call, replica, body, headers, sent, tried), None))
+                except QueueFullError as e:
+                    # Retryable: another replica may have room
+                    results.put((replica, None, True, e))
+                except BaseException as e:
+                    results.put((replica, None, False, e))
+                finally:
+                    sent.set()
+
+            threading.Thread(target=run, name="llm-hedge", daemon=True).start()
+            return sent
+
+        tried: List[Replica] = []
+        first = self.pool.pick(owner=tried)
+        tried.append(first)
+        first_sent = launch(first)
+        pending = 1
+        error: Optional[BaseException] = None
+
+        first_sent.wait()
+        hedge_at: Optional[float] = time.monotonic() + config.LLM_HEDGE_AFTER_MS / 1000.0
+        while pending:
+            timeout = None if hedge_at is None else max(hedge_at - time.monotonic(), 0)
+            try:
+                replica, content, retryable, exc = results.get(timeout=timeout)
+            except queue.Empty:
+                hedge_at = None
+                backup = self.pool.pick(exclude=tried, idle_only=True, owner=tried)
+                if backup is not None:
+                    LLM_HEDGES.inc(outcome="sent")
+                    tried.append(backup)
+                    launch(backup)
+                    pending += 1
+                continue
+
+            pending -= 1
+            if content is not None:
+                if replica is not first:
+                    LLM_HEDGES.inc(outcome="won")
+                return content
+            error = error or exc
+            if retryable and not pending:
+                # Plain failover when the only attempt in flight failed
+                hedge_at = None
+                backup = self.pool.pick(exclude=tried, owner=tried)
+                if backup is not None:
+                    tried.append(backup)
+                    launch(backup)
+                    pending += 1
+
+        if error is not None:
+            raise error
+        return None
+
+    def _record_failure(self, reason: str) -> None:
+        LLM_REQUESTS.inc(model=self.model, outcome="error")
+        LLM_FAILURES.inc(model=self.model, reason=reason)
+
+    def stream_chat(
+        self, messages: list[dict[str, str]], extra: Optional[Dict[str, Any]] = None
+    ) -> Iterator[str]:
+        """Yield content deltas using the OpenAI-compatible ``stream: true`` protocol.
+
+        Errors are logged and end the stream early; callers should treat an
+        empty stream the same way they treat ``chat`` returning None. A
+        replica that fails before sending anything is retried on another.
+        """
+        if not self.endpoint or not self.model:
+            logger.warning("LLMClient called without endpoint or model")
+            return
+
+        body, headers = self._request(messages, extra)
+        body["stream"] = True
+        body.setdefault("stream_options", {"include_usage": True})
+        headers["Accept"] = "text/event-stream"
+
+        tried: List[Replica] = []
+        queue_full: Optional[QueueFullError] = None
+        replica = self.pool.pick(owner=tried)
+        while replica is not None:
+            tried.append(replica)
+            sent = False
+            try:
+                with self.pool.track(replica, tried), get_scheduler(replica.url).slot():
+                    start = time.perf_counter()
+                    try:
+                        with transport.post(replica.url, json=body, headers=headers, stream=True) as resp:
+                            if not resp.ok:
+                                logger.error("LLM stream error (%s @ %s): %s", self.model, replica.url, resp.text[:300])
+                                self.pool.record(replica, ok=resp.status_code < 500, owner=tried)
+                                self._record_failure(f"http_{resp.status_code}")
+                                if resp.status_code < 500:
+                                    return
+                                replica = self.pool.pick(exclude=tried, owner=tried)
+                                continue
+                            self.pool.record(replica, ok=True, latency=time.perf_counter() - start, owner=tried)
+                            for line in resp.iter_lines(decode_unicode=True):
+                                if not line or not line.startswith("data:"):
+                                    continue
+                                data = line[len("data:"):].strip()
+                                if data == "[DONE]":
+                                    break
+                                try:
+                                    chunk = json.loads(data)
+                                except ValueError:
+                                    logger.warning("Skipping malformed stream chunk: %s", data[:200])
+                                    continue
+                                record_usage(self.model, chunk.get("usage"), chunk.get("timings"))
+                                choices = chunk.get("choices") or []
+                                if not choices:
+                                    continue
+                                delta = (choices[0].get("delta") or {}).get("content")
+                                if delta:
+                                    sent = True
+                                    yield delta
+                        LLM_REQUESTS.inc(model=self.model, outcome="ok")
+                        return
+                    except Exception as e:
+                        logger.exception("LLM stream failed for model %s at %s: %s", self.model, replica.url, e)
+                        self._record_failure(type(e).__name__)
+                        self.pool.record(replica, ok=False, owner=tried)
+                        if sent:
+                            return
+            except QueueFullError as e:
+                # Nothing sent yet; another replica may have room
+                queue_full = e
+            replica = self.pool.pick(exclude=tried, owner=tried)
+        if queue_full is not None:
+            raise queue_full
+
+
+class LocalLLMClient:
+    """Drop-in replacement for ``LLMClient`` that runs llama.cpp in-process.
+
+    Same ``chat``/``stream_chat`` contract (None / empty stream on failure),
+    same admission control and metrics, but no HTTP hop or separate server.
+    """
+
+    # OpenAI request fields llama-cpp-python's create_chat_completion accepts
+    PASSTHROUGH = ("temperature", "top_p", "max_tokens", "stop", "seed", "response_format")
+
+    endpoint = "local://llamacpp"
+
+    def __init__(self, model: str):
+        self.model = model
+        self._backends: Dict[str, Any] = {}
+
+    def _backend(self):
+        from src.llm.backends import LlamaCppBackend
+
+        backend = self._backends.get(self.model)
+        if backend is None:
+            backend = LlamaCppBackend(
+                self.model,
+                n_ctx=config.LLAMACPP_N_CTX,
+                n_threads=config.LLAMACPP_N_THREADS,
+                n_gpu_layers=config.LLAMACPP_N_GPU_LAYERS,
+                prompt_cache_bytes=config.LLAMACPP_PROMPT_CACHE_MB * 1024 * 1024
+                if config.PROMPT_CACHE
+                else 0,
+            )
+            self._backends[self.model] = backend
+        return backend
+
+    def release(self, model: str) -> None:
+        """Drop the in-process weights of a model this client no longer uses."""
+        from src.llm.backends import LlamaCppBackend
+
+        self._backends.pop(model, None)
+        LlamaCppBackend.unload(model)
+
+    def _kwargs(self, extra: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        kwargs = {k: v for k, v in (extra or {}).items() if k in self.PASSTHROUGH}
+        fmt = kwargs.get("response_format")
+        if fmt and fmt.get("type") == "json_schema":
+            # llama-cpp-python takes the schema as a json_object grammar
+            kwargs["response_format"] = {
+                "type": "json_object",
+                "schema": fmt.get("json_schema", {}).get("schema"),
+            }
+        return kwargs
+
+    def chat(self, messages: list[dict[str, str]], extra: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        if not self.model:
+            logger.warning("LocalLLMClient called without model")
             return None
+
+        with get_scheduler(self.endpoint).slot():
+            try:
+                data = self._backend().complete(messages, **self._kwargs(extra))
+                content = data["choices"][0]["message"].get("content") or ""
+            except Exception as e:
+                logger.exception("Local LLM call failed for model %s: %s", self.model, e)
+                LLM_REQUESTS.inc(model=self.model, outcome="error")
+                LLM_FAILURES.inc(model=self.model, reason=type(e).__name__)
+                return None
+
+        LLM_REQUESTS.inc(model=self.model, outcome="ok")
+        record_usage(self.model, data.get("usage"), data.get("timings"))
+        return content
+
+    def stream_chat(
+        self, messages: list[dict[str, str]], extra: Optional[Dict[str, Any]] = None
+    ) -> Iterator[str]:
+        if not self.model:
+            logger.warning("LocalLLMClient called without model")
+            return
+
+        with get_scheduler(self.endpoint).slot():
+            try:
+                timings = yield from self._backend().stream_chat(messages, **self._kwargs(extra))
+                LLM_REQUESTS.inc(model=self.model, outcome="ok")
+                record_usage(self.model, None, timings)
+            except Exception as e:
+                logger.exception("Local LLM stream failed for model %s: %s", self.model, e)
+                LLM_REQUESTS.inc(model=self.model, outcome="error")
+                LLM_FAILURES.inc(model=self.model, reason=type(e).__name__)
+
+
+def make_client(endpoint: str, model: str, local_ok: bool = True):
+    """Build the client for one role according to ``LLM_BACKEND``.
+
+    ``local_ok=False`` keeps a role on HTTP (the in-process backend has no
+    vision support).
+    """
+    if local_ok and config.LLM_BACKEND == "llamacpp":
+        return LocalLLMClient(model)
+    return LLMClient(endpoint=endpoint, model=model)
+
+
+class AsyncLLMClient:
+    """asyncio front-end for an ``LLMClient``.
+
+    Calls run on the default executor through the same pooled transport, so
+    several awaited requests are in flight at once while sharing connections.
+    """
+
+    def __init__(self, client: "LLMClient | LocalLLMClient"):
+        self._client = client
+
+    @property
+    def model(self) -> str:
+        return self._client.model
+
+    async def chat(
+        self, messages: list[dict[str, str]], extra: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        return await asyncio.to_thread(self._client.chat, messages, extra)
@@ -0,0 +1,150 @@
+"""Model warm-up and keep-alive.
+
+Loading a model happens on its first request, and on CPU that can take
+longer than the request timeout. ``ModelManager`` loads the planned models
+in the background at startup and warms a newly selected model before an
+admin switch takes effect. It also pings idle models periodically so the
+LLM server does not unload them.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable
+
+from src.core.config import config
+from src.core.logger import logger
+from src.core.request_context import PRIORITY_BACKGROUND, set_priority
+from src.core.runtime_config import get_model
+from .llm_client import LLMClient, LocalLLMClient
+
+ROLES = ("REASONING_MODEL", "EXPLAIN_MODEL", "VISION_MODEL")
+
+_WARMUP_MESSAGES = [{"role": "user", "content": "ping"}]
+
+
+class ModelManager:
+    def __init__(self, get_orchestrator: Callable[[], Any]) -> None:
+        # A factory, so the orchestrator is only built when a model is warmed
+        self._get_orchestrator = get_orchestrator
+        self._lock = threading.Lock()
+        # model -> {"state", "roles", "load_seconds", "error", "last_used"}
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._started = False
+
+    # ---- public API ----
+
+    def start(self) -> None:
+        """Warm the planned models in the background and start keep-alive pings."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        threading.Thread(target=self._warm_planned, name="model-warmup", daemon=True).start()
+        if config.MODEL_KEEPALIVE_INTERVAL > 0:
+            threading.Thread(target=self._keepalive_loop, name="model-keepalive", daemon=True).start()
+
+    def ready(self) -> bool:
+        """True once every model currently in use has loaded successfully."""
+        with self._lock:
+            for role in ROLES:
+                model = get_model(role)
+                if model and self._models.get(model, {}).get("state") != "ready":
+                    return False
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {name: dict(info) for name, info in self._models.items()}
+        return {"ready": self.ready(), "models": models}
+
+    def prewarm(self, role: str, model: str) -> bool:
+        """Load ``model`` for ``role`` synchronously. Returns True if it answered."""
+        return self._warm(role, model)
+
+    def warm_async(self, changes: Dict[str, str]) -> None:
+        """Warm the given {role: model} in the background (e.g. after a re-plan)."""
+
+        def run() -> None:
+            set_priority(PRIORITY_BACKGROUND)
+            for role, model in changes.items():
+                if model:
+                    self._warm(role, model)
+
+        threading.Thread(target=run, name="model-warmup", daemon=True).start()
+
+    # ---- internals ----
+
+    def _client_for(self, role: str, model: str):
+        orchestrator = self._get_orchestrator()
+        base = {
+            "REASONING_MODEL": orchestrator.reasoner,
+            "EXPLAIN_MODEL": orchestrator.explainer,
+            "VISION_MODEL": orchestrator.vision,
+        }[role]
+        if isinstance(base, LocalLLMClient):
+            return LocalLLMClient(model)
+        return LLMClient(endpoint=base.endpoint, model=model, api_key=base.api_key)
+
+    def _set_state(self, model: str, role: str, **fields: Any) -> None:
+        with self._lock:
+            info = self._models.setdefault(model, {"state": "pending", "roles": []})
+            if role not in info["roles"]:
+                info["roles"].append(role)
+            info.update(fields)
+
+    def _warm(self, role: str, model: str) -> bool:
+        with self._lock:
+            refreshing = self._models.get(model, {}).get("state") == "ready"
+        if not refreshing:
+            self._set_state(model, role, state="loading", error=None)
+        extra: Dict[str, Any] = {"max_tokens": 1}
+        if config.MODEL_KEEP_ALIVE:
+            extra["keep_alive"] = config.MODEL_KEEP_ALIVE
+
+        client = self._client_for(role, model)
+        # Every replica has to load the model, not only the one a pool would pick
+        replicas = client.per_replica() if isinstance(client, LLMClient) else [client]
+        start = time.perf_counter()
+        answered = False
+        for replica in replicas:
+            try:
+                # None means the call failed; an empty reply (e.g. a thinking
+                # model cut off by max_tokens=1) still means the model loaded
+                if replica.chat(_WARMUP_MESSAGES, extra) is not None:
+                    answered = True
+            except Exception as e:
+                logger.warning("Warm-up of %s at %s failed: %s", model, replica.endpoint, e)
+        elapsed = round(time.perf_counter() - start, 2)
+
+        if not answered:
+            self._set_state(model, role, state="failed", error="no response", load_seconds=elapsed)
+            logger.warning("Model %s (%s) did not warm up after %.1fs", model, role, elapsed)
+            return False
+
+        self._set_state(model, role, state="ready", load_seconds=elapsed, last_used=time.time())
+        logger.info("Model %s (%s) ready in %.1fs", model, role, elapsed)
+        return True
+
+    def _planned(self) -> Iterable[tuple]:
+        seen = set()
+        for role in ROLES:
+            model = get_model(role)
+            if model and model not in seen:
+                seen.add(model)
+                yield role, model
+
+    def _warm_planned(self) -> None:
+        set_priority(PRIORITY_BACKGROUND)
+        for role, model in self._planned():
+            self._warm(role, model)
+
+    def _keepalive_loop(self) -> None:
+        set_priority(PRIORITY_BACKGROUND)
+        while True:
+            time.sleep(config.MODEL_KEEPALIVE_INTERVAL)
+            for role, model in self._planned():
+                try:
+                    self._warm(role, model)
+                except Exception as e:
+                    logger.warning("Keep-alive ping for %s failed: %s", model, e)
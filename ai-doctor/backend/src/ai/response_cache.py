@@ -0,0 +1,185 @@
+"""Content-addressed cache for LLM stage responses.
+
+Keys are a SHA-256 over (model, system prompt, normalized payload, language),
+so any change to the prompt or the model produces a different key. Entries
+live in an in-memory LRU with a TTL and can optionally be persisted to a
+SQLite file so they survive restarts.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from src.core.logger import logger
+
+
+def make_key(model: str, system_prompt: str, payload: Any, language: str = "") -> str:
+    canonical = json.dumps(
+        {
+            "model": model,
+            "system_prompt": system_prompt,
+            "payload": payload,
+            "language": language,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + optional SQLite) cache with TTL and counters."""
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: float = 3600,
+        db_path: str | None = None,
+        disk_max_entries: int = 10000,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_max_entries = disk_max_entries
+
+        self._lock = threading.Lock()
+        # key -> (expires_at, model, value)
+        self._mem: "OrderedDict[str, Tuple[float, str, str]]" = OrderedDict()
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions": 0,
+            "expired": 0,
+        }
+
+        self.db_path = db_path
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._open_db()
+
+    def _open_db(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT NOT NULL,"
+                " value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires_at)"
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Response cache disk tier disabled (%s): %s", self.db_path, e)
+            self._db = None
+
+    def reopen(self) -> None:
+        """Open a fresh SQLite connection; one inherited across fork() is unsafe."""
+        self._lock = threading.Lock()
+        if self.db_path:
+            self._open_db()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                expires_at, _, value = entry
+                if expires_at > now:
+                    self._mem.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._mem[key]
+                self._stats["expired"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT model, value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    model, value, expires_at = row
+                    if expires_at > now:
+                        self._stats["disk_hits"] += 1
+                        self._put_memory(key, expires_at, model, value)
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._stats["expired"] += 1
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: str, model: str = "") -> None:
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._stats["sets"] += 1
+            self._put_memory(key, expires_at, model, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, value, expires_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    (key, model, value, expires_at),
+                )
+                if self._stats["sets"] % 100 == 0:
+                    self._prune_disk()
+                self._db.commit()
+
+    def invalidate_model(self, model: str) -> int:
+        """Drop every entry produced by ``model``. Returns the number removed."""
+        with self._lock:
+            keys = [k for k, (_, m, _) in self._mem.items() if m == model]
+            for k in keys:
+                del self._mem[k]
+            removed = len(keys)
+            if self._db is not None:
+                cur = self._db.execute("DELETE FROM responses WHERE model = ?", (model,))
+                self._db.commit()
+                removed = max(removed, cur.rowcount)
+        if removed:
+            logger.info("Response cache: invalidated %d entries for model %s", removed, model)
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats["memory_entries"] = len(self._mem)
+            stats["max_entries"] = self.max_entries
+            stats["ttl_seconds"] = self.ttl_seconds
+            stats["disk_enabled"] = self._db is not None
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
+
+    # ---- internals (caller holds the lock) ----
+
+    def _put_memory(self, key: str, expires_at: float, model: str, value: str) -> None:
+        self._mem[key] = (expires_at, model, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _prune_disk(self) -> None:
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        self._db.execute(
+            "DELETE FROM responses WHERE key IN ("
+            " SELECT key FROM responses ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.disk_max_entries,),
+        )
@@ -0,0 +1,363 @@
+"""Schema-constrained JSON for the reasoning stage.
+
+The schema is sent as ``response_format`` so the server's grammar sampler
+can only produce a valid object. What comes back is still checked: older
+servers ignore the constraint and truncated generations are common, so
+``parse_diagnosis`` validates, coerces and locally repairs before the
+caller falls back to a (bounded) repair call.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+SEVERITIES = ("low", "medium", "high", "emergency")
+CARE_LEVELS = ("self-care", "doctor-within-24h", "emergency-now")
+MAX_DIAGNOSES = 3
+
+DEFAULT_DISCLAIMER = (
+    "This explanation was generated by an AI model and may not be accurate. "
+    "Always consult a qualified doctor."
+)
+
+DIAGNOSIS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        # Triage fields first: grammar-constrained servers emit properties in
+        # schema order, so streaming callers see these before the long ones
+        "severity": {"type": "string", "enum": list(SEVERITIES)},
+        "care_level": {"type": "string", "enum": list(CARE_LEVELS)},
+        "red_flags": {"type": "array", "items": {"type": "string"}},
+        "diagnoses": {
+            "type": "array",
+            "maxItems": MAX_DIAGNOSES,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "probability": {"type": "number", "minimum": 0, "maximum": 1},
+                    "reasons": {"type": "string"},
+                },
+                "required": ["name", "probability", "reasons"],
+            },
+        },
+        "medications": {"type": "array", "items": {"type": "string"}},
+        "doctor_note": {"type": "string"},
+        "disclaimer": {"type": "string"},
+    },
+    "required": [
+        "severity",
+        "care_level",
+        "red_flags",
+        "diagnoses",
+        "medications",
+        "doctor_note",
+        "disclaimer",
+    ],
+}
+
+# Fields the pipeline can act on before the rest of the object is generated
+EARLY_FIELDS = ("severity", "care_level", "red_flags")
+
+_SEVERITY_ALIASES = {
+    "mild": "low",
+    "moderate": "medium",
+    "severe": "high",
+    "critical": "emergency",
+    "urgent": "high",
+}
+_CARE_ALIASES = {
+    "self care": "self-care",
+    "home care": "self-care",
+    "doctor": "doctor-within-24h",
+    "doctor within 24h": "doctor-within-24h",
+    "see a doctor": "doctor-within-24h",
+    "emergency": "emergency-now",
+    "emergency now": "emergency-now",
+}
+
+
+def response_format() -> Dict[str, Any]:
+    """OpenAI-style ``response_format`` carrying ``DIAGNOSIS_SCHEMA``."""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": "diagnosis", "strict": True, "schema": DIAGNOSIS_SCHEMA},
+    }
+
+
+def validate(obj: Any) -> List[str]:
+    """Return a list of schema violations (empty when ``obj`` is valid)."""
+    if not isinstance(obj, dict):
+        return ["not an object"]
+
+    errors: List[str] = []
+    for key in DIAGNOSIS_SCHEMA["required"]:
+        if key not in obj:
+            errors.append(f"missing {key}")
+
+    if "severity" in obj and obj["severity"] not in SEVERITIES:
+        errors.append(f"bad severity {obj['severity']!r}")
+    if "care_level" in obj and obj["care_level"] not in CARE_LEVELS:
+        errors.append(f"bad care_level {obj['care_level']!r}")
+
+    diagnoses = obj.get("diagnoses", [])
+    if not isinstance(diagnoses, list):
+        errors.append("diagnoses is not a list")
+    else:
+        if len(diagnoses) > MAX_DIAGNOSES:
+            errors.append("too many diagnoses")
+        for i, d in enumerate(diagnoses):
+            if not isinstance(d, dict) or not isinstance(d.get("name"), str):
+                errors.append(f"diagnoses[{i}] malformed")
+                continue
+            p = d.get("probability")
+            if not isinstance(p, (int, float)) or isinstance(p, bool) or not 0 <= p <= 1:
+                errors.append(f"diagnoses[{i}].probability out of range")
+
+    for key in ("medications", "red_flags"):
+        value = obj.get(key, [])
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            errors.append(f"{key} is not a list of strings")
+    for key in ("doctor_note", "disclaimer"):
+        if key in obj and not isinstance(obj[key], str):
+            errors.append(f"{key} is not a string")
+    return errors
+
+
+def _enum(value: Any, allowed: Tuple[str, ...], aliases: Dict[str, str], default: str) -> str:
+    text = str(value or "").strip().lower().replace("_", "-")
+    if text in allowed:
+        return text
+    text = aliases.get(text.replace("-", " "), text)
+    return text if text in allowed else default
+
+
+def _strings(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value] if value.strip() else []
+    if isinstance(value, list):
+        return [v if isinstance(v, str) else json.dumps(v, ensure_ascii=False) for v in value if v]
+    return [str(value)]
+
+
+def _probability(value: Any) -> float:
+    try:
+        p = float(str(value).rstrip("%"))
+    except (TypeError, ValueError):
+        return 0.0
+    if p > 1 and p <= 100:
+        p /= 100.0
+    return min(max(p, 0.0), 1.0)
+
+
+def coerce(obj: Dict[str, Any]) -> Dict[str, Any]:
+    """Force a parsed object into the schema without another model call."""
+    diagnoses = obj.get("diagnoses")
+    if isinstance(diagnoses, dict):
+        diagnoses = [diagnoses]
+    if not isinstance(diagnoses, list):
+        diagnoses = []
+
+    fixed_diagnoses = []
+    for d in diagnoses[:MAX_DIAGNOSES]:
+        if isinstance(d, str):
+            d = {"name": d}
+        if not isinstance(d, dict) or not d.get("name"):
+            continue
+        fixed_diagnoses.append(
+            {
+                "name": str(d["name"]),
+                "probability": _probability(d.get("probability", 0)),
+                "reasons": str(d.get("reasons") or d.get("reason") or ""),
+            }
+        )
+
+    result = dict(obj)
+    result.update(
+        {
+            "diagnoses": fixed_diagnoses,
+            "severity": _enum(obj.get("severity"), SEVERITIES, _SEVERITY_ALIASES, "medium"),
+            "care_level": _enum(
+                obj.get("care_level"), CARE_LEVELS, _CARE_ALIASES, "doctor-within-24h"
+            ),
+            "medications": _strings(obj.get("medications")),
+            "red_flags": _strings(obj.get("red_flags")),
+            "doctor_note": str(obj.get("doctor_note") or ""),
+            "disclaimer": str(obj.get("disclaimer") or DEFAULT_DISCLAIMER),
+        }
+    )
+    return result
+
+
+def _extract(text: str) -> str:
+    """Strip a ```json fence / surrounding prose down to the object text."""
+    if "```" in text:
+        match = re.search(r"```(?:json)?\s*(.*?)(?:```|$)", text, re.S)
+        if match:
+            text = match.group(1)
+    start = text.find("{")
+    return text[start:].strip() if start >= 0 else text.strip()
+
+
+def _close_truncated(text: str) -> str:
+    """Close an object cut off mid-generation (open string, brackets, dangling key)."""
+    stack: List[str] = []
+    in_string = False
+    escape = False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+
+    if in_string:
+        text += '"'
+    # Drop a trailing key without a value and any dangling separator
+    text = re.sub(r',?\s*"[^"]*"\s*:\s*$', "", text)
+    text = re.sub(r"[,:]\s*$", "", text)
+    return text + "".join(reversed(stack))
+
+
+def _loads(text: str) -> Optional[Dict[str, Any]]:
+    try:
+        obj = json.loads(text)
+    except ValueError:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+def parse_diagnosis(text: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Parse reasoning output into a schema-valid dict.
+
+    Returns ``(obj, how)`` where ``how`` is ``ok``, ``coerce`` (parsed but had
+    to be normalized) or ``local`` (needed textual repair first). ``obj`` is
+    None when nothing usable could be recovered.
+    """
+    body = _extract(text or "")
+    obj = _loads(body)
+    how = "ok"
+    if obj is None:
+        # Trailing commas and truncation are the usual culprits
+        candidate = re.sub(r",\s*([}\]])", r"\1", body)
+        obj = _loads(candidate) or _loads(_close_truncated(candidate))
+        how = "local"
+        if obj is None:
+            return None, "failed"
+
+    if validate(obj):
+        obj = coerce(obj)
+        if how == "ok":
+            how = "coerce"
+    return obj, how
+
+
+class IncrementalJSONParser:
+    """Emit top-level ``(key, value)`` pairs of a streamed JSON object.
+
+    ``feed`` takes arbitrary text deltas and returns the fields whose values
+    have fully closed so far, so ``severity`` is available as soon as the
+    model has written it rather than when the whole object is done. Text
+    before the first ``{`` (e.g. a code fence) is ignored.
+    """
+
+    def __init__(self) -> None:
+        self._buf = ""
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._phase = "key"  # key -> colon -> value -> after
+        self._token_start = -1
+        self._key: Optional[str] = None
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+
+    def _emit(self, end: int, out: List[Tuple[str, Any]]) -> None:
+        raw = self._buf[self._token_start:end].strip()
+        self._phase = "after"
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return
+        if self._key is not None:
+            self.fields[self._key] = value
+            out.append((self._key, value))
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        out: List[Tuple[str, Any]] = []
+        if self.done or not chunk:
+            return out
+        self._buf += chunk
+        buf = self._buf
+
+        while self._pos < len(buf):
+            i = self._pos
+            ch = buf[i]
+            self._pos += 1
+
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._phase == "key":
+                        self._key = json.loads(buf[self._token_start:i + 1])
+                        self._phase = "colon"
+                    elif self._depth == 1 and self._phase == "value":
+                        self._emit(i + 1, out)
+                continue
+
+            if ch.isspace():
+                continue
+            if self._phase == "value" and self._token_start < 0:
+                self._token_start = i
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._phase == "key":
+                    self._token_start = i
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._phase == "value":
+                    self._emit(i + 1, out)
+                elif self._depth == 0:
+                    if self._phase == "value":
+                        self._emit(i, out)
+                    self.done = True
+                    break
+            elif self._depth == 1 and ch == ":" and self._phase == "colon":
+                self._phase = "value"
+                self._token_start = -1
+            elif self._depth == 1 and ch == ",":
+                if self._phase == "value":
+                    # numbers / true / false / null only close at the comma
+                    self._emit(i, out)
+                self._phase = "key"
+                self._token_start = -1
+        return out
+
+    @property
+    def text(self) -> str:
+        return self._buf
@@ -0,0 +1,95 @@
+"""Shared, pooled HTTP transport for local LLM servers.
+
+One keep-alive ``requests.Session`` is kept per endpoint origin
+(scheme://host:port), so every ``LLMClient`` talking to the same Ollama
+instance reuses the same connection pool instead of opening a new TCP
+connection per call.
+"""
+
+import socket
+import threading
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, Tuple
+from urllib.parse import urlsplit
+
+from src.core.config import config
+
+if TYPE_CHECKING:
+    import requests
+
+# ``requests`` is imported with the first session, not at startup
+_sessions: Dict[str, "requests.Session"] = {}
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _adapter_class():
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection
+
+    class _KeepAliveAdapter(HTTPAdapter):
+        """HTTPAdapter that turns on TCP keep-alive for pooled sockets."""
+
+        def init_poolmanager(self, *args, **kwargs):
+            if config.LLM_HTTP_KEEPALIVE:
+                options = list(HTTPConnection.default_socket_options)
+                options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+                kwargs["socket_options"] = options
+            super().init_poolmanager(*args, **kwargs)
+
+    return _KeepAliveAdapter
+
+
+def _origin(endpoint: str) -> str:
+    parts = urlsplit(endpoint)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _build_session() -> "requests.Session":
+    import requests
+
+    session = requests.Session()
+    adapter = _adapter_class()(
+        pool_connections=1,
+        pool_maxsize=config.LLM_POOL_MAXSIZE,
+        pool_block=config.LLM_POOL_BLOCK,
+        max_retries=0,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if not config.LLM_HTTP_KEEPALIVE:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def get_session(endpoint: str) -> "requests.Session":
+    """Return the shared session for the endpoint's origin, creating it once."""
+    origin = _origin(endpoint)
+    session = _sessions.get(origin)
+    if session is not None:
+        return session
+    with _lock:
+        session = _sessions.get(origin)
+        if session is None:
+            session = _build_session()
+            _sessions[origin] = session
+        return session
+
+
+def default_timeout() -> Tuple[float, float]:
+    return (config.LLM_CONNECT_TIMEOUT, config.LLM_READ_TIMEOUT)
+
+
+def post(endpoint: str, **kwargs: Any) -> "requests.Response":
+    """POST through the pooled session for ``endpoint``."""
+    kwargs.setdefault("timeout", default_timeout())
+    return get_session(endpoint).post(endpoint, **kwargs)
+
+
+def close_all() -> None:
+    """Close every pooled session (used on shutdown)."""
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
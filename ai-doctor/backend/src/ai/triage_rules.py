@@ -0,0 +1,403 @@
+"""Deterministic fast path for mild, unambiguous cases.
+
+A small symptom -> condition knowledge base is compiled once into bitmasks
+(one bit per canonical symptom, one mask per condition). Scoring a request
+is a handful of integer ANDs plus a weight lookup for the bits that match,
+so it runs in microseconds. The fast path only answers when every word of
+the symptoms and free text is understood, every reported symptom is
+explained, the evidence is specific enough, all plausible conditions agree
+on the care level and nothing looks like a red flag; everything else goes
+to the LLM as before.
+"""
+
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .emergency import EMERGENCY_PHRASES
+from .structured_output import DEFAULT_DISCLAIMER, SEVERITIES
+
+# Canonical symptom -> phrases that map onto it (English and Bangla)
+SYMPTOM_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "runny nose": ("runny nose", "rhinorrhea", "nasal discharge", "running nose", "নাক দিয়ে পানি পড়া", "সর্দি"),
+    "nasal congestion": ("nasal congestion", "stuffy nose", "blocked nose", "congestion", "নাক বন্ধ"),
+    "sneezing": ("sneezing", "sneeze", "sneezes", "হাঁচি"),
+    "sore throat": ("sore throat", "throat pain", "scratchy throat", "গলা ব্যথা"),
+    "cough": ("cough", "dry cough", "mild cough", "coughing", "কাশি"),
+    "fever": ("fever", "mild fever", "low grade fever", "low-grade fever", "জ্বর"),
+    "headache": ("headache", "head ache", "head pain", "মাথা ব্যথা"),
+    "itchy eyes": ("itchy eyes", "eye itching", "চোখ চুলকানো"),
+    "watery eyes": ("watery eyes", "teary eyes", "চোখ দিয়ে পানি পড়া"),
+    "red eye": ("red eye", "red eyes", "pink eye", "চোখ লাল"),
+    "eye discharge": ("eye discharge", "sticky eyes", "চোখে পিচুটি"),
+    "neck pain": ("neck pain", "sore neck", "ঘাড় ব্যথা"),
+    "light sensitivity": ("light sensitivity", "sensitivity to light", "photophobia"),
+    "nausea": ("nausea", "nauseous", "feeling sick", "বমি বমি ভাব"),
+    "vomiting": ("vomiting", "vomit", "throwing up", "বমি"),
+    "diarrhea": ("diarrhea", "diarrhoea", "loose stools", "loose motion", "পাতলা পায়খানা", "ডায়রিয়া"),
+    "stomach cramps": ("stomach cramps", "abdominal cramps", "cramps", "পেট কামড়ানো"),
+    "heartburn": ("heartburn", "acid reflux", "acidity", "বুক জ্বালা", "গ্যাস্ট্রিক"),
+    "bloating": ("bloating", "bloated", "gas", "পেট ফাঁপা"),
+    "muscle pain": ("muscle pain", "muscle ache", "body ache", "body aches", "sore muscles", "গা ব্যথা"),
+    "back pain": ("back pain", "lower back pain", "backache", "কোমর ব্যথা", "পিঠ ব্যথা"),
+    "itching": ("itching", "itchy skin", "itch", "চুলকানি"),
+    "rash": ("rash", "skin rash", "hives", "ফুসকুড়ি", "র‍্যাশ"),
+    "burning urination": ("burning urination", "painful urination", "burning when urinating", "প্রস্রাবে জ্বালা"),
+    "frequent urination": ("frequent urination", "urinating often", "ঘন ঘন প্রস্রাব"),
+    "lower abdominal pain": ("lower abdominal pain", "pelvic pain", "তলপেটে ব্যথা"),
+}
+
+# Warning signs that are not emergencies on their own but still need a clinician's judgement
+URGENT_TERMS: Tuple[str, ...] = (
+    "high fever",
+    "stiff neck",
+    "confusion",
+    "fainting",
+    "blood in stool",
+    "severe pain",
+    "severe abdominal pain",
+)
+
+# Phrases that always send a request to the LLM: every emergency phrase
+# (emergency.py owns that list and, from the API, the priority bump) plus the above
+RED_FLAG_TERMS: Tuple[str, ...] = (
+    tuple(phrase for phrases in EMERGENCY_PHRASES.values() for phrase in phrases) + URGENT_TERMS
+)
+
+# Modifiers that make an otherwise mild symptom unsafe to answer by rule
+ESCALATING_WORDS: Tuple[str, ...] = (
+    "severe",
+    "worst",
+    "unbearable",
+    "sudden",
+    "blood",
+    "bleeding",
+    "weeks",
+    "months",
+    "তীব্র",
+    "রক্ত",
+)
+
+# Filler words a symptom or free text may carry around the phrases it matches.
+# Any other leftover word ("vision loss", "2 month old", "no") is something
+# the rules do not understand, so the request goes to the LLM instead.
+STOPWORDS = frozenset(
+    (
+        "a an the and or with also i i'm i've im ive me my have has had having am is are was "
+        "been feel feeling felt got getting some bit little slight slightly mild mildly "
+        "since yesterday today tonight morning evening night this last"
+    ).split()
+    + ["এবং", "আর", "একটু", "হালকা", "আমার"]
+)
+
+# Each condition: symptom weights (1.0 = defining, lower = supporting)
+CONDITIONS: List[Dict[str, Any]] = [
+    {
+        "name": "Common cold",
+        "symptoms": {"runny nose": 1.0, "nasal congestion": 0.8, "sneezing": 0.8, "sore throat": 0.6, "cough": 0.5, "fever": 0.3, "headache": 0.2},
+        "severity": "low",
+        "care_level": "self-care",
+        "medications": ["paracetamol", "saline nasal spray"],
+        "advice": "Rest, drink plenty of fluids and use steam or saline to ease a blocked nose.",
+    },
+    {
+        "name": "Allergic rhinitis",
+        "symptoms": {"sneezing": 1.0, "itchy eyes": 1.0, "runny nose": 0.8, "watery eyes": 0.8, "nasal congestion": 0.6},
+        "severity": "low",
+        "care_level": "self-care",
+        "medications": ["antihistamine"],
+        "advice": "Avoid dust, smoke and other triggers; an over-the-counter antihistamine can help.",
+    },
+    {
+        "name": "Tension headache",
+        "symptoms": {"headache": 1.0, "neck pain": 0.5},
+        "severity": "low",
+        "care_level": "self-care",
+        "medications": ["paracetamol"],
+        "advice": "Rest, drink water, take regular breaks from screens and try to reduce stress.",
+    },
+    {
+        "name": "Migraine",
+        "symptoms": {"headache": 0.8, "light sensitivity": 1.0, "nausea": 0.6},
+        "severity": "low",
+        "care_level": "self-care",
+        "medications": ["paracetamol", "ibuprofen"],
+        "advice": "Rest in a dark, quiet room and drink water.",
+    },
+    {
+        "name": "Mild gastroenteritis",
+        "symptoms": {"diarrhea": 1.0, "stomach cramps": 0.7, "nausea": 0.6, "vomiting": 0.6, "fever": 0.2},
+        "severity": "low",
+        "care_level": "self-care",
+        "medications": ["oral rehydration salts"],
+        "advice": "Drink oral rehydration solution often in small sips and eat light food.",
+    },
+    {
+        "name": "Indigestion",
+        "symptoms": {"heartburn": 1.0, "bloating": 0.6, "nausea": 0.3},
+        "severity": "low",
+        "care_level": "self-care",
+        "medications": ["antacid"],
+        "advice": "Eat smaller meals, avoid spicy or oily food and do not lie down right after eating.",
+    },
+    {
+        "name": "Muscle strain",
+        "symptoms": {"muscle pain": 1.0, "back pain": 0.8, "neck pain": 0.5},
+        "severity": "low",
+        "care_level": "self-care",
+        "medications": ["paracetamol", "topical pain relief gel"],
+        "advice": "Rest the sore area, use a warm compress and stretch gently.",
+    },
+    {
+        "name": "Skin irritation or insect bite",
+        "symptoms": {"itching": 1.0, "rash": 0.8},
+        "severity": "low",
+        "care_level": "self-care",
+        "medications": ["antihistamine", "calamine lotion"],
+        "advice": "Keep the skin clean and dry and avoid scratching.",
+    },
+    {
+        "name": "Urinary tract infection",
+        "symptoms": {"burning urination": 1.0, "frequent urination": 0.8, "lower abdominal pain": 0.5, "fever": 0.2},
+        "severity": "medium",
+        "care_level": "doctor-within-24h",
+        "medications": [],
+        "advice": "Drink plenty of water; a doctor may need to test your urine and prescribe treatment.",
+    },
+    {
+        "name": "Conjunctivitis",
+        "symptoms": {"red eye": 1.0, "eye discharge": 1.0, "itchy eyes": 0.5, "watery eyes": 0.5},
+        "severity": "low",
+        "care_level": "doctor-within-24h",
+        "medications": [],
+        "advice": "Do not rub your eyes, wash your hands often and do not share towels.",
+    },
+]
+
+_WORD_SEP = re.compile(r"[\s,.;:!?/()]+")
+
+
+def _contains(text: str, phrase: str) -> bool:
+    """Whole-phrase containment on separator-normalized text."""
+    return f" {phrase} " in f" {text} "
+
+
+def _normalize(text: str) -> str:
+    return _WORD_SEP.sub(" ", text.lower()).strip()
+
+
+class TriageIndex:
+    """Precompiled bitmask index over ``CONDITIONS``."""
+
+    def __init__(
+        self,
+        min_confidence: float = 0.8,
+        min_evidence: float = 1.0,
+        max_free_text: int = 80,
+        conditions: Optional[List[Dict[str, Any]]] = None,
+        aliases: Optional[Dict[str, Tuple[str, ...]]] = None,
+        red_flags: Iterable[str] = RED_FLAG_TERMS,
+    ):
+        self.min_confidence = min_confidence
+        self.min_evidence = min_evidence
+        self.max_free_text = max_free_text
+        self.conditions = conditions or CONDITIONS
+        aliases = aliases or SYMPTOM_ALIASES
+
+        self._bits: Dict[str, int] = {name: i for i, name in enumerate(sorted(aliases))}
+        self._alias_to_bit: Dict[str, int] = {}
+        for name, phrases in aliases.items():
+            for phrase in (name,) + tuple(phrases):
+                self._alias_to_bit[_normalize(phrase)] = self._bits[name]
+        # Longest first, so "lower back pain" wins over "back pain"
+        self._phrases = sorted(self._alias_to_bit, key=len, reverse=True)
+        self._names = {bit: name for name, bit in self._bits.items()}
+        self._red_flags = tuple(_normalize(t) for t in red_flags) + ESCALATING_WORDS
+
+        self._masks: List[Tuple[int, List[float], float]] = []
+        for cond in self.conditions:
+            weights = [0.0] * len(self._bits)
+            mask = 0
+            for symptom, weight in cond["symptoms"].items():
+                bit = self._bits[symptom]
+                mask |= 1 << bit
+                weights[bit] = weight
+            self._masks.append((mask, weights, sum(weights)))
+
+        self._lock = threading.Lock()
+        self._outcomes: Dict[str, int] = {}
+
+    def _encode_symptom(self, text: str) -> Optional[int]:
+        """Bits for every phrase in ``text``; None if any other word is not filler."""
+        text = _normalize(text)
+        bit = self._alias_to_bit.get(text)
+        if bit is not None:
+            return 1 << bit
+        # "mild runny nose since yesterday" -> every phrase it contains
+        mask = 0
+        for phrase in self._phrases:
+            if _contains(text, phrase):
+                mask |= 1 << self._alias_to_bit[phrase]
+                text = f" {text} ".replace(f" {phrase} ", " ").strip()
+        if any(word not in STOPWORDS for word in text.split()):
+            return None
+        return mask
+
+    def _red_flags_in(self, texts: Iterable[str]) -> List[str]:
+        found = []
+        for text in texts:
+            text = _normalize(text)
+            found.extend(term for term in self._red_flags if _contains(text, term))
+        return found
+
+    def _count(self, outcome: str) -> None:
+        with self._lock:
+            self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+
+    def _score(self, mask: int) -> List[Tuple[float, float, float, int]]:
+        """``(score, explained, matched_weight, condition_index)`` per overlapping condition."""
+        scored = []
+        for i, (cond_mask, weights, total) in enumerate(self._masks):
+            hit = mask & cond_mask
+            if not hit:
+                continue
+            matched = 0.0
+            explained = 0
+            while hit:
+                low = hit & -hit
+                matched += weights[low.bit_length() - 1]
+                explained += 1
+                hit ^= low
+            # Fraction of the reported symptoms this condition explains,
+            # nudged up by how much of its profile is present
+            coverage = explained / bin(mask).count("1")
+            score = coverage * (0.7 + 0.3 * matched / total)
+            scored.append((score, coverage, matched, i))
+        scored.sort(reverse=True)
+        return scored
+
+    def assess(
+        self,
+        symptoms: List[str],
+        free_text: Optional[str],
+        context: Dict[str, Any],
+        image_info: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Return ``{"structured", "explanation", "confidence"}`` or None for the slow path."""
+        free_text = (free_text or "").strip()
+        if image_info or len(free_text) > self.max_free_text:
+            self._count("excluded")
+            return None
+        if context.get("known_conditions"):
+            self._count("excluded")
+            return None
+        age = context.get("age")
+        if age is not None and age != "":
+            try:
+                age = float(age)
+            except (TypeError, ValueError):
+                self._count("excluded")
+                return None
+            if not 2 <= age < 65:
+                self._count("excluded")
+                return None
+
+        if self._red_flags_in(list(symptoms) + [free_text]):
+            self._count("red_flag")
+            return None
+
+        mask = 0
+        for symptom in symptoms:
+            bits = self._encode_symptom(symptom)
+            if not bits:
+                self._count("unknown_symptom")
+                return None
+            mask |= bits
+        if free_text:
+            bits = self._encode_symptom(free_text)
+            if bits is None:
+                self._count("unknown_symptom")
+                return None
+            mask |= bits
+        if not mask:
+            self._count("no_symptoms")
+            return None
+
+        scored = self._score(mask)
+        if not scored:
+            self._count("unknown_symptom")
+            return None
+
+        _, top_coverage, top_matched, top = scored[0]
+        care_level = self.conditions[top]["care_level"]
+        total = sum(entry[0] for entry in scored)
+        agreeing = [entry for entry in scored if self.conditions[entry[3]]["care_level"] == care_level]
+        # Confidence is about the triage decision: the top condition explains
+        # every reported symptom and the alternatives would not change the care level
+        confidence = top_coverage * sum(entry[0] for entry in agreeing) / total
+
+        if top_matched < self.min_evidence:
+            self._count("low_evidence")
+            return None
+        if confidence < self.min_confidence:
+            self._count("low_confidence")
+            return None
+
+        self._count("hit")
+        return self._build(mask, agreeing[:3], confidence)
+
+    def _build(
+        self, mask: int, ranked: List[Tuple[float, float, float, int]], confidence: float
+    ) -> Dict[str, Any]:
+        total = sum(entry[0] for entry in ranked)
+        diagnoses = []
+        for score, _, _, i in ranked:
+            cond = self.conditions[i]
+            matched = [
+                self._names[b]
+                for b in range(len(self._bits))
+                if mask >> b & 1 and cond["symptoms"].get(self._names[b])
+            ]
+            diagnoses.append(
+                {
+                    "name": cond["name"],
+                    "probability": round(score / total, 2),
+                    "reasons": "Matches: " + ", ".join(matched) + ".",
+                }
+            )
+
+        top = self.conditions[ranked[0][3]]
+        severity = max(
+            (self.conditions[entry[3]]["severity"] for entry in ranked), key=SEVERITIES.index
+        )
+        structured = {
+            "severity": severity,
+            "care_level": top["care_level"],
+            "red_flags": [],
+            "diagnoses": diagnoses,
+            "medications": list(top["medications"]),
+            "doctor_note": f"Rule-based triage: pattern consistent with {top['name'].lower()}.",
+            "disclaimer": DEFAULT_DISCLAIMER,
+            "source": "rules",
+            "confidence": round(confidence, 3),
+        }
+        see_doctor = (
+            "Please see a doctor within a day."
+            if top["care_level"] == "doctor-within-24h"
+            else "See a doctor if you get worse or are not better in a few days."
+        )
+        explanation = (
+            f"Your symptoms most likely point to {top['name'].lower()}. {top['advice']} "
+            f"This is an automatic assessment and may not be accurate. {see_doctor}"
+        )
+        return {"structured": structured, "explanation": explanation, "confidence": confidence}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            outcomes = dict(self._outcomes)
+        total = sum(outcomes.values())
+        return {
+            "outcomes": outcomes,
+            "total": total,
+            "coverage": round(outcomes.get("hit", 0) / total, 4) if total else 0.0,
+        }
@@ -1,28 +1,85 @@
 # backend/src/api/routes.py
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from datetime import datetime
-
-from src.ai.diagnosis_orchestrator import DiagnosisOrchestrator
-from src.core.runtime_config import runtime_config, set_model
+import asyncio
+import json
+import os
+import time
+from typing import Optional
+
+from src.ai.diagnosis_orchestrator import get_orchestrator, peek_orchestrator
+from src.ai import endpoint_pool
+from src.ai.emergency import EmergencyDetector
+from src.ai.image_pipeline import ImageDecodeError
+from src.ai.model_manager import ModelManager
+from src.core.config import config
+from src.core import lifecycle, metrics
+from src.core.bulk import run_bulk
+from src.core import logger as logging_setup
+from src.core.jobs import jobs
+from src.core.logger import logger
+from src.core.request_context import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_EMERGENCY,
+    PRIORITY_NORMAL,
+    get_request_id,
+    set_priority,
+    start_request,
+)
+from src.core.runtime_config import get_models as current_models, get_plan, set_model
+from src.core.scheduler import QueueFullError, all_stats
 
 from werkzeug.utils import secure_filename
 
 
-orchestrator = DiagnosisOrchestrator()
+# The orchestrator is built on first use (see get_orchestrator), so importing
+# this module and answering health checks stays cheap
+model_manager = ModelManager(get_orchestrator)
 
 # 1) Define the main API blueprint FIRST
 api_bp = Blueprint("api", __name__, url_prefix="/api/v1")
 
 # 2) Main API routes
 
+# Requests with emergency red flags jump the LLM wait queue
+_red_flags: Optional[EmergencyDetector] = None
+
+
+def _red_flag_detector() -> EmergencyDetector:
+    # Reuse the orchestrator's automaton; build one here if the short-circuit is disabled
+    global _red_flags
+    if _red_flags is None:
+        _red_flags = get_orchestrator().emergency or EmergencyDetector()
+    return _red_flags
+
+
+def _is_red_flag(data: dict) -> bool:
+    if data.get("emergency") is True:
+        return True
+    symptoms = [s for s in data.get("symptoms") or [] if isinstance(s, str)]
+    return bool(_red_flag_detector().detect(symptoms + [data.get("description")]))
+
+
+@api_bp.errorhandler(QueueFullError)
+def handle_queue_full(err: QueueFullError):
+    # Queue full -> 429 (back off); waited too long -> 503 (overloaded)
+    status = 429 if err.reason == "queue_full" else 503
+    resp = jsonify({"status": "error", "message": str(err), "reason": err.reason})
+    resp.status_code = status
+    resp.headers["Retry-After"] = str(err.retry_after)
+    return resp
+
 
 @api_bp.route("/health/status", methods=["GET"])
 def health_status():
+    models = model_manager.status()
     return (
         jsonify(
             {
                 "status": "healthy",
+                "ready": models["ready"],
+                "models": models["models"],
                 "timestamp": datetime.utcnow().isoformat(),
             }
         ),
@@ -30,31 +87,237 @@ def health_status():
     )
 
 
+@api_bp.route("/health/ready", methods=["GET"])
+def health_ready():
+    """Readiness probe: 200 once models are warm, 503 while loading or draining."""
+    draining = lifecycle.shutting_down.is_set()
+    models_ready = model_manager.ready() if config.MODEL_WARMUP else True
+    ready = models_ready and not draining
+    body = {
+        "ready": ready,
+        "models_ready": models_ready,
+        "draining": draining,
+        "pid": os.getpid(),
+    }
+    return jsonify(body), 200 if ready else 503
+
+
+def _analyze_kwargs(data: dict) -> dict:
+    """Map an /symptom/analyze request body onto DiagnosisOrchestrator.analyze kwargs."""
+    return {
+        "symptoms": data.get("symptoms") or [],
+        "free_text": data.get("description"),
+        "context": {
+            "age": data.get("age"),
+            "gender": data.get("gender"),
+            "known_conditions": data.get("known_conditions", []),
+            "region": data.get("region"),
+        },
+        "language": data.get("language", "en"),
+        "image_description": data.get("image_description"),
+    }
+
+
 @api_bp.route("/symptom/analyze", methods=["POST"])
 def analyze_symptoms():
     data = request.get_json(silent=True) or {}
-    symptoms = data.get("symptoms") or []
-    free_text = data.get("description")
-    language = data.get("language", "en")
-
-    context = {
-        "age": data.get("age"),
-        "gender": data.get("gender"),
-        "known_conditions": data.get("known_conditions", []),
-        "region": data.get("region"),
-    }
+    set_priority(PRIORITY_EMERGENCY if _is_red_flag(data) else PRIORITY_NORMAL)
+    return jsonify(_run_analyze(data)), 200
+
+
+def _run_analyze(data: dict) -> dict:
+    kwargs = _analyze_kwargs(data)
+    # Optional "languages": ["en", "bn"] fans the explanation out concurrently
+    languages = data.get("languages")
+    if isinstance(languages, list) and languages:
+        kwargs.pop("language")
+        langs = [l for l in languages if isinstance(l, str)]
+        return asyncio.run(get_orchestrator().analyze_async(languages=langs, **kwargs))
+    return get_orchestrator().analyze(**kwargs)
+
+
+def _job_response(job: dict):
+    job = dict(job)
+    job["status_url"] = f"{api_bp.url_prefix}/jobs/{job['job_id']}"
+    status = 202 if job["status"] in ("queued", "running") else 200
+    return jsonify(job), status
+
+
+@api_bp.route("/jobs/analyze", methods=["POST"])
+def submit_analyze_job():
+    """Same input as /symptom/analyze; returns 202 with a job id immediately."""
+    data = request.get_json(silent=True) or {}
+    set_priority(PRIORITY_EMERGENCY if _is_red_flag(data) else PRIORITY_NORMAL)
+    job = jobs.submit(_run_analyze, data, kind="analyze")
+    return _job_response(job)
 
-    image_description = data.get("image_description")
 
-    result = orchestrator.analyze(
-        symptoms=symptoms,
-        free_text=free_text,
-        context=context,
-        language=language,
-        image_description=image_description,
+@api_bp.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Job state; ``?wait=<seconds>`` long-polls until it finishes (capped by JOB_MAX_WAIT)."""
+    try:
+        wait = min(float(request.args.get("wait", 0)), config.JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({"status": "error", "message": "wait must be a number"}), 400
+
+    job = jobs.wait(job_id, wait) if wait > 0 else jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "unknown or expired job_id"}), 404
+    return _job_response(job)
+
+
+@api_bp.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "unknown or expired job_id"}), 404
+    return _job_response(job)
+
+
+@api_bp.route("/symptom/followup/<followup_id>", methods=["GET"])
+def symptom_followup(followup_id):
+    """Full LLM analysis started in the background by an emergency short-circuit."""
+    job = jobs.get(followup_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "unknown or expired followup_id"}), 404
+    if job["status"] == "done":
+        return jsonify(job["result"]), 200
+    if job["status"] in ("queued", "running"):
+        return jsonify({"status": "pending", "job_id": followup_id}), 202
+    return jsonify({"status": job["status"], "error": job.get("error")}), 500
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@api_bp.route("/symptom/analyze/stream", methods=["POST"])
+def analyze_symptoms_stream():
+    """Same input as /symptom/analyze, streamed back as Server-Sent Events."""
+    data = request.get_json(silent=True) or {}
+    kwargs = _analyze_kwargs(data)
+    priority = PRIORITY_EMERGENCY if _is_red_flag(data) else PRIORITY_NORMAL
+
+    def generate():
+        set_priority(priority)
+        # Flush headers immediately so the client sees the first byte
+        yield ": stream-open\n\n"
+        try:
+            for event, payload in get_orchestrator().analyze_stream(**kwargs):
+                yield _sse(event, payload)
+        except QueueFullError as e:
+            yield _sse(
+                "error",
+                {"status": "error", "message": str(e), "reason": e.reason, "retry_after": e.retry_after},
+            )
+        except Exception as e:
+            yield _sse("error", {"status": "error", "message": str(e)})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(
+        stream_with_context(generate()), mimetype="text/event-stream", headers=headers
     )
 
-    return jsonify(result), 200
+
+def _batch_concurrency() -> int:
+    if config.BATCH_CONCURRENCY > 0:
+        return config.BATCH_CONCURRENCY
+    # One case explaining while another reasons on each reasoning slot
+    return 2 * endpoint_pool.get_pool(config.QWEN_REASONING_ENDPOINT).total_slots()
+
+
+def _batch_error(err: BaseException) -> dict:
+    if isinstance(err, QueueFullError):
+        return {"error": str(err), "reason": err.reason, "retry_after": err.retry_after}
+    if isinstance(err, ValueError):
+        return {"error": str(err), "reason": "invalid_case"}
+    return {"error": f"{type(err).__name__}: {err}", "reason": "failed"}
+
+
+@api_bp.route("/symptom/analyze/batch", methods=["POST"])
+def analyze_symptoms_batch():
+    """Bulk triage: one /symptom/analyze body per JSONL line, results streamed back as JSONL.
+
+    Cases run with bounded concurrency (``BATCH_CONCURRENCY``) at background
+    priority, red flags excepted, so a clinic sync does not hold up
+    interactive requests. Each output line carries the case's ``case_id``
+    (its ``case_id``/``id`` field, else its line number) and comes out as
+    soon as the case finishes. A bad or failing case yields an error line
+    and the batch carries on; a final ``summary`` line closes the stream.
+    """
+    stream = request.stream
+    batch_id = get_request_id()
+    truncated = {"reason": None}
+
+    def cases():
+        line_no = 0
+        for raw in stream:
+            line = raw.strip()
+            if not line:
+                continue
+            line_no += 1
+            if line_no > config.BATCH_MAX_CASES:
+                truncated["reason"] = "max_cases"
+                return
+            try:
+                case = json.loads(line)
+                if not isinstance(case, dict):
+                    raise ValueError("each line must be a JSON object")
+            except ValueError as e:
+                case = ValueError(f"line {line_no}: {e}")
+            yield line_no, case
+
+    def run_case(item):
+        line_no, case = item
+        if isinstance(case, Exception):
+            raise case
+        # Per-case correlation id so its log lines can be told apart
+        start_request(f"{batch_id}.{line_no}")
+        set_priority(PRIORITY_EMERGENCY if _is_red_flag(case) else PRIORITY_BACKGROUND)
+        return _run_analyze(case)
+
+    def draining() -> bool:
+        if lifecycle.shutting_down.is_set():
+            truncated["reason"] = "shutting_down"
+            return True
+        return False
+
+    def generate():
+        started = time.perf_counter()
+        counts = {"ok": 0, "failed": 0}
+        try:
+            for (line_no, case), result, error in run_bulk(
+                cases(), run_case, _batch_concurrency(), kind="analyze", should_stop=draining
+            ):
+                case_id = case.get("case_id", case.get("id", line_no)) if isinstance(case, dict) else line_no
+                record = {"case_id": case_id, "line": line_no}
+                if error is None:
+                    counts["ok"] += 1
+                    record.update(status="ok", result=result)
+                else:
+                    counts["failed"] += 1
+                    record.update(status="error", **_batch_error(error))
+                    if not isinstance(error, ValueError):
+                        logger.warning("Batch %s case %s failed: %s", batch_id, case_id, error)
+                yield json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        except Exception as e:
+            # The upload itself broke (e.g. the client went away); report what we can
+            logger.warning("Batch %s aborted: %s", batch_id, e)
+            truncated["reason"] = f"input_error: {type(e).__name__}"
+        summary = {
+            "batch_id": batch_id,
+            "cases": counts["ok"] + counts["failed"],
+            "ok": counts["ok"],
+            "failed": counts["failed"],
+            "truncated": truncated["reason"],
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        yield json.dumps({"summary": summary}) + "\n"
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(
+        stream_with_context(generate()), mimetype="application/x-ndjson", headers=headers
+    )
 
 
 # 3) Admin blueprint for runtime model control
@@ -65,29 +328,82 @@ admin_bp = Blueprint("admin", __name__, url_prefix="/api/v1/admin")
 @admin_bp.route("/models", methods=["GET"])
 def get_models():
     """Return current active model names."""
-    return jsonify({"status": "success", "models": runtime_config}), 200
+    return jsonify({"status": "success", "models": current_models()}), 200
 
 
 @admin_bp.route("/models", methods=["POST"])
 def update_models():
-    """Update one or more model names at runtime."""
+    """Update one or more model names at runtime.
+
+    Each new model is warmed up before the switch takes effect; if it does not
+    answer, nothing is switched unless "force": true is given.
+    """
     data = request.get_json(silent=True) or {}
 
-    changed = {}
+    requested = {}
     for key in ["REASONING_MODEL", "EXPLAIN_MODEL", "VISION_MODEL"]:
         if key in data and isinstance(data[key], str) and data[key].strip():
-            set_model(key, data[key].strip())
-            changed[key] = data[key].strip()
+            requested[key] = data[key].strip()
+
+    failed = [
+        key
+        for key, model in requested.items()
+        if model != current_models().get(key) and not model_manager.prewarm(key, model)
+    ]
+    if failed and not data.get("force"):
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "message": "Model warm-up failed; nothing was switched",
+                    "failed": {key: requested[key] for key in failed},
+                    "current": current_models(),
+                }
+            ),
+            502,
+        )
+
+    changed = {}
+    for key, model in requested.items():
+        set_model(key, model)
+        changed[key] = model
+
+    if changed:
+        get_orchestrator().apply_models()
 
     return (
-        jsonify({"status": "success", "updated": changed, "current": runtime_config}),
+        jsonify({"status": "success", "updated": changed, "current": current_models()}),
         200,
     )
 
 
+@admin_bp.route("/cache", methods=["GET"])
+def get_cache_stats():
+    """Return response and image cache hit/miss counters."""
+    orchestrator = get_orchestrator()
+    response_cache = orchestrator.cache.stats() if orchestrator.cache is not None else None
+    image_cache = orchestrator.image_cache.stats() if orchestrator.image_cache is not None else None
+    return jsonify({"status": "success", "response_cache": response_cache, "image_cache": image_cache}), 200
+
+
+@admin_bp.route("/cache", methods=["DELETE"])
+def clear_cache():
+    """Drop every cached LLM response and image assessment."""
+    orchestrator = get_orchestrator()
+    if orchestrator.cache is not None:
+        orchestrator.cache.clear()
+    if orchestrator.image_cache is not None:
+        orchestrator.image_cache.clear()
+    return jsonify({"status": "success"}), 200
+
+
 @api_bp.route("/image/analyze", methods=["POST"])
 def analyze_image():
     """Analyze a medical image (rash, wound, swelling, etc.)."""
+    # Reject oversized uploads before Werkzeug parses the multipart body
+    if request.content_length is not None and request.content_length > config.MAX_UPLOAD_BYTES:
+        return jsonify({"error": f"File too large (max {config.MAX_UPLOAD_BYTES} bytes)"}), 413
+
     if "file" not in request.files:
         return jsonify({"error": "No file uploaded (expected 'file' field)"}), 400
 
@@ -96,13 +412,13 @@ def analyze_image():
         return jsonify({"error": "Empty filename"}), 400
 
     try:
-        image_bytes = file.read()
+        image_bytes = file.stream.read(config.MAX_UPLOAD_BYTES + 1)
         if not image_bytes:
             return jsonify({"error": "Empty file"}), 400
+        if len(image_bytes) > config.MAX_UPLOAD_BYTES:
+            return jsonify({"error": f"File too large (max {config.MAX_UPLOAD_BYTES} bytes)"}), 413
 
-        from src.ai.diagnosis_orchestrator import analyze_image_with_ollama
-
-        result = analyze_image_with_ollama(image_bytes)
+        result = get_orchestrator().analyze_image(image_bytes)
 
         return (
             jsonify(
@@ -113,21 +429,135 @@ def analyze_image():
             ),
             200,
         )
+    except ImageDecodeError as e:
+        return jsonify({"error": str(e)}), 400
+    except QueueFullError:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    
+
+
+def _collect_runtime_metrics():
+    # A scrape must not build the orchestrator; before it exists there is nothing to report
+    orchestrator = peek_orchestrator()
+    if orchestrator is not None and orchestrator.cache is not None:
+        stats = orchestrator.cache.stats()
+        yield (
+            "aidoctor_cache_hits_total",
+            "counter",
+            "Response cache hits by tier.",
+            [({"tier": "memory"}, stats["memory_hits"]), ({"tier": "disk"}, stats["disk_hits"])],
+        )
+        yield ("aidoctor_cache_misses_total", "counter", "Response cache misses.", [({}, stats["misses"])])
+        yield ("aidoctor_cache_entries", "gauge", "Entries in the in-memory response cache.", [({}, stats["memory_entries"])])
+
+    if orchestrator is not None and orchestrator.image_cache is not None:
+        stats = orchestrator.image_cache.stats()
+        yield (
+            "aidoctor_image_cache_hits_total",
+            "counter",
+            "Perceptual image cache hits by match type.",
+            [({"match": "exact"}, stats["exact_hits"]), ({"match": "near"}, stats["near_hits"])],
+        )
+        yield ("aidoctor_image_cache_misses_total", "counter", "Perceptual image cache misses.", [({}, stats["misses"])])
+        yield ("aidoctor_image_cache_entries", "gauge", "Entries in the perceptual image cache.", [({}, stats["entries"])])
+
+    if orchestrator is not None and orchestrator.triage is not None:
+        stats = orchestrator.triage.stats()
+        yield (
+            "aidoctor_fast_path_total",
+            "counter",
+            "Rule-based triage outcomes (hit = answered without the LLM).",
+            [({"outcome": k}, v) for k, v in sorted(stats["outcomes"].items())],
+        )
+        yield ("aidoctor_fast_path_coverage_ratio", "gauge", "Share of requests answered by the fast path.", [({}, stats["coverage"])])
+
+    job_stats = jobs.stats()
+    yield ("aidoctor_job_queue_depth", "gauge", "Background jobs waiting for a worker.", [({}, job_stats["queue_depth"])])
+    yield ("aidoctor_jobs_running", "gauge", "Background jobs currently running.", [({}, job_stats["running"])])
+
+    queues = all_stats()
+    yield (
+        "aidoctor_llm_queue_depth",
+        "gauge",
+        "Requests waiting for an LLM slot.",
+        [({"endpoint": q["endpoint"]}, q["queue_depth"]) for q in queues],
+    )
+    yield (
+        "aidoctor_llm_active_slots",
+        "gauge",
+        "LLM slots currently in use.",
+        [({"endpoint": q["endpoint"]}, q["active"]) for q in queues],
+    )
+    yield (
+        "aidoctor_llm_rejected_total",
+        "counter",
+        "Requests rejected by admission control.",
+        [({"endpoint": q["endpoint"]}, q["rejected"] + q["timed_out"]) for q in queues],
+    )
+
+    yield (
+        "aidoctor_log_records_dropped_total",
+        "counter",
+        "Log records dropped because the async log queue was full.",
+        [({}, logging_setup.dropped())],
+    )
+
+    replicas = endpoint_pool.all_stats()
+    yield (
+        "aidoctor_llm_replica_up",
+        "gauge",
+        "1 if the LLM replica is healthy and its circuit is not open.",
+        [({"endpoint": r["url"]}, int(r["healthy"] and r["breaker"] != "open")) for r in replicas],
+    )
+    yield (
+        "aidoctor_llm_replica_outstanding",
+        "gauge",
+        "Requests queued or running on each LLM replica.",
+        [({"endpoint": r["url"]}, r["outstanding"]) for r in replicas],
+    )
+
+
+metrics.registry.register_collector(_collect_runtime_metrics)
+
+
+@api_bp.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus scrape endpoint."""
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@api_bp.route("/system/queues", methods=["GET"])
+def system_queues():
+    """Queue depth, active slots and wait times per LLM endpoint, replica health, plus background jobs."""
+    return (
+        jsonify(
+            {
+                "status": "success",
+                "endpoints": all_stats(),
+                "replicas": endpoint_pool.all_stats(),
+                "jobs": jobs.stats(),
+            }
+        ),
+        200,
+    )
+
+
 @api_bp.route("/system/profile", methods=["GET"])
 def system_profile():
-    from src.system.capabilities import classify_machine, get_total_ram_gb
-    from src.system.model_planner import plan_models
-
-    tier = classify_machine()
-    ram_gb = round(get_total_ram_gb(), 1)
-    models = plan_models()
+    """Live model plan: probed resources, chosen models and why."""
+    plan = get_plan()
 
     return jsonify({
-        "tier": tier,
-        "ram_gb": ram_gb,
-        "models": models,
+        "tier": plan["tier"],
+        "ram_gb": round(plan["resources"]["total_ram_gb"], 1),
+        "resources": plan["resources"],
+        "models": plan["active"],
+        "planned_models": plan["models"],
+        "pinned": plan["pinned"],
+        "footprints_gb": plan["footprints_gb"],
+        "estimated_footprint_gb": plan["estimated_footprint_gb"],
+        "budget_gb": plan["budget_gb"],
+        "reasons": plan["reasons"],
+        "planned_at": datetime.utcfromtimestamp(plan["planned_at"]).isoformat(),
     }), 200
-
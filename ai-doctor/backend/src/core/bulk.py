@@ -0,0 +1,65 @@
+"""Bounded-parallel processing of a stream of work items.
+
+``run_bulk`` pulls items from an iterator only as fast as workers free up,
+so a long upload is consumed while earlier items are already running and is
+never buffered whole. At most ``concurrency`` items are in flight, outcomes
+are yielded in completion order, and an item that raises yields an error
+outcome instead of aborting the rest.
+"""
+
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+from src.core.metrics import registry
+
+BULK_ITEMS = registry.counter(
+    "aidoctor_bulk_items_total", "Items processed by bulk requests, by outcome.", ("kind", "status")
+)
+
+T = TypeVar("T")
+
+
+def run_bulk(
+    items: Iterable[T],
+    fn: Callable[[T], Any],
+    concurrency: int,
+    kind: str = "analyze",
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> Iterator[Tuple[T, Any, Optional[BaseException]]]:
+    """Yield ``(item, result, error)`` for each item as soon as it finishes.
+
+    Each item runs in a copy of the caller's context (correlation id,
+    priority), which ``fn`` may adjust per item. ``should_stop`` is checked
+    before each new item is taken; once it returns True no more are started
+    and the generator ends after the in-flight ones. Closing the generator
+    early cancels items that have not started.
+    """
+    concurrency = max(1, concurrency)
+    source = iter(items)
+    pending: Dict[Future, T] = {}
+    exhausted = False
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"bulk-{kind}")
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                if should_stop is not None and should_stop():
+                    exhausted = True
+                    break
+                try:
+                    item = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+                ctx = contextvars.copy_context()
+                pending[pool.submit(ctx.run, fn, item)] = item
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                error = future.exception()
+                BULK_ITEMS.inc(kind=kind, status="failed" if error else "ok")
+                yield item, (None if error else future.result()), error
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
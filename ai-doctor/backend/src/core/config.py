@@ -11,7 +11,8 @@ load_dotenv(os.path.join(BASE_DIR, ".env"))
 class Config:
     """Central config loaded from environment variables."""
 
-    DEBUG = os.getenv("DEBUG", "True").lower() == "true"
+    # Development only; production runs under gunicorn (see gunicorn.conf.py)
+    DEBUG = os.getenv("DEBUG", "False").lower() == "true"
 
     # Flask
     API_HOST = os.getenv("API_HOST", "0.0.0.0")
@@ -19,7 +20,8 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key")
 
     # Local LLM endpoints (Ollama-style)
-    # Adjust if you run different ports or servers
+    # Adjust if you run different ports or servers; a comma-separated list
+    # spreads a role over several replicas (see src/ai/endpoint_pool.py)
     QWEN_REASONING_ENDPOINT = os.getenv("QWEN_REASONING_ENDPOINT", "http://localhost:11434/v1/chat/completions")
     QWEN_REASONING_MODEL = os.getenv("QWEN_REASONING_MODEL", "qwen3:8b")
 
@@ -30,13 +32,121 @@ class Config:
     QWEN_VL_ENDPOINT = os.getenv("QWEN_VL_ENDPOINT", "http://localhost:11434/v1/chat/completions")
     QWEN_VL_MODEL = os.getenv("QWEN_VL_MODEL", "qwen2.5-vl:7b")
 
+    # "http" = OpenAI-compatible server above; "llamacpp" = in-process llama.cpp
+    # over the GGUF files in src/llm/model_registry.py (needs llama-cpp-python)
+    LLM_BACKEND = os.getenv("LLM_BACKEND", "http").lower()
+    LLAMACPP_N_CTX = int(os.getenv("LLAMACPP_N_CTX", 4096))
+    LLAMACPP_N_THREADS = int(os.getenv("LLAMACPP_N_THREADS", 0))
+    LLAMACPP_N_GPU_LAYERS = int(os.getenv("LLAMACPP_N_GPU_LAYERS", 0))
+
     USE_LLM_REASONING = os.getenv("USE_LLM_REASONING", "True").lower() == "true"
     USE_LLM_EXPLANATION = os.getenv("USE_LLM_EXPLANATION", "True").lower() == "true"
     USE_VL_IMAGES = os.getenv("USE_VL_IMAGES", "True").lower() == "true"
 
+    # Seconds between live resource probes / model re-plans (0 = plan once at startup)
+    MODEL_REPLAN_INTERVAL = float(os.getenv("MODEL_REPLAN_INTERVAL", 60))
+    # Admin model pins shared between worker processes (empty = this process only)
+    MODEL_OVERRIDES_FILE = os.getenv("MODEL_OVERRIDES_FILE", "")
+    MODEL_SYNC_INTERVAL = float(os.getenv("MODEL_SYNC_INTERVAL", 2))
+
+    # Model warm-up at startup and keep-alive pings (0 interval = no pings);
+    # MODEL_KEEP_ALIVE is forwarded to servers that understand it (Ollama)
+    MODEL_WARMUP = os.getenv("MODEL_WARMUP", "True").lower() == "true"
+    MODEL_KEEP_ALIVE = os.getenv("MODEL_KEEP_ALIVE", "30m")
+    MODEL_KEEPALIVE_INTERVAL = float(os.getenv("MODEL_KEEPALIVE_INTERVAL", 240))
+
+    # Image uploads: hard size limit, and the resolution/encoding sent to the vision model
+    MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+    VISION_IMAGE_MAX_SIDE = int(os.getenv("VISION_IMAGE_MAX_SIDE", 768))
+    VISION_IMAGE_FORMAT = os.getenv("VISION_IMAGE_FORMAT", "JPEG")
+    VISION_IMAGE_QUALITY = int(os.getenv("VISION_IMAGE_QUALITY", 85))
+
+    # Near-duplicate image cache (dHash Hamming distance, 0-64)
+    IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "True").lower() == "true"
+    IMAGE_CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", 1024))
+    IMAGE_CACHE_MAX_DISTANCE = int(os.getenv("IMAGE_CACHE_MAX_DISTANCE", 6))
+
+    # Pooled HTTP transport to the LLM servers (one pool per endpoint origin)
+    LLM_POOL_MAXSIZE = int(os.getenv("LLM_POOL_MAXSIZE", 10))
+    LLM_POOL_BLOCK = os.getenv("LLM_POOL_BLOCK", "True").lower() == "true"
+    LLM_HTTP_KEEPALIVE = os.getenv("LLM_HTTP_KEEPALIVE", "True").lower() == "true"
+    LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+    LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", 60))
+
+    # Admission control per LLM endpoint (0 concurrency = size from machine tier)
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 0))
+    LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 16))
+    LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 30))
+
+    # Multi-replica endpoints: health probes (0 interval = off), circuit breaker
+    # (0 failures = off) and hedging a slow request to a second replica (0 = off)
+    LLM_HEALTH_INTERVAL = float(os.getenv("LLM_HEALTH_INTERVAL", 5))
+    LLM_HEALTH_PATH = os.getenv("LLM_HEALTH_PATH", "/v1/models")
+    LLM_HEALTH_TIMEOUT = float(os.getenv("LLM_HEALTH_TIMEOUT", 2))
+    LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 3))
+    LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 15))
+    LLM_HEDGE_AFTER_MS = float(os.getenv("LLM_HEDGE_AFTER_MS", 0))
+
+    # Prompt-prefix reuse: send cache_prompt/keep_alive to HTTP servers, and keep
+    # a RAM cache of evaluated prefixes for the in-process backend
+    PROMPT_CACHE = os.getenv("PROMPT_CACHE", "True").lower() == "true"
+    LLAMACPP_PROMPT_CACHE_MB = int(os.getenv("LLAMACPP_PROMPT_CACHE_MB", 512))
+
+    # Emergency short-circuit: answer red-flag cases before any LLM call and
+    # run the full analysis as a background job (fetch it by followup_id)
+    EMERGENCY_SHORTCIRCUIT = os.getenv("EMERGENCY_SHORTCIRCUIT", "True").lower() == "true"
+    EMERGENCY_NUMBER = os.getenv("EMERGENCY_NUMBER", "999")
+    EMERGENCY_LATENCY_BUDGET_MS = float(os.getenv("EMERGENCY_LATENCY_BUDGET_MS", 50))
+    EMERGENCY_FOLLOWUP = os.getenv("EMERGENCY_FOLLOWUP", "True").lower() == "true"
+
+    # Seconds a stopping worker waits for running jobs before exiting
+    SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", 30))
+
+    # Background jobs (async analyze API and emergency follow-ups). JOB_DB
+    # shares results between processes; empty = in-memory only
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+    JOB_MAX_QUEUE = int(os.getenv("JOB_MAX_QUEUE", 64))
+    JOB_TTL = float(os.getenv("JOB_TTL", 3600))
+    JOB_MAX_ENTRIES = int(os.getenv("JOB_MAX_ENTRIES", 1000))
+    JOB_DB = os.getenv("JOB_DB", "")
+    JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", 30))
+
+    # Bulk triage (/symptom/analyze/batch): cases in flight per batch request
+    # (0 = two per reasoning LLM slot) and the most cases one request may carry
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 0))
+    BATCH_MAX_CASES = int(os.getenv("BATCH_MAX_CASES", 1000))
+
+    # Rule-based fast path: answer mild, unambiguous cases without the LLM
+    FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "True").lower() == "true"
+    FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", 0.8))
+    FAST_PATH_MIN_EVIDENCE = float(os.getenv("FAST_PATH_MIN_EVIDENCE", 1.0))
+    FAST_PATH_MAX_FREE_TEXT = int(os.getenv("FAST_PATH_MAX_FREE_TEXT", 80))
+
+    # Constrain reasoning output with a JSON schema (response_format) and allow
+    # at most this many short repair calls when the output still fails validation
+    STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "True").lower() == "true"
+    REASONING_REPAIR_ATTEMPTS = int(os.getenv("REASONING_REPAIR_ATTEMPTS", 1))
+    REASONING_REPAIR_MAX_TOKENS = int(os.getenv("REASONING_REPAIR_MAX_TOKENS", 512))
+
+    # Response cache for reasoning/explanation stages (empty DB path = memory only)
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "True").lower() == "true"
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 512))
+    RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 6 * 3600))
+    RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB", "")
+    RESPONSE_CACHE_DISK_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_DISK_MAX_ENTRIES", 10000))
+
     # Logging
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
     LOG_FILE = os.getenv("LOG_FILE", os.path.join(BASE_DIR, "logs", "aidoctor.log"))
+    # "text" or "json" (one object per line); async = write from a background thread
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+    LOG_ASYNC = os.getenv("LOG_ASYNC", "True").lower() == "true"
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+    # Per message template: full logs per window, then suppressed (0 = no limit)
+    LOG_ERROR_BURST = int(os.getenv("LOG_ERROR_BURST", 5))
+    LOG_ERROR_WINDOW = float(os.getenv("LOG_ERROR_WINDOW", 60))
+    # Requests slower than this are logged with their stage durations (0 = off)
+    LOG_SLOW_REQUEST_MS = float(os.getenv("LOG_SLOW_REQUEST_MS", 2000))
 
 
 config = Config()
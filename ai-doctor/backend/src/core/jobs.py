@@ -0,0 +1,407 @@
+"""Background job execution with a TTL result store.
+
+Long diagnoses run on a small, bounded pool of worker threads instead of the
+HTTP worker that received them. Clients get a job id straight away and poll
+(or long-poll) for the result. Jobs are picked in priority order (see
+``request_context``), the queue is bounded so a burst is rejected with
+``QueueFullError`` rather than piling up, and queued or running jobs can be
+cancelled.
+
+With ``db_path`` every state change is also written to SQLite, so any
+process sharing the file (e.g. several gunicorn workers) can answer a poll
+for a job another process is running, and cancel it: the request is left in
+the file and the owning process picks it up before and after running it.
+"""
+
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from src.core.config import config
+from src.core.logger import logger
+from src.core.metrics import registry
+from src.core.request_context import get_priority
+from src.core.scheduler import QueueFullError
+
+JOBS_TOTAL = registry.counter(
+    "aidoctor_jobs_total", "Background jobs by final status.", ("kind", "status")
+)
+JOB_LATENCY = registry.histogram(
+    "aidoctor_job_duration_seconds",
+    "Background job time spent queued and running.",
+    ("kind", "phase"),
+)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class Job:
+    __slots__ = (
+        "id",
+        "kind",
+        "priority",
+        "status",
+        "created_at",
+        "started_at",
+        "finished_at",
+        "result",
+        "error",
+        "cancel_requested",
+        "event",
+        "_call",
+    )
+
+    def __init__(self, kind: str, priority: int, call: Callable[[], Any]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.priority = priority
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.cancel_requested = False
+        self.event = threading.Event()
+        self._call = call
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == DONE:
+            data["result"] = self.result
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class JobManager:
+    """Priority queue + worker threads + TTL store for background jobs."""
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_queue: int = 64,
+        ttl_seconds: float = 3600,
+        max_entries: int = 1000,
+        db_path: Optional[str] = None,
+    ) -> None:
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._cond = threading.Condition()
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._jobs: Dict[str, Job] = {}
+        self._queued = 0
+        self._running = 0
+        self._threads: List[threading.Thread] = []
+
+        self.db_path = db_path
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._accepting = True
+        if db_path:
+            self._open_db()
+
+    def _open_db(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires_at)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS job_cancels (id TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Job store disk tier disabled (%s): %s", self.db_path, e)
+            self._db = None
+
+    # ---- public API ----
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+        kind: str = "analyze",
+        priority: Optional[int] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        """Queue ``fn(*args, **kwargs)``; raises ``QueueFullError`` when the queue is full.
+
+        The caller's context (request priority) is copied into the job.
+        """
+        priority = get_priority() if priority is None else priority
+        ctx = contextvars.copy_context()
+        job = Job(kind, priority, lambda: ctx.run(fn, *args, **kwargs))
+
+        with self._cond:
+            if not self._accepting:
+                raise QueueFullError("jobs", "shutting_down", retry_after=5)
+            if self._queued >= self.max_queue:
+                raise QueueFullError("jobs", "queue_full", retry_after=self._retry_after())
+            self._prune()
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (priority, next(self._seq), job.id))
+            self._queued += 1
+            self._ensure_workers()
+            self._cond.notify()
+        self._persist(job)
+        return job.to_dict()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return job.to_dict()
+        return self._load(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Long-poll: block up to ``timeout`` seconds for the job to finish."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            job.event.wait(max(timeout, 0))
+            return job.to_dict()
+
+        # Owned by another process: poll the shared store
+        deadline = time.monotonic() + max(timeout, 0)
+        while True:
+            data = self._load(job_id)
+            if data is None or data["status"] in FINISHED or time.monotonic() >= deadline:
+                return data
+            time.sleep(0.25)
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued job, or flag a running one so its result is discarded."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return self._cancel_elsewhere(job_id)
+            if job.status == QUEUED:
+                # Left in the heap; workers skip it when popped
+                self._queued -= 1
+                self._finish(job, CANCELLED)
+            elif job.status == RUNNING:
+                job.cancel_requested = True
+            data = job.to_dict()
+        self._persist(job)
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            by_status: Dict[str, int] = {}
+            for job in self._jobs.values():
+                by_status[job.status] = by_status.get(job.status, 0) + 1
+            return {
+                "workers": self.workers,
+                "queue_depth": self._queued,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "stored": len(self._jobs),
+                "by_status": by_status,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_enabled": self._db is not None,
+            }
+
+    def after_fork(self) -> None:
+        """Fresh lock, workers and DB connection in a forked child."""
+        self._cond = threading.Condition()
+        self._heap = []
+        self._jobs = {}
+        self._queued = 0
+        self._running = 0
+        self._threads = []
+        self._db_lock = threading.Lock()
+        if self.db_path:
+            self._open_db()
+
+    def shutdown(self, timeout: float = 30) -> None:
+        """Stop accepting jobs, cancel queued ones and wait up to ``timeout`` for running ones."""
+        with self._cond:
+            self._accepting = False
+            queued = [j for j in self._jobs.values() if j.status == QUEUED]
+            for job in queued:
+                job.error = "server shutting down"
+                self._queued -= 1
+                self._finish(job, CANCELLED)
+            running = [j for j in self._jobs.values() if j.status == RUNNING]
+        for job in queued:
+            self._persist(job)
+
+        deadline = time.monotonic() + timeout
+        for job in running:
+            job.event.wait(max(deadline - time.monotonic(), 0))
+        if running:
+            logger.info(
+                "Job manager stopped: %d queued cancelled, %d/%d running finished",
+                len(queued),
+                sum(1 for j in running if j.status in FINISHED),
+                len(running),
+            )
+
+    # ---- workers ----
+
+    def _ensure_workers(self) -> None:
+        # Started lazily so importing this module (or forking) spawns nothing
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            t = threading.Thread(
+                target=self._worker, name=f"job-worker-{len(self._threads)}", daemon=True
+            )
+            t.start()
+            self._threads.append(t)
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                job = None
+                while job is None:
+                    while not self._heap:
+                        self._cond.wait()
+                    _, _, job_id = heapq.heappop(self._heap)
+                    candidate = self._jobs.get(job_id)
+                    if candidate is not None and candidate.status == QUEUED:
+                        job = candidate
+                self._queued -= 1
+                self._running += 1
+                job.status = RUNNING
+                job.started_at = time.time()
+            JOB_LATENCY.observe(job.started_at - job.created_at, kind=job.kind, phase="queued")
+
+            status, result, error = DONE, None, None
+            if self._cancel_requested_elsewhere(job.id):
+                status = CANCELLED
+            else:
+                self._persist(job)
+                try:
+                    result = job._call()
+                except Exception as e:
+                    logger.exception("Job %s (%s) failed: %s", job.id, job.kind, e)
+                    status, error = FAILED, f"{type(e).__name__}: {e}"
+
+            cancelled = job.cancel_requested or self._cancel_requested_elsewhere(job.id)
+            with self._cond:
+                self._running -= 1
+                if cancelled:
+                    status, result = CANCELLED, None
+                job.result = result
+                job.error = error
+                self._finish(job, status)
+            JOB_LATENCY.observe(job.finished_at - job.started_at, kind=job.kind, phase="running")
+            self._persist(job)
+
+    # ---- internals ----
+
+    def _finish(self, job: Job, status: str) -> None:
+        """Caller holds the lock."""
+        job.status = status
+        job.finished_at = time.time()
+        job._call = None
+        job.event.set()
+        JOBS_TOTAL.inc(kind=job.kind, status=status)
+
+    def _retry_after(self) -> int:
+        return max(1, int(self._queued / self.workers))
+
+    def _prune(self) -> None:
+        """Drop expired finished jobs, then the oldest finished over ``max_entries``. Caller holds the lock."""
+        cutoff = time.time() - self.ttl_seconds
+        finished = [j for j in self._jobs.values() if j.status in FINISHED]
+        for job in finished:
+            if job.finished_at < cutoff:
+                del self._jobs[job.id]
+        excess = len(self._jobs) - self.max_entries
+        if excess > 0:
+            for job in sorted(
+                (j for j in finished if j.id in self._jobs), key=lambda j: j.finished_at
+            )[:excess]:
+                del self._jobs[job.id]
+
+    def _persist(self, job: Job) -> None:
+        if self._db is None:
+            return
+        data = json.dumps(job.to_dict(), ensure_ascii=False, default=str)
+        with self._db_lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO jobs (id, data, expires_at) VALUES (?, ?, ?)",
+                    (job.id, data, time.time() + self.ttl_seconds),
+                )
+                self._db.execute("DELETE FROM jobs WHERE expires_at <= ?", (time.time(),))
+                self._db.execute("DELETE FROM job_cancels WHERE expires_at <= ?", (time.time(),))
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning("Failed to persist job %s: %s", job.id, e)
+
+    def _cancel_elsewhere(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Ask the process that owns ``job_id`` to cancel it, through the shared file."""
+        data = self._load(job_id)
+        if data is None or data["status"] in FINISHED:
+            return data
+        with self._db_lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO job_cancels (id, expires_at) VALUES (?, ?)",
+                    (job_id, time.time() + self.ttl_seconds),
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning("Failed to record cancel for job %s: %s", job_id, e)
+                return None
+        data["cancel_requested"] = True
+        return data
+
+    def _cancel_requested_elsewhere(self, job_id: str) -> bool:
+        if self._db is None:
+            return False
+        with self._db_lock:
+            try:
+                row = self._db.execute("SELECT 1 FROM job_cancels WHERE id = ?", (job_id,)).fetchone()
+            except sqlite3.Error:
+                return False
+        return row is not None
+
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT data, expires_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+
+
+jobs = JobManager(
+    workers=config.JOB_WORKERS,
+    max_queue=config.JOB_MAX_QUEUE,
+    ttl_seconds=config.JOB_TTL,
+    max_entries=config.JOB_MAX_ENTRIES,
+    db_path=config.JOB_DB or None,
+)
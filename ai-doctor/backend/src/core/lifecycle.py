@@ -0,0 +1,64 @@
+"""Process lifecycle: per-worker reset after fork and graceful shutdown.
+
+Under a preforking server (gunicorn ``preload_app``) the app, model plan and
+orchestrator are built once in the master and inherited by every worker.
+Threads and SQLite connections do not survive ``fork()``, so components that
+own them register an ``after_fork`` hook to rebuild them in the child.
+Shutdown hooks run once when the process stops serving. ``begin_drain``
+flags the process as draining earlier, as soon as the stop signal arrives,
+so in-flight work can wind down while the server finishes open requests.
+"""
+
+import threading
+from typing import Callable, List
+
+from src.core.logger import logger
+
+shutting_down = threading.Event()
+
+_after_fork: List[Callable[[], None]] = []
+_on_shutdown: List[Callable[[], None]] = []
+_lock = threading.Lock()
+_stopped = False
+
+
+def register_after_fork(fn: Callable[[], None]) -> None:
+    with _lock:
+        _after_fork.append(fn)
+
+
+def register_shutdown(fn: Callable[[], None]) -> None:
+    with _lock:
+        _on_shutdown.append(fn)
+
+
+def after_fork() -> None:
+    """Rebuild threads/connections inherited from the parent process."""
+    with _lock:
+        hooks = list(_after_fork)
+    for fn in hooks:
+        try:
+            fn()
+        except Exception as e:
+            logger.exception("after_fork hook %r failed: %s", fn, e)
+
+
+def begin_drain() -> None:
+    """Mark the process as draining: readiness fails and bulk work stops taking items."""
+    shutting_down.set()
+
+
+def shutdown() -> None:
+    """Mark the process as draining and run shutdown hooks (latest first, once)."""
+    global _stopped
+    begin_drain()
+    with _lock:
+        if _stopped:
+            return
+        _stopped = True
+        hooks = list(reversed(_on_shutdown))
+    for fn in hooks:
+        try:
+            fn()
+        except Exception as e:
+            logger.exception("Shutdown hook %r failed: %s", fn, e)
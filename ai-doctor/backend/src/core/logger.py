@@ -1,19 +1,151 @@
-"""Logging setup."""
+"""Logging setup.
 
+With ``LOG_ASYNC`` (default) request threads only put records on a bounded
+queue; a background listener formats them (tracebacks included) and does
+the file/console I/O, so a slow disk never becomes request latency. When
+the queue is full, records are dropped and counted instead of blocking.
+
+Every record carries the request's correlation id (``request_id``), and
+``LOG_FORMAT=json`` writes one JSON object per line, including any
+``extra=`` fields (e.g. per-stage durations). Repeated warnings/errors with
+the same message template are rate limited: the first in each window keeps
+its traceback, the next few are logged without one, and the rest are
+counted and reported when the window rolls over.
+"""
+
+import atexit
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List, Optional, Tuple
+
 from .config import config
+from .request_context import get_request_id
 
+# Attributes every LogRecord has; anything else came in through ``extra=``
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
 
-def setup_logging():
-    logger = logging.getLogger("aidoffline")
-    logger.setLevel(getattr(logging, config.LOG_LEVEL.upper(), logging.INFO))
 
-    fmt_file = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s"
-    )
-    fmt_console = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+class ContextFilter(logging.Filter):
+    """Stamp the caller's correlation id on the record (runs in the caller's thread)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = get_request_id()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Limit repeats of the same WARNING+ message template per time window."""
+
+    def __init__(self, burst: int, window: float):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._lock = threading.Lock()
+        # key -> [window_start, count]
+        self._seen: Dict[Tuple, List[float]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0 or record.levelno < logging.WARNING:
+            return True
+        exc_type = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else ""
+        key = (record.name, record.levelno, str(record.msg), exc_type)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                suppressed = int(entry[1]) - self.burst if entry is not None else 0
+                self._seen[key] = [now, 1]
+                if len(self._seen) > 1024:
+                    self._prune(now)
+                if suppressed > 0:
+                    record.suppressed = suppressed
+                return True
+            entry[1] += 1
+            count = entry[1]
+        if count > self.burst:
+            return False
+        # Later repeats in the window: message only, no traceback
+        record.exc_info = None
+        record.exc_text = None
+        return True
+
+    def _prune(self, now: float) -> None:
+        for key in [k for k, v in self._seen.items() if now - v[0] >= self.window]:
+            del self._seen[key]
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+            "where": f"{record.filename}:{record.lineno}",
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in data:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            text += f" (+{suppressed} similar suppressed)"
+        return text
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller; defers formatting to the listener thread."""
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve %-args now (they may change after the call returns) but
+        # keep exc_info so the traceback is rendered on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            type(self).dropped += 1
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[_DroppingQueueHandler] = None
+_sinks: List[logging.Handler] = []
+
+
+def _build_sinks() -> List[logging.Handler]:
+    if config.LOG_FORMAT == "json":
+        fmt_file: logging.Formatter = JsonFormatter()
+        fmt_console: logging.Formatter = JsonFormatter()
+    else:
+        fmt_file = TextFormatter(
+            "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] "
+            "[%(filename)s:%(lineno)d] - %(message)s"
+        )
+        fmt_console = TextFormatter("%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s")
 
     os.makedirs(os.path.dirname(config.LOG_FILE), exist_ok=True)
 
@@ -22,12 +154,78 @@ def setup_logging():
 
     ch = logging.StreamHandler()
     ch.setFormatter(fmt_console)
+    return [fh, ch]
+
+
+def _start_listener() -> None:
+    global _listener, _queue_handler
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+    if _queue_handler is None:
+        _queue_handler = _DroppingQueueHandler(log_queue)
+        _queue_handler.addFilter(ContextFilter())
+        _queue_handler.addFilter(RateLimitFilter(config.LOG_ERROR_BURST, config.LOG_ERROR_WINDOW))
+    else:
+        _queue_handler.queue = log_queue
+    _listener = QueueListener(log_queue, *_sinks, respect_handler_level=True)
+    _listener.start()
+
+
+def setup_logging():
+    logger = logging.getLogger("aidoffline")
+    logger.setLevel(getattr(logging, config.LOG_LEVEL.upper(), logging.INFO))
 
-    if not logger.handlers:
-        logger.addHandler(fh)
-        logger.addHandler(ch)
+    if logger.handlers:
+        return logger
+
+    _sinks.extend(_build_sinks())
+    if config.LOG_ASYNC:
+        _start_listener()
+        logger.addHandler(_queue_handler)
+        atexit.register(stop)
+    else:
+        # On the logger, not per handler: each record is counted once, and a
+        # stripped traceback is stripped for every sink alike
+        logger.addFilter(ContextFilter())
+        logger.addFilter(RateLimitFilter(config.LOG_ERROR_BURST, config.LOG_ERROR_WINDOW))
+        for handler in _sinks:
+            logger.addHandler(handler)
 
     return logger
 
 
+def after_fork() -> None:
+    """Restart the writer thread in a forked child (threads do not survive fork())."""
+    if _queue_handler is not None:
+        # A fresh queue also drops records the parent had not written yet
+        _start_listener()
+
+
+def stop() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        try:
+            listener.stop()
+        except Exception:
+            pass
+    if _DroppingQueueHandler.dropped:
+        for handler in _sinks:
+            handler.handle(
+                logging.makeLogRecord(
+                    {
+                        "name": "aidoffline",
+                        "levelno": logging.WARNING,
+                        "levelname": "WARNING",
+                        "msg": f"{_DroppingQueueHandler.dropped} log records dropped (queue full)",
+                        "request_id": "-",
+                    }
+                )
+            )
+
+
+def dropped() -> int:
+    return _DroppingQueueHandler.dropped
+
+
 logger = setup_logging()
@@ -0,0 +1,247 @@
+"""Minimal Prometheus-style metrics (text exposition format 0.0.4).
+
+Only what the backend needs: labelled counters, labelled histograms and
+collector callbacks for values that already live elsewhere (cache and
+scheduler stats). Everything is process-local and thread-safe.
+"""
+
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+Sample = Tuple[Dict[str, str], float]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _fmt_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels.items():
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _fmt_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _labels(self, key: LabelValues) -> Dict[str, str]:
+        return dict(zip(self.label_names, key))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self._labels(k))} {_fmt_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> (bucket counts, sum, count)
+        self._values: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, n = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value, n + 1)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, (list(c), s, n)) for k, (c, s, n) in self._values.items()]
+        lines = []
+        for key, (counts, total, n) in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket_labels = dict(labels, le=_fmt_value(bound))
+                lines.append(f"{self.name}_bucket{_fmt_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(labels)} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{_fmt_labels(labels)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help_text, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def register_collector(
+        self, fn: Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]
+    ) -> None:
+        """Register a callback yielding (name, type, help, samples) at scrape time."""
+        with self._lock:
+            self._collectors.append(fn)
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    "aidoctor_http_requests_total", "HTTP requests by route and status.", ("route", "method", "status")
+)
+HTTP_LATENCY = registry.histogram(
+    "aidoctor_http_request_duration_seconds", "HTTP request latency by route.", ("route", "method")
+)
+STAGE_LATENCY = registry.histogram(
+    "aidoctor_stage_duration_seconds", "Orchestrator stage latency.", ("stage", "model")
+)
+LLM_REQUESTS = registry.counter(
+    "aidoctor_llm_requests_total", "LLM calls by model and outcome.", ("model", "outcome")
+)
+LLM_FAILURES = registry.counter(
+    "aidoctor_llm_failures_total", "Failed LLM calls by model and reason.", ("model", "reason")
+)
+LLM_TOKENS = registry.counter(
+    "aidoctor_llm_tokens_total", "Tokens reported in the OpenAI usage field.", ("model", "kind")
+)
+PROMPT_TOKENS_CACHED = registry.counter(
+    "aidoctor_llm_prompt_tokens_cached_total",
+    "Prompt tokens served from the server's prefix cache (prefill avoided).",
+    ("model",),
+)
+PROMPT_TOKENS_EVALUATED = registry.counter(
+    "aidoctor_llm_prompt_tokens_evaluated_total",
+    "Prompt tokens the server actually had to process.",
+    ("model",),
+)
+JSON_FALLBACKS = registry.counter(
+    "aidoctor_reasoning_json_fallbacks_total",
+    "Reasoning responses that were not parseable JSON and fell back to raw_text.",
+    ("model",),
+)
+EMERGENCY_SHORTCIRCUITS = registry.counter(
+    "aidoctor_emergency_shortcircuits_total",
+    "Requests answered emergency-now by the red-flag detector, by matched category.",
+    ("category",),
+)
+JSON_REPAIRS = registry.counter(
+    "aidoctor_reasoning_json_repairs_total",
+    "Reasoning responses that failed validation and were repaired (kind=coerce|local|llm).",
+    ("model", "kind"),
+)
+
+
+def record_usage(model: str, usage: Dict | None, timings: Dict | None = None) -> None:
+    """Add token counts from an OpenAI ``usage`` object.
+
+    Prefix-cache reuse comes from ``usage.prompt_tokens_details.cached_tokens``
+    (OpenAI-style servers) or llama.cpp server's ``timings`` (cache_n/prompt_n).
+    """
+    if usage:
+        for kind in ("prompt_tokens", "completion_tokens"):
+            value = usage.get(kind)
+            if isinstance(value, (int, float)):
+                LLM_TOKENS.inc(value, model=model, kind=kind[: -len("_tokens")])
+
+    cached = None
+    evaluated = None
+    details = (usage or {}).get("prompt_tokens_details") or {}
+    if isinstance(details.get("cached_tokens"), (int, float)):
+        cached = details["cached_tokens"]
+        if isinstance((usage or {}).get("prompt_tokens"), (int, float)):
+            evaluated = usage["prompt_tokens"] - cached
+    if timings:
+        if isinstance(timings.get("cache_n"), (int, float)):
+            cached = timings["cache_n"]
+        if isinstance(timings.get("prompt_n"), (int, float)):
+            evaluated = timings["prompt_n"]
+
+    if cached:
+        PROMPT_TOKENS_CACHED.inc(cached, model=model)
+    if evaluated:
+        PROMPT_TOKENS_EVALUATED.inc(evaluated, model=model)
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,49 @@
+"""Per-request state carried through the call stack via contextvars."""
+
+import uuid
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+PRIORITY_EMERGENCY = 0
+PRIORITY_NORMAL = 10
+PRIORITY_BACKGROUND = 20
+
+request_priority: ContextVar[int] = ContextVar("request_priority", default=PRIORITY_NORMAL)
+# Correlation id stamped on every log record of the request (and its jobs)
+request_id: ContextVar[str] = ContextVar("request_id", default="-")
+# Per-stage durations (ms) of the current request, for the slow-request log
+request_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+
+
+def get_priority() -> int:
+    return request_priority.get()
+
+
+def set_priority(priority: int) -> None:
+    request_priority.set(priority)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def start_request(rid: Optional[str] = None) -> str:
+    """Begin a request: set its correlation id and an empty stage map."""
+    rid = rid or new_request_id()
+    request_id.set(rid)
+    request_stages.set({})
+    return rid
+
+
+def get_request_id() -> str:
+    return request_id.get()
+
+
+def record_stage(name: str, ms: float) -> None:
+    stages = request_stages.get()
+    if stages is not None:
+        stages[name] = ms
+
+
+def get_stages() -> Dict[str, float]:
+    return dict(request_stages.get() or {})
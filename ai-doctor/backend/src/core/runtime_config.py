@@ -1,12 +1,154 @@
 # backend/src/core/runtime_config.py
-from typing import Dict
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
 from src.core.config import config
-from src.system.model_planner import plan_models
+from src.core.logger import logger
+from src.system.model_planner import build_plan
 
-runtime_config = plan_models()
+_lock = threading.Lock()
+# Planned on first use (it probes the machine), not at import
+_plan: Optional[Dict[str, Any]] = None
+_pinned: set = set()  # roles set explicitly through the admin API
+_replanner: Optional[threading.Thread] = None
+_overrides_mtime = 0.0
+
+runtime_config: Dict[str, str] = {}
+
+def _ensure_plan() -> None:
+    global _plan
+    if _plan is not None:
+        return
+    with _lock:
+        if _plan is None:
+            plan = dict(build_plan(), planned_at=time.time())
+            runtime_config.update(plan["models"])
+            _plan = plan
 
 def get_model(name: str) -> str:
+    _ensure_plan()
     return runtime_config.get(name, "")
 
+def get_models() -> Dict[str, str]:
+    """Snapshot of the active model per role."""
+    _ensure_plan()
+    return dict(runtime_config)
+
 def set_model(name: str, value: str) -> None:
+    _ensure_plan()
     runtime_config[name] = value
+    # An explicit choice is never overridden by automatic re-planning
+    _pinned.add(name)
+    _write_overrides()
+
+def _write_overrides() -> None:
+    """Share admin pins with sibling worker processes through MODEL_OVERRIDES_FILE."""
+    global _overrides_mtime
+    path = config.MODEL_OVERRIDES_FILE
+    if not path:
+        return
+    pins = {role: runtime_config.get(role, "") for role in _pinned}
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(pins, f)
+        os.replace(tmp, path)
+        _overrides_mtime = os.stat(path).st_mtime
+    except OSError as e:
+        logger.warning("Could not write model overrides to %s: %s", path, e)
+
+def sync_overrides() -> Dict[str, str]:
+    """Apply pins another process wrote to MODEL_OVERRIDES_FILE; returns changed roles."""
+    global _overrides_mtime
+    path = config.MODEL_OVERRIDES_FILE
+    if not path:
+        return {}
+    try:
+        mtime = os.stat(path).st_mtime
+        if mtime == _overrides_mtime:
+            return {}
+        with open(path, encoding="utf-8") as f:
+            pins = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    _ensure_plan()
+    changed: Dict[str, str] = {}
+    with _lock:
+        _overrides_mtime = mtime
+        for role, model in pins.items():
+            _pinned.add(role)
+            if runtime_config.get(role) != model:
+                runtime_config[role] = model
+                changed[role] = model
+    if changed:
+        logger.info("Applied model overrides from %s: %s", path, changed)
+    return changed
+
+def get_plan() -> Dict[str, Any]:
+    """Last plan with its reasons, plus the models actually active now."""
+    _ensure_plan()
+    with _lock:
+        plan = dict(_plan)
+    plan["active"] = dict(runtime_config)
+    plan["pinned"] = sorted(_pinned)
+    return plan
+
+def replan() -> Dict[str, str]:
+    """Re-probe resources and apply the new plan to non-pinned roles.
+
+    Returns the roles whose model changed.
+    """
+    global _plan
+    _ensure_plan()
+    plan = dict(build_plan(current=dict(runtime_config)), planned_at=time.time())
+    changed: Dict[str, str] = {}
+    with _lock:
+        _plan = plan
+        for role, model in plan["models"].items():
+            if role in _pinned or runtime_config.get(role) == model:
+                continue
+            runtime_config[role] = model
+            changed[role] = model
+    if changed:
+        logger.warning(
+            "Model plan changed %s (available %.1f GB): %s",
+            changed,
+            plan["resources"]["available_ram_gb"],
+            {role: plan["reasons"][role][-1] for role in changed},
+        )
+    return changed
+
+def start_replanner(interval: float, on_change: Callable[[Dict[str, str]], None]) -> None:
+    """Re-plan every ``interval`` seconds on a daemon thread (started once).
+
+    The same thread picks up admin overrides written by other worker
+    processes every MODEL_SYNC_INTERVAL seconds.
+    """
+    global _replanner
+    syncing = bool(config.MODEL_OVERRIDES_FILE)
+    if (interval <= 0 and not syncing) or _replanner is not None:
+        return
+    tick = config.MODEL_SYNC_INTERVAL if syncing else interval
+    if syncing and interval > 0:
+        tick = min(tick, interval)
+
+    def loop() -> None:
+        next_plan = time.monotonic() + interval
+        while True:
+            time.sleep(tick)
+            try:
+                changed = sync_overrides()
+                if interval > 0 and time.monotonic() >= next_plan:
+                    next_plan = time.monotonic() + interval
+                    changed.update(replan())
+                if changed:
+                    on_change(changed)
+            except Exception as e:
+                logger.exception("Model re-plan failed: %s", e)
+
+    _replanner = threading.Thread(target=loop, name="model-replanner", daemon=True)
+    _replanner.start()
@@ -0,0 +1,174 @@
+"""Admission control in front of the local LLM endpoints.
+
+Each endpoint origin gets a scheduler with a fixed number of concurrent
+slots and a bounded priority wait queue. When the queue is full (or a
+waiter times out) callers get ``QueueFullError`` immediately instead of
+piling more work onto an already saturated model server.
+"""
+
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+from src.core.config import config
+from src.core.logger import logger
+from src.core.request_context import get_priority
+
+# Concurrent inference slots per endpoint by machine tier
+TIER_CONCURRENCY = {"LOW": 1, "MEDIUM": 2, "HIGH": 4}
+
+
+class QueueFullError(Exception):
+    """Raised when a request cannot be admitted to an LLM endpoint."""
+
+    def __init__(self, endpoint: str, reason: str, retry_after: int):
+        super().__init__(f"LLM endpoint {endpoint} is busy ({reason})")
+        self.endpoint = endpoint
+        self.reason = reason  # "queue_full" | "timeout" | "shutting_down" | "unavailable"
+        self.retry_after = retry_after
+
+
+class EndpointScheduler:
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting: List[Tuple[int, int]] = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._service_avg = 0.0  # EWMA of slot hold time, seconds
+
+    @contextmanager
+    def slot(self, priority: int | None = None):
+        """Hold one inference slot for the duration of the ``with`` block."""
+        if priority is None:
+            priority = get_priority()
+        waited = self._acquire(priority)
+        start = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self._release(time.monotonic() - start)
+
+    def _acquire(self, priority: int) -> float:
+        start = time.monotonic()
+        with self._cond:
+            if self._active < self.max_concurrency and not self._waiting:
+                self._active += 1
+                self._admitted += 1
+                return 0.0
+
+            if len(self._waiting) >= self.max_queue:
+                self._rejected += 1
+                raise QueueFullError(self.name, "queue_full", self._retry_after())
+
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiting, entry)
+            deadline = start + self.max_wait
+            try:
+                while not (self._waiting[0] == entry and self._active < self.max_concurrency):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timed_out += 1
+                        raise QueueFullError(self.name, "timeout", self._retry_after())
+                    self._cond.wait(remaining)
+            finally:
+                if entry in self._waiting:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    # The head may have changed; let the next waiter re-check
+                    self._cond.notify_all()
+
+            self._active += 1
+            self._admitted += 1
+            waited = time.monotonic() - start
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            return waited
+
+    def _release(self, held: float) -> None:
+        with self._cond:
+            self._active -= 1
+            self._service_avg = held if not self._service_avg else 0.8 * self._service_avg + 0.2 * held
+            self._cond.notify_all()
+
+    def _retry_after(self) -> int:
+        # Rough time until a newly queued request would be served
+        backlog = len(self._waiting) + 1
+        estimate = self._service_avg * backlog / self.max_concurrency
+        return max(1, math.ceil(estimate))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            admitted = self._admitted
+            return {
+                "endpoint": self.name,
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queue_depth": len(self._waiting),
+                "admitted": admitted,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "avg_wait_seconds": round(self._wait_total / admitted, 4) if admitted else 0.0,
+                "max_wait_seconds": round(self._wait_max, 4),
+                "avg_service_seconds": round(self._service_avg, 4),
+            }
+
+
+_schedulers: Dict[str, EndpointScheduler] = {}
+_lock = threading.Lock()
+
+
+def _default_concurrency() -> int:
+    if config.LLM_MAX_CONCURRENCY > 0:
+        return config.LLM_MAX_CONCURRENCY
+    from src.system.capabilities import classify_machine
+
+    return TIER_CONCURRENCY.get(classify_machine(), 1)
+
+
+def get_scheduler(endpoint: str) -> EndpointScheduler:
+    """Return the scheduler for the endpoint's origin, creating it once."""
+    parts = urlsplit(endpoint)
+    origin = f"{parts.scheme}://{parts.netloc}"
+    scheduler = _schedulers.get(origin)
+    if scheduler is not None:
+        return scheduler
+    with _lock:
+        scheduler = _schedulers.get(origin)
+        if scheduler is None:
+            scheduler = EndpointScheduler(
+                origin,
+                max_concurrency=_default_concurrency(),
+                max_queue=config.LLM_MAX_QUEUE,
+                max_wait=config.LLM_QUEUE_TIMEOUT,
+            )
+            logger.info(
+                "Scheduler for %s: %d slots, queue %d",
+                origin,
+                scheduler.max_concurrency,
+                scheduler.max_queue,
+            )
+            _schedulers[origin] = scheduler
+        return scheduler
+
+
+def all_stats() -> List[Dict[str, Any]]:
+    with _lock:
+        schedulers = list(_schedulers.values())
+    return [s.stats() for s in schedulers]
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ``src`` spans backend/src and ai-doctor/src (src.llm, src.system)
+for path in (BACKEND_DIR, os.path.dirname(BACKEND_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Keep test runs out of the tracked logs/aidoctor.log
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.mkdtemp(prefix="aidoctor-tests-"), "aidoctor.log"))
@@ -0,0 +1,152 @@
+import argparse
+import hashlib
+import os
+
+import pytest
+
+import download_gguf
+from bench.fake_model_mirror import FakeModelMirror
+
+CHUNK = 256 * 1024  # download_gguf.BLOCK_SIZE, the smallest chunk it allows
+REL = "reasoning/gemma-2b.gguf"
+
+
+@pytest.fixture
+def model(tmp_path):
+    """A fake GGUF in a mirror laid out like models/: (root, bytes, sha256)."""
+    root = tmp_path / "mirror"
+    (root / "reasoning").mkdir(parents=True)
+    data = os.urandom(12 * CHUNK + 12345)
+    (root / REL).write_bytes(data)
+    return root, data, hashlib.sha256(data).hexdigest()
+
+
+def _entry(mirror, dest, sha256=""):
+    return {"name": "gemma:2b", "path": str(dest / REL), "url": f"{mirror.base_url}/{REL}", "sha256": sha256}
+
+
+def _args(**overrides):
+    values = dict(
+        connections=4, chunk_mb=CHUNK / (1024 * 1024), timeout=10, retries=10,
+        report_every=0, verify=False, force=False,
+    )
+    values.update(overrides)
+    return argparse.Namespace(**values)
+
+
+def test_parallel_chunks_survive_dropped_connections(model, tmp_path):
+    root, data, sha = model
+    dest = tmp_path / "models"
+    with FakeModelMirror(root=str(root), drop_rate=0.2) as mirror:
+        result = download_gguf.fetch(_entry(mirror, dest, sha), _args())
+        assert mirror.settings.range_requests >= 13
+
+    assert result["status"] == "downloaded"
+    assert result["verified"] is True
+    assert (dest / REL).read_bytes() == data
+    assert not os.path.exists(str(dest / REL) + ".part.json")
+
+
+def test_interrupted_download_resumes_from_finished_chunks(model, tmp_path):
+    root, data, sha = model
+    dest = tmp_path / "models"
+
+    class Interrupted(download_gguf.ChunkedDownload):
+        def _chunk_done(self, index):
+            super()._chunk_done(index)
+            if len(self._done) == 5:
+                raise KeyboardInterrupt
+
+    with FakeModelMirror(root=str(root)) as mirror:
+        first = Interrupted(_entry(mirror, dest, sha), connections=1, chunk_size=CHUNK, report_every=0)
+        with pytest.raises(KeyboardInterrupt):
+            first.run()
+        assert os.path.exists(str(dest / REL) + ".part.json")
+        assert not (dest / REL).exists()
+
+        before = mirror.settings.range_requests
+        result = download_gguf.fetch(_entry(mirror, dest, sha), _args())
+        # The size probe, then only the 8 unfinished chunks
+        assert mirror.settings.range_requests - before == 1 + 8
+
+    assert result["status"] == "downloaded"
+    assert result["resumed_bytes"] == 5 * CHUNK
+    assert (dest / REL).read_bytes() == data
+
+
+def test_sha_mismatch_fails_and_keeps_nothing(model, tmp_path):
+    root, _, _ = model
+    dest = tmp_path / "models"
+    with FakeModelMirror(root=str(root)) as mirror:
+        result = download_gguf.fetch(_entry(mirror, dest, "00" * 32), _args())
+
+    assert result["status"] == "failed"
+    assert "SHA-256 mismatch" in result["error"]
+    assert os.listdir(dest / "reasoning") == []
+
+
+def test_model_without_a_source_fails_the_run(tmp_path, monkeypatch):
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text('{"gemma:2b": {"url": ""}}')
+    monkeypatch.delenv("MODEL_MIRROR", raising=False)
+    monkeypatch.setattr(
+        "sys.argv",
+        ["download_gguf.py", "--models", "gemma:2b", "--dest", str(tmp_path), "--manifest", str(manifest)],
+    )
+    with pytest.raises(SystemExit) as exit_info:
+        download_gguf.main()
+    assert exit_info.value.code == 1
+
+
+def test_default_selection_follows_the_runtime_plan(monkeypatch):
+    plan = {"tier": "MEDIUM", "models": {"REASONING_MODEL": "gemma:2b", "EXPLAIN_MODEL": "llama3:8b", "VISION_MODEL": ""}}
+    seen = {}
+
+    def fake_build_plan(**kwargs):
+        seen.update(kwargs)
+        return plan
+
+    monkeypatch.setattr(download_gguf, "build_plan", fake_build_plan)
+    models = download_gguf.select_models(argparse.Namespace(models=None, all=False, tier=None))
+    assert models == ["gemma:2b", "llama3:8b"]
+    assert seen["require_files"] is False
+
+
+def test_unpinned_file_is_checked_against_the_lfs_etag(model, tmp_path):
+    root, data, _ = model
+    dest = tmp_path / "models"
+    with FakeModelMirror(root=str(root), linked_etag=True) as mirror:
+        result = download_gguf.fetch(_entry(mirror, dest), _args())
+
+    assert result["status"] == "downloaded"
+    assert result["verified"] is True
+    assert (dest / REL).read_bytes() == data
+
+
+@pytest.mark.parametrize("good", [True, False])
+def test_unpinned_file_is_checked_against_the_mirror_sidecar(model, tmp_path, good):
+    root, _, sha = model
+    dest = tmp_path / "models"
+    (root / (REL + ".sha256")).write_text(f"{sha if good else 'ab' * 32}  gemma-2b.gguf\n")
+    with FakeModelMirror(root=str(root)) as mirror:
+        result = download_gguf.fetch(_entry(mirror, dest), _args())
+
+    if good:
+        assert result["status"] == "downloaded"
+        assert result["verified"] is True
+    else:
+        assert result["status"] == "failed"
+        assert "SHA-256 mismatch" in result["error"]
+
+
+@pytest.mark.parametrize("allow", [False, True])
+def test_unverified_download_fails_the_run(model, tmp_path, monkeypatch, allow):
+    root, _, _ = model
+    with FakeModelMirror(root=str(root)) as mirror:
+        argv = ["download_gguf.py", "--models", "gemma:2b", "--mirror", mirror.base_url]
+        argv += ["--dest", str(tmp_path / "models"), "--report-every", "0"]
+        monkeypatch.setattr("sys.argv", argv + (["--allow-unverified"] if allow else []))
+        with pytest.raises(SystemExit) as exit_info:
+            download_gguf.main()
+    assert exit_info.value.code == (0 if allow else 1)
+    assert (tmp_path / "models" / REL).exists()
@@ -0,0 +1,145 @@
+import threading
+
+import pytest
+
+from bench.fake_llm_server import FakeLLMServer
+from src.ai.endpoint_pool import CLOSED, HALF_OPEN, OPEN
+from src.ai.llm_client import LLMClient
+from src.core.config import config
+from src.core.scheduler import QueueFullError, get_scheduler
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+@pytest.fixture
+def servers():
+    fakes = [FakeLLMServer(latency=0.01, tokens_per_sec=5000).start() for _ in range(2)]
+    yield fakes
+    for fake in fakes:
+        fake.stop()
+
+
+@pytest.fixture(autouse=True)
+def no_hedging(monkeypatch):
+    monkeypatch.setattr(config, "LLM_HEDGE_AFTER_MS", 0)
+
+
+def _saturate(url: str):
+    """Hold the replica's only slot with no room to queue; release by setting the event."""
+    scheduler = get_scheduler(url)
+    scheduler.max_concurrency = 1
+    scheduler.max_queue = 0
+    holding, release = threading.Event(), threading.Event()
+
+    def hold():
+        with scheduler.slot():
+            holding.set()
+            release.wait(10)
+
+    thread = threading.Thread(target=hold, daemon=True)
+    thread.start()
+    holding.wait(5)
+    return release, thread
+
+
+def _open_breaker(replica):
+    replica.state = OPEN
+    replica.opened_at = -config.LLM_BREAKER_COOLDOWN  # cooldown already over
+
+
+def test_queue_full_on_half_open_trial_does_not_leak_the_trial(servers):
+    client = LLMClient(servers[0].chat_url, "fake-model")
+    replica = client.pool.replicas[0]
+    _open_breaker(replica)
+    release, thread = _saturate(replica.url)
+
+    with pytest.raises(QueueFullError):
+        client.chat(MESSAGES)
+    assert replica.state == HALF_OPEN
+    assert replica.trial_inflight is False
+
+    release.set()
+    thread.join(5)
+    assert client.chat(MESSAGES)
+    assert replica.state == CLOSED
+
+
+def test_stream_queue_full_on_half_open_trial_does_not_leak_the_trial(servers):
+    client = LLMClient(servers[0].chat_url, "fake-model")
+    replica = client.pool.replicas[0]
+    _open_breaker(replica)
+    release, thread = _saturate(replica.url)
+
+    with pytest.raises(QueueFullError):
+        list(client.stream_chat(MESSAGES))
+    assert replica.trial_inflight is False
+    release.set()
+    thread.join(5)
+
+
+@pytest.mark.parametrize("hedge_ms", [0, 50])
+def test_queue_full_fails_over_to_the_next_replica(servers, monkeypatch, hedge_ms):
+    monkeypatch.setattr(config, "LLM_HEDGE_AFTER_MS", hedge_ms)
+    busy, free = servers
+    client = LLMClient(f"{busy.chat_url},{free.chat_url}", "fake-model")
+    first, second = client.pool.replicas
+    # Make the busy replica the first choice
+    first.latency_avg, second.latency_avg = 0.001, 1.0
+    release, thread = _saturate(first.url)
+    try:
+        assert client.chat(MESSAGES)
+        assert busy.settings.requests == 0
+        assert free.settings.requests == 1
+    finally:
+        release.set()
+        thread.join(5)
+
+
+def test_stream_queue_full_fails_over_to_the_next_replica(servers):
+    busy, free = servers
+    client = LLMClient(f"{busy.chat_url},{free.chat_url}", "fake-model")
+    first, second = client.pool.replicas
+    first.latency_avg, second.latency_avg = 0.001, 1.0
+    release, thread = _saturate(first.url)
+    try:
+        assert "".join(client.stream_chat(MESSAGES))
+        assert free.settings.requests == 1
+    finally:
+        release.set()
+        thread.join(5)
+
+
+def test_queue_full_everywhere_is_raised(servers):
+    client = LLMClient(",".join(s.chat_url for s in servers), "fake-model")
+    held = [_saturate(r.url) for r in client.pool.replicas]
+    try:
+        with pytest.raises(QueueFullError):
+            client.chat(MESSAGES)
+    finally:
+        for release, thread in held:
+            release.set()
+            thread.join(5)
+
+
+def test_only_the_trial_owner_ends_a_half_open_trial(servers):
+    client = LLMClient(servers[0].chat_url, "fake-model")
+    pool = client.pool
+    replica = pool.replicas[0]
+    _open_breaker(replica)
+    trial, straggler = object(), object()
+
+    assert pool.pick(owner=trial) is replica
+    assert replica.trial_inflight is True
+    # A request sent before the breaker opened finishes during the trial
+    with pool.track(replica, straggler):
+        pool.record(replica, ok=False, owner=straggler)
+    pool.record(replica, ok=True, owner=straggler)
+    assert replica.state == HALF_OPEN
+    assert replica.trial_inflight is True
+    with pytest.raises(QueueFullError):
+        pool.pick(owner=object())
+
+    with pool.track(replica, trial):
+        pool.record(replica, ok=True, owner=trial)
+    assert replica.state == CLOSED
+    assert replica.trial_inflight is False
@@ -0,0 +1,151 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from bench.fake_llm_server import FakeLLMServer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pytest.importorskip("gunicorn")
+if sys.platform == "win32":
+    pytest.skip("gunicorn does not run on Windows", allow_module_level=True)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get(url: str, timeout: float = 30):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+@pytest.fixture
+def llm():
+    with FakeLLMServer(latency=0.3, tokens_per_sec=5000) as server:
+        yield server
+
+
+def _start_gunicorn(llm, tmp_path, **settings):
+    """Launch gunicorn against the fake LLM; returns ``(process, api base url)`` once ready."""
+    port = _free_port()
+    env = dict(
+        os.environ,
+        QWEN_REASONING_ENDPOINT=llm.chat_url,
+        LLAMA_EXPLAIN_ENDPOINT=llm.chat_url,
+        QWEN_VL_ENDPOINT=llm.chat_url,
+        GUNICORN_BIND=f"127.0.0.1:{port}",
+        RESPONSE_CACHE_ENABLED="False",
+        FAST_PATH_ENABLED="False",
+        # Shared files (JOB_DB, MODEL_OVERRIDES_FILE) default into the temp dir
+        TMPDIR=str(tmp_path),
+        LOG_FILE=str(tmp_path / "aidoctor.log"),
+        LOG_LEVEL="WARNING",
+    )
+    env.pop("JOB_DB", None)
+    env.pop("MODEL_OVERRIDES_FILE", None)
+    env.update(settings)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}/api/v1"
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            if _get(f"{base}/health/ready", timeout=5)[0] == 200:
+                return proc, base
+        except OSError:
+            pass
+        if time.monotonic() > deadline:
+            proc.kill()
+            raise AssertionError("gunicorn never became ready")
+        time.sleep(0.2)
+
+
+def _stop(proc):
+    if proc.poll() is None:
+        proc.kill()
+        proc.wait()
+
+
+def test_sigterm_drains_before_open_requests_finish(llm, tmp_path):
+    # One thread: a readiness probe sent now waits behind the batch
+    proc, base = _start_gunicorn(
+        llm, tmp_path, GUNICORN_WORKERS="1", GUNICORN_THREADS="1", BATCH_CONCURRENCY="1"
+    )
+    try:
+        total = 20
+        body = "".join(json.dumps({"symptoms": ["cough", f"case {i}"]}) + "\n" for i in range(total))
+        req = urllib.request.Request(
+            f"{base}/symptom/analyze/batch",
+            data=body.encode(),
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+        lines = []
+        first_case = threading.Event()
+
+        def read_batch():
+            with urllib.request.urlopen(req, timeout=60) as resp:
+                for raw in resp:
+                    lines.append(json.loads(raw))
+                    first_case.set()
+
+        batch = threading.Thread(target=read_batch)
+        batch.start()
+        assert first_case.wait(30)
+
+        ready = {}
+        probe = threading.Thread(target=lambda: ready.update(zip(("status", "body"), _get(f"{base}/health/ready"))))
+        probe.start()
+        time.sleep(0.5)
+        proc.send_signal(signal.SIGTERM)
+
+        batch.join(60)
+        probe.join(60)
+        assert proc.wait(60) == 0
+
+        assert ready["status"] == 503
+        assert ready["body"]["draining"] is True
+        summary = lines[-1]["summary"]
+        assert summary["truncated"] == "shutting_down"
+        assert summary["cases"] < total
+    finally:
+        _stop(proc)
+
+
+def test_any_worker_answers_a_job_poll(llm, tmp_path):
+    proc, base = _start_gunicorn(llm, tmp_path, GUNICORN_WORKERS="2", GUNICORN_THREADS="1")
+    try:
+        req = urllib.request.Request(
+            f"{base}/jobs/analyze",
+            data=json.dumps({"symptoms": ["cough"]}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            job_id = json.loads(resp.read())["job_id"]
+
+        # Fresh connections, so polls are spread over both workers
+        statuses = [_get(f"{base}/jobs/{job_id}?wait=5")[1]["status"] for _ in range(10)]
+        assert "error" not in statuses
+        assert statuses[-1] == "done"
+        assert (tmp_path / "aidoctor-jobs.db").exists()
+    finally:
+        _stop(proc)
@@ -0,0 +1,75 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from src.core.jobs import JobManager
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Another process owning the jobs: it submits them, prints their ids, then
+# prints every job's final state once they have all finished
+OWNER = textwrap.dedent(
+    """
+    import json, sys, time
+    sys.path[:0] = [sys.argv[2], sys.argv[3]]
+    from src.core.jobs import JobManager
+
+    manager = JobManager(workers=1, db_path=sys.argv[1])
+    jobs = [manager.submit(time.sleep, float(s)) for s in sys.argv[4:]]
+    print(json.dumps([job["job_id"] for job in jobs]), flush=True)
+    print(json.dumps([manager.wait(job["job_id"], 30)["status"] for job in jobs]), flush=True)
+    time.sleep(30)  # stay up like a server would; the test kills it
+    """
+)
+
+
+@pytest.fixture
+def owner(tmp_path):
+    db = str(tmp_path / "jobs.db")
+    procs = []
+
+    def start(*sleeps):
+        proc = subprocess.Popen(
+            [sys.executable, "-c", OWNER, db, BACKEND_DIR, os.path.dirname(BACKEND_DIR), *map(str, sleeps)],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        procs.append(proc)
+        return proc, json.loads(proc.stdout.readline())
+
+    yield db, start
+    for proc in procs:
+        proc.kill()
+        proc.wait()
+
+
+def test_job_is_polled_from_another_process(owner):
+    db, start = owner
+    proc, (job_id,) = start(0.3)
+    other = JobManager(db_path=db)
+
+    assert other.get(job_id)["status"] in ("queued", "running")
+    assert other.wait(job_id, 10)["status"] == "done"
+    assert json.loads(proc.stdout.readline()) == ["done"]
+    assert other.get("no-such-job") is None
+
+
+def test_job_is_cancelled_from_another_process(owner):
+    db, start = owner
+    # One worker: the first job runs while the second waits in the queue
+    proc, (running, queued) = start(1.0, 0.1)
+    other = JobManager(db_path=db)
+    assert other.wait(running, 0) is not None
+
+    for job_id in (running, queued):
+        cancelled = other.cancel(job_id)
+        assert cancelled["cancel_requested"] is True
+
+    assert json.loads(proc.stdout.readline()) == ["cancelled", "cancelled"]
+    # The owner stores the final state just after waking its own waiters
+    assert other.wait(running, 5)["status"] == "cancelled"
+    assert other.wait(queued, 5)["status"] == "cancelled"
@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+from src.ai.llm_client import LocalLLMClient
+from src.core.metrics import PROMPT_TOKENS_CACHED, PROMPT_TOKENS_EVALUATED
+from src.llm.backends import LlamaCppBackend
+from src.llm.model_registry import get_model_path
+
+MODEL = "llama3:8b"
+SYSTEM = {"role": "system", "content": "You explain triage results in plain words."}
+
+
+class _FakeLlama:
+    """Just enough of ``llama_cpp.Llama`` for the backend: one token per word."""
+
+    metadata = {}
+
+    def tokenize(self, text, add_bos=True, special=False):
+        return [hash(word) for word in text.decode("utf-8").split()]
+
+    def create_chat_completion(self, messages, stream=False, **kwargs):
+        assert stream
+        for word in ("Rest", " and", " fluids."):
+            yield {"choices": [{"delta": {"content": word}}]}
+
+
+@pytest.fixture
+def local_model():
+    path = str(get_model_path(MODEL))
+    LlamaCppBackend._models[path] = (_FakeLlama(), threading.Lock())
+    yield
+    LlamaCppBackend.unload(MODEL)
+
+
+def test_streamed_replies_count_prompt_tokens(local_model):
+    client = LocalLLMClient(MODEL)
+    cached = PROMPT_TOKENS_CACHED.value(model=MODEL)
+    evaluated = PROMPT_TOKENS_EVALUATED.value(model=MODEL)
+
+    reply = "".join(client.stream_chat([SYSTEM, {"role": "user", "content": "fever two days"}]))
+    assert reply == "Rest and fluids."
+    assert PROMPT_TOKENS_CACHED.value(model=MODEL) == cached
+    assert PROMPT_TOKENS_EVALUATED.value(model=MODEL) == evaluated + 10
+
+    "".join(client.stream_chat([SYSTEM, {"role": "user", "content": "sore throat"}]))
+    # The system prompt's 7 tokens are shared with the previous prompt
+    assert PROMPT_TOKENS_CACHED.value(model=MODEL) == cached + 7
+    assert PROMPT_TOKENS_EVALUATED.value(model=MODEL) == evaluated + 10 + 2
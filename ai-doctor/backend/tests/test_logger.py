@@ -0,0 +1,48 @@
+import logging
+
+import pytest
+
+from src.core import logger as logging_setup
+from src.core.config import config
+
+
+class _Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record.getMessage(), record.exc_info is not None))
+
+
+@pytest.fixture
+def sync_logger(monkeypatch):
+    """``setup_logging`` with LOG_ASYNC=False and two capturing sinks."""
+    log = logging.getLogger("aidoffline")
+    saved = (log.handlers[:], log.filters[:])
+    log.handlers, log.filters = [], []
+    sinks = [_Capture(), _Capture()]
+    monkeypatch.setattr(config, "LOG_ASYNC", False)
+    monkeypatch.setattr(config, "LOG_ERROR_BURST", 2)
+    monkeypatch.setattr(config, "LOG_ERROR_WINDOW", 60)
+    monkeypatch.setattr(logging_setup, "_sinks", [])
+    monkeypatch.setattr(logging_setup, "_build_sinks", lambda: sinks)
+    try:
+        yield logging_setup.setup_logging(), sinks
+    finally:
+        log.handlers, log.filters = saved
+
+
+def test_sync_sinks_share_one_rate_limit(sync_logger):
+    log, sinks = sync_logger
+    for _ in range(4):
+        try:
+            raise RuntimeError("boom")
+        except RuntimeError:
+            log.exception("Request failed")
+
+    # LOG_ERROR_BURST records per window, counted once for both sinks; only
+    # the first keeps its traceback, and every sink sees the same thing
+    expected = [("Request failed", True), ("Request failed", False)]
+    assert sinks[0].records == expected
+    assert sinks[1].records == expected
@@ -0,0 +1,46 @@
+import pytest
+
+from src.ai.triage_rules import TriageIndex
+
+
+@pytest.fixture
+def index():
+    return TriageIndex()
+
+
+@pytest.mark.parametrize(
+    "symptoms, free_text",
+    [
+        (["headache with vision loss"], None),
+        (["headache"], "vision loss"),
+        (["runny nose"], "and ear pain with pus"),
+        (["runny nose for my 2 month old"], None),
+        (["diarrhea"], "no urine all day, very drowsy"),
+    ],
+)
+def test_unrecognized_words_fall_through(index, symptoms, free_text):
+    assert index.assess(symptoms, free_text, {}) is None
+    assert index.stats()["outcomes"] == {"unknown_symptom": 1}
+
+
+def test_filler_words_still_answer(index):
+    result = index.assess(["mild runny nose since yesterday", "sneezing"], "I have a slight sore throat", {})
+    assert result is not None
+    assert result["structured"]["diagnoses"][0]["name"] == "Common cold"
+
+
+@pytest.mark.parametrize("age", ["80", "1", "eighty", [30]])
+def test_age_outside_range_or_unparseable_is_excluded(index, age):
+    assert index.assess(["runny nose", "sneezing"], None, {"age": age}) is None
+    assert index.stats()["outcomes"] == {"excluded": 1}
+
+
+@pytest.mark.parametrize("age", ["30", 30, 30.5, None, ""])
+def test_age_in_range_is_answered(index, age):
+    assert index.assess(["runny nose", "sneezing"], None, {"age": age}) is not None
+
+
+@pytest.mark.parametrize("free_text", ["chest pain", "শ্বাসকষ্ট", "stiff neck"])
+def test_red_flags_take_the_slow_path(index, free_text):
+    assert index.assess(["headache"], free_text, {}) is None
+    assert index.stats()["outcomes"] == {"red_flag": 1}
@@ -0,0 +1,25 @@
+"""Production WSGI entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Background services (model warm-up, re-planning) are not started here:
+with ``preload_app`` this module is imported once in the gunicorn master,
+and each worker starts its own in the ``post_fork`` hook.
+"""
+
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# backend/src and ai-doctor/src together form the "src" namespace package
+for path in (BACKEND_DIR, os.path.dirname(BACKEND_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from app import create_app  # noqa: E402
+from src.ai.diagnosis_orchestrator import get_orchestrator  # noqa: E402
+
+app = create_app(start_background=False)
+# Build the orchestrator (rule indexes, caches, clients) in the master so the
+# workers share it copy-on-write instead of each building it on first request
+get_orchestrator()
@@ -1,18 +1,566 @@
-from huggingface_hub import hf_hub_download
-
-# Change these to the model/repo and file you want
-REPO_ID = "TheBloke/openchat-3.5-1210-GGUF"
-FILENAME = "openchat-3.5-1210.Q3_K_S.gguf"
-LOCAL_DIR = "models/reasoning"
-
-def main():
-    path = hf_hub_download(
-        repo_id=REPO_ID,
-        filename=FILENAME,
-        local_dir=LOCAL_DIR,
-        local_dir_use_symlinks=False,
+"""Fetch the GGUF models this machine's tier needs.
+
+The manifest is derived from ``MODEL_FILES``/``MODEL_SOURCES`` in
+``src/llm/model_registry.py`` and, unless ``--all`` or ``--models`` is
+given, limited to the models the runtime planner (``build_plan()``) picks
+for this machine, i.e. what the backend will load once the files are there.
+``--manifest`` merges a JSON file of ``{name: {url, sha256}}`` over it
+(e.g. to pin checksums or point at another source).
+
+Each file is fetched in parallel ranged chunks into ``<file>.part``.
+Completed chunks are recorded in ``<file>.part.json``, so an interrupted run
+(dropped link, Ctrl-C, power cut) resumes where it stopped. SHA-256 is
+computed while chunks land (over the contiguous prefix written so far) and
+checked before the file is moved into place. The digest is also written to
+``<file>.sha256``.
+
+A file without a pinned digest is checked against the one its source
+publishes: Hugging Face's ``X-Linked-Etag`` (the LFS object's SHA-256), or a
+``<file>.sha256`` next to it on a mirror (as this script writes). A file
+nothing could be checked against fails the run unless ``--allow-unverified``.
+
+    python download_gguf.py                              # the models this machine will run
+    python download_gguf.py --tier HIGH --dry-run        # show the manifest only
+    python download_gguf.py --mirror http://10.0.0.5:8000 --connections 8
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from src.llm.model_registry import MODEL_FILES, build_manifest
+from src.system.model_planner import build_plan
+
+BLOCK_SIZE = 256 * 1024
+USER_AGENT = "ai-doctor-fetcher/1.0"
+
+
+class FetchError(Exception):
+    pass
+
+
+def _request(url: str, start: Optional[int] = None, end: Optional[int] = None) -> urllib.request.Request:
+    headers = {"User-Agent": USER_AGENT}
+    if start is not None:
+        headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+    token = os.getenv("HF_TOKEN")
+    if token and (urlsplit(url).hostname or "").endswith("huggingface.co"):
+        headers["Authorization"] = f"Bearer {token}"
+    return urllib.request.Request(url, headers=headers)
+
+
+def _retryable(err: Exception) -> bool:
+    if isinstance(err, urllib.error.HTTPError):
+        return err.code >= 500 or err.code in (408, 429)
+    return True
+
+
+def probe(url: str, timeout: float) -> Tuple[Optional[int], bool]:
+    """(size, supports_ranges) from a one-byte ranged GET."""
+    with urllib.request.urlopen(_request(url, 0, 0), timeout=timeout) as resp:
+        if resp.status == 206:
+            total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+            return (int(total) if total.isdigit() else None), True
+        length = resp.headers.get("Content-Length")
+        return (int(length) if length else None), False
+
+
+_SHA256_RE = re.compile(r"[0-9a-f]{64}")
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None  # surface the 3xx, whose headers carry the LFS metadata
+
+
+def _as_sha256(value: Optional[str]) -> str:
+    value = (value or "").strip().lower()
+    if value.startswith("w/"):
+        value = value[2:]
+    value = value.strip('"')
+    return value if _SHA256_RE.fullmatch(value) else ""
+
+
+def published_sha256(url: str, timeout: float) -> Tuple[str, str]:
+    """``(digest, source)`` the server publishes for ``url``; ``("", "")`` if none.
+
+    Hugging Face answers a ``resolve`` URL with a redirect whose
+    ``X-Linked-Etag`` is the SHA-256 of the LFS object. A mirror may instead
+    serve ``<file>.sha256`` in ``sha256sum`` format next to the file.
+    """
+    req = _request(url)
+    req.method = "HEAD"
+    try:
+        with urllib.request.build_opener(_NoRedirect).open(req, timeout=timeout) as resp:
+            headers = resp.headers
+    except urllib.error.HTTPError as e:
+        headers = e.headers
+    except OSError:
+        headers = None
+    digest = _as_sha256(headers.get("X-Linked-Etag") if headers else None)
+    if digest:
+        return digest, "lfs"
+
+    try:
+        with urllib.request.urlopen(_request(url + ".sha256"), timeout=timeout) as resp:
+            text = resp.read(4096).decode("ascii", "replace")
+    except OSError:
+        return "", ""
+    digest = _as_sha256(text.split()[0] if text.split() else "")
+    return (digest, "sidecar") if digest else ("", "")
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(4 * 1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _fmt_mb(n: float) -> str:
+    return f"{n / (1024 * 1024):.1f} MB"
+
+
+def _fmt_eta(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+
+class Progress:
+    """Byte counter with a periodic throughput line."""
+
+    def __init__(self, name: str, total: Optional[int], already: int, every: float):
+        self.name = name
+        self.total = total
+        self.done = already
+        self.new = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._every = every
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, n: int) -> None:
+        with self._lock:
+            self.done += n
+            self.new += n
+
+    def start(self) -> "Progress":
+        if self._every > 0:
+            self._thread = threading.Thread(target=self._report, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.new / elapsed if elapsed > 0 else 0.0
+
+    def _report(self) -> None:
+        last_new, last_t = 0, time.monotonic()
+        while not self._stop.wait(self._every):
+            now = time.monotonic()
+            with self._lock:
+                done, new = self.done, self.new
+            current = (new - last_new) / (now - last_t) if now > last_t else 0.0
+            last_new, last_t = new, now
+            line = f"  {self.name}: {_fmt_mb(done)}"
+            if self.total:
+                line += f" / {_fmt_mb(self.total)} ({done / self.total:.0%})"
+            line += f"  {current / (1024 * 1024):.2f} MB/s"
+            if self.total and current > 0:
+                line += f"  ETA {_fmt_eta((self.total - done) / current)}"
+            print(line, flush=True)
+
+
+class ChunkedDownload:
+    """One file: parallel ranged chunks, resumable, hashed as it lands."""
+
+    def __init__(
+        self,
+        entry: Dict[str, Any],
+        connections: int = 4,
+        chunk_size: int = 8 * 1024 * 1024,
+        timeout: float = 30,
+        retries: int = 5,
+        report_every: float = 2.0,
+    ):
+        self.name = entry["name"]
+        self.url = entry["url"]
+        self.dest = entry["path"]
+        self.expected = (entry.get("sha256") or "").lower()
+        self.connections = max(1, connections)
+        self.chunk_size = max(BLOCK_SIZE, chunk_size)
+        self.timeout = timeout
+        self.retries = retries
+        self.report_every = report_every
+
+        self.part = self.dest + ".part"
+        self.state_path = self.part + ".json"
+        self.size: Optional[int] = None
+        self._done: set = set()
+        self._state_lock = threading.Lock()
+        self._hash = hashlib.sha256()
+        self._hashed = 0  # chunks folded into _hash, in order
+        self._hash_lock = threading.Lock()
+        self._abort = threading.Event()
+        self.progress: Optional[Progress] = None
+
+    # ---- public ----
+
+    def run(self) -> Dict[str, Any]:
+        size, ranges = self._probe()
+        self.size = size
+        os.makedirs(os.path.dirname(self.dest) or ".", exist_ok=True)
+        resumed = self._load_state() if ranges and size else 0
+        self._check_disk(size, resumed)
+
+        self.progress = Progress(self.name, size, resumed, self.report_every).start()
+        started = time.monotonic()
+        try:
+            if ranges and size:
+                self._run_chunked()
+            else:
+                self._run_single()
+        except KeyboardInterrupt:
+            self._abort.set()
+            raise
+        finally:
+            self.progress.stop()
+        elapsed = time.monotonic() - started
+
+        digest = self._hash.hexdigest()
+        if self.expected and digest != self.expected:
+            self._discard()
+            raise FetchError(f"SHA-256 mismatch: expected {self.expected}, got {digest}")
+        os.replace(self.part, self.dest)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        with open(self.dest + ".sha256", "w", encoding="utf-8") as f:
+            f.write(f"{digest}  {os.path.basename(self.dest)}\n")
+
+        return {
+            "name": self.name,
+            "status": "downloaded",
+            "bytes": os.path.getsize(self.dest),
+            "resumed_bytes": resumed,
+            "seconds": round(elapsed, 2),
+            "mb_per_s": round(self.progress.rate() / (1024 * 1024), 2),
+            "sha256": digest,
+            "verified": bool(self.expected),
+        }
+
+    def _probe(self) -> Tuple[Optional[int], bool]:
+        for attempt in range(self.retries + 1):
+            try:
+                return probe(self.url, self.timeout)
+            except OSError as e:
+                if attempt == self.retries or not _retryable(e):
+                    raise
+                time.sleep(min(30, 2 ** attempt))
+        raise FetchError("unreachable")
+
+    # ---- chunked path ----
+
+    def _chunks(self) -> int:
+        return (self.size + self.chunk_size - 1) // self.chunk_size
+
+    def _run_chunked(self) -> None:
+        if not self._done:
+            # Nothing to resume: start from an empty file of the final size
+            with open(self.part, "wb") as f:
+                f.truncate(self.size)
+        # Chunks finished by an earlier run are re-hashed from disk first
+        self._advance_hash()
+        todo = [i for i in range(self._chunks()) if i not in self._done]
+        with ThreadPoolExecutor(max_workers=self.connections, thread_name_prefix="fetch") as pool:
+            futures = [pool.submit(self._fetch_chunk, i) for i in todo]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                self._abort.set()
+                raise
+        self._advance_hash()
+        if self._hashed != self._chunks():
+            raise FetchError("download incomplete")
+
+    def _fetch_chunk(self, index: int) -> None:
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, self.size) - 1
+        pos = start  # a retry continues where the dropped connection stopped
+        failures = 0
+        while not self._abort.is_set():
+            progressed = False
+            try:
+                with open(self.part, "r+b") as f, urllib.request.urlopen(
+                    _request(self.url, pos, end), timeout=self.timeout
+                ) as resp:
+                    if resp.status != 206:
+                        raise FetchError(f"server ignored the Range header (HTTP {resp.status})")
+                    f.seek(pos)
+                    try:
+                        while pos <= end and not self._abort.is_set():
+                            block = resp.read(min(BLOCK_SIZE, end - pos + 1))
+                            if not block:
+                                break
+                            f.write(block)
+                            pos += len(block)
+                            progressed = True
+                            self.progress.add(len(block))
+                    finally:
+                        f.flush()
+                    if self._abort.is_set():
+                        return
+                    if pos <= end:
+                        raise FetchError(f"connection closed {end - pos + 1} bytes short")
+                    os.fsync(f.fileno())
+                self._chunk_done(index)
+                return
+            except (OSError, FetchError) as e:
+                # Only consecutive attempts without progress count towards the limit
+                failures = 1 if progressed else failures + 1
+                if failures > self.retries or not _retryable(e):
+                    raise FetchError(f"chunk {index} failed: {e}") from e
+                time.sleep(min(30, 2 ** (failures - 1)))
+
+    def _chunk_done(self, index: int) -> None:
+        with self._state_lock:
+            self._done.add(index)
+            self._save_state()
+        self._advance_hash()
+
+    def _advance_hash(self) -> None:
+        """Fold newly contiguous chunks into the digest (read back from page cache)."""
+        with self._hash_lock:
+            with open(self.part, "rb") as f:
+                while True:
+                    with self._state_lock:
+                        ready = self._hashed in self._done
+                    if not ready:
+                        return
+                    f.seek(self._hashed * self.chunk_size)
+                    remaining = min(self.chunk_size, self.size - self._hashed * self.chunk_size)
+                    while remaining > 0:
+                        block = f.read(min(4 * 1024 * 1024, remaining))
+                        if not block:
+                            raise FetchError("part file shorter than expected")
+                        self._hash.update(block)
+                        remaining -= len(block)
+                    self._hashed += 1
+
+    # ---- single-stream path (no Range support) ----
+
+    def _run_single(self) -> None:
+        for attempt in range(self.retries + 1):
+            written = 0
+            self._hash = hashlib.sha256()
+            try:
+                with open(self.part, "wb") as f, urllib.request.urlopen(
+                    _request(self.url), timeout=self.timeout
+                ) as resp:
+                    for block in iter(lambda: resp.read(BLOCK_SIZE), b""):
+                        f.write(block)
+                        self._hash.update(block)
+                        written += len(block)
+                        self.progress.add(len(block))
+                if self.size is not None and written != self.size:
+                    raise FetchError(f"short read ({written} of {self.size} bytes)")
+                return
+            except (OSError, FetchError) as e:
+                self.progress.add(-written)
+                if attempt == self.retries or not _retryable(e):
+                    raise FetchError(f"download failed: {e}") from e
+                time.sleep(min(30, 2 ** attempt))
+
+    # ---- resume state ----
+
+    def _load_state(self) -> int:
+        """Restore finished chunks from an earlier run; returns the bytes already on disk."""
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        if (
+            state.get("url") != self.url
+            or state.get("size") != self.size
+            or state.get("chunk_size") != self.chunk_size
+            or not os.path.exists(self.part)
+        ):
+            self._discard()
+            return 0
+        self._done = {int(i) for i in state.get("done", [])}
+        if self._done:
+            print(f"  {self.name}: resuming, {len(self._done)}/{self._chunks()} chunks already on disk")
+        return sum(min(self.chunk_size, self.size - i * self.chunk_size) for i in self._done)
+
+    def _save_state(self) -> None:
+        """Caller holds the state lock."""
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {"url": self.url, "size": self.size, "chunk_size": self.chunk_size, "done": sorted(self._done)},
+                f,
+            )
+        os.replace(tmp, self.state_path)
+
+    def _discard(self) -> None:
+        for path in (self.part, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._done = set()
+
+    def _check_disk(self, size: Optional[int], resumed: int) -> None:
+        if not size:
+            return
+        free = shutil.disk_usage(os.path.dirname(self.dest) or ".").free
+        needed = size - resumed
+        if free < needed:
+            raise FetchError(f"not enough disk space: need {_fmt_mb(needed)}, {_fmt_mb(free)} free")
+
+
+def select_models(args: argparse.Namespace) -> List[str]:
+    if args.models:
+        return [m.strip() for m in args.models.split(",") if m.strip()]
+    if args.all:
+        return list(MODEL_FILES)
+    # Missing files must not rule a model out: they are what we are here to fetch
+    plan = build_plan(tier=args.tier, require_files=False)
+    models = plan["models"]
+    print(f"Tier {plan['tier']}: {', '.join(f'{role}={m}' for role, m in models.items() if m)}")
+    return list(dict.fromkeys(m for m in models.values() if m))
+
+
+def load_manifest(args: argparse.Namespace, models: List[str]) -> List[Dict[str, Any]]:
+    entries = build_manifest(models, mirror=args.mirror, models_dir=args.dest)
+    unknown = [m for m in models if m not in MODEL_FILES]
+    if unknown:
+        print(f"Not in the model registry (served by the LLM server only?): {', '.join(unknown)}")
+    if args.manifest:
+        with open(args.manifest, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+        for entry in entries:
+            extra = overrides.get(entry["name"]) or {}
+            entry.update({k: v for k, v in extra.items() if k in ("url", "sha256")})
+    return entries
+
+
+def fetch(entry: Dict[str, Any], args: argparse.Namespace) -> Dict[str, Any]:
+    result = {"name": entry["name"], "path": entry["path"]}
+    if not entry["url"]:
+        return dict(result, status="no_source", error="no url registered; pass --mirror or --manifest")
+    present = os.path.exists(entry["path"]) and not args.force
+    if present and not args.verify:
+        return dict(result, status="present")
+    if not entry["sha256"]:
+        digest, source = published_sha256(entry["url"], args.timeout)
+        if digest:
+            print(f"  {entry['name']}: expecting sha256 {digest[:16]}… (from {source})")
+            entry = dict(entry, sha256=digest)
+    if present:
+        if not entry["sha256"]:
+            return dict(result, status="present")
+        digest = sha256_file(entry["path"])
+        if digest == entry["sha256"]:
+            return dict(result, status="present", sha256=digest, verified=True)
+        print(f"  {entry['name']}: checksum mismatch on disk, downloading again")
+
+    download = ChunkedDownload(
+        entry,
+        connections=args.connections,
+        chunk_size=int(args.chunk_mb * 1024 * 1024),
+        timeout=args.timeout,
+        retries=args.retries,
+        report_every=args.report_every,
+    )
+    try:
+        return dict(result, **download.run())
+    except (OSError, FetchError) as e:
+        return dict(result, status="failed", error=str(e))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Download the GGUF models this machine needs")
+    parser.add_argument("--tier", choices=("LOW", "MEDIUM", "HIGH"), help="start from this tier's models instead of the probed tier")
+    parser.add_argument("--models", help="comma list of registry names (overrides the tier plan)")
+    parser.add_argument("--all", action="store_true", help="every model in the registry")
+    parser.add_argument("--mirror", default=os.getenv("MODEL_MIRROR"), help="base URL laid out like models/")
+    parser.add_argument("--dest", help="models directory to fill (default: the registry's MODELS_DIR)")
+    parser.add_argument("--manifest", help="JSON {name: {url, sha256}} merged over the registry")
+    parser.add_argument("--connections", type=int, default=4, help="parallel ranged requests per file")
+    parser.add_argument("--chunk-mb", type=float, default=8.0, help="chunk size (also the resume granularity)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="connect/read timeout per request (s)")
+    parser.add_argument("--retries", type=int, default=5, help="retries per chunk, with backoff")
+    parser.add_argument("--report-every", type=float, default=2.0, help="seconds between progress lines (0 = off)")
+    parser.add_argument("--verify", action="store_true", help="re-hash files already on disk")
+    parser.add_argument(
+        "--allow-unverified", action="store_true", help="do not fail when no SHA-256 could be checked"
     )
-    print("Downloaded to:", path)
+    parser.add_argument("--force", action="store_true", help="download even if the file exists")
+    parser.add_argument("--dry-run", action="store_true", help="print the manifest and exit")
+    args = parser.parse_args()
+
+    entries = load_manifest(args, select_models(args))
+    if args.dry_run:
+        print(json.dumps(entries, indent=2))
+        return
+
+    results = []
+    try:
+        for entry in entries:
+            print(f"{entry['name']} -> {entry['path']}")
+            results.append(fetch(entry, args))
+    except KeyboardInterrupt:
+        print("\nInterrupted; run again to resume from the finished chunks.")
+        sys.exit(130)
+
+    print("\nSummary:")
+    failed = False
+    unverified: List[str] = []
+    for r in results:
+        line = f"  {r['name']:<18} {r['status']}"
+        if r["status"] == "downloaded":
+            line += (
+                f"  {_fmt_mb(r['bytes'])} in {r['seconds']:.1f}s ({r['mb_per_s']:.2f} MB/s"
+                + (f", {_fmt_mb(r['resumed_bytes'])} resumed" if r["resumed_bytes"] else "")
+                + ")"
+                + ("  sha256 ok" if r["verified"] else f"  sha256 {r['sha256'][:16]}… NOT VERIFIED")
+            )
+            if not r["verified"]:
+                unverified.append(r["name"])
+        elif r.get("verified"):
+            line += "  sha256 ok"
+        if r.get("error"):
+            line += f"  {r['error']}"
+        # A model left without a file is as much a failure as a broken download
+        failed = failed or r["status"] in ("failed", "no_source")
+        print(line)
+    if unverified:
+        print(
+            f"\nWARNING: no SHA-256 was published or pinned for {', '.join(unverified)}; "
+            "the download could not be checked. Pin the digest with --manifest"
+            + (" (continuing: --allow-unverified)." if args.allow_unverified else ", or pass --allow-unverified.")
+        )
+        failed = failed or not args.allow_unverified
+    sys.exit(1 if failed else 0)
+
 
 if __name__ == "__main__":
     main()
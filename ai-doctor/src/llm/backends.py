@@ -1,9 +1,205 @@
-from typing import List, Dict
+import os
+import queue
+import threading
+from typing import Any, Dict, Generator, List, Optional, Tuple
+
+from .model_registry import get_model_path
+
+_END = object()  # end-of-stream marker
+
 
 class LLMBackend:
     def chat(self, messages: List[Dict[str, str]]) -> str:
         raise NotImplementedError
 
+    def stream_chat(
+        self, messages: List[Dict[str, str]]
+    ) -> Generator[str, None, Optional[Dict[str, int]]]:
+        # Backends without native streaming yield the whole reply at once.
+        # The generator's return value is the prompt ``timings``, if known.
+        yield self.chat(messages)
+        return None
+
     @property
     def supports_vision(self) -> bool:
         return False
+
+
+class LlamaCppBackend(LLMBackend):
+    """In-process llama.cpp inference over the registered GGUF files.
+
+    Models are opened memory-mapped (the weights stay in the page cache and
+    are shared with any other process mapping the same file) and loaded once
+    per process: every backend instance for the same file reuses the same
+    ``Llama`` object. llama.cpp contexts are not thread-safe, so calls on one
+    model are serialized with a per-model lock.
+    """
+
+    _models: Dict[str, Tuple[Any, threading.Lock]] = {}
+    _last_prompt: Dict[str, List[int]] = {}
+    _formatters: Dict[str, Any] = {}
+    _load_lock = threading.Lock()
+
+    def __init__(
+        self,
+        model_name: str,
+        n_ctx: int = 4096,
+        n_threads: int = 0,
+        n_gpu_layers: int = 0,
+        prompt_cache_bytes: int = 0,
+    ):
+        self.model_name = model_name
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads or os.cpu_count() or 1
+        self.n_gpu_layers = n_gpu_layers
+        self.prompt_cache_bytes = prompt_cache_bytes
+
+    @classmethod
+    def loaded_models(cls) -> List[str]:
+        with cls._load_lock:
+            return list(cls._models)
+
+    @classmethod
+    def unload(cls, model_name: str) -> None:
+        path = str(get_model_path(model_name))
+        with cls._load_lock:
+            cls._models.pop(path, None)
+            cls._last_prompt.pop(path, None)
+            cls._formatters.pop(path, None)
+
+    def _get_model(self) -> Tuple[Any, threading.Lock]:
+        path = str(get_model_path(self.model_name))
+        entry = self._models.get(path)
+        if entry is not None:
+            return entry
+        with self._load_lock:
+            entry = self._models.get(path)
+            if entry is None:
+                try:
+                    from llama_cpp import Llama
+                except ImportError as e:
+                    raise RuntimeError(
+                        "LLM_BACKEND=llamacpp needs the llama-cpp-python package"
+                    ) from e
+                if not os.path.isfile(path):
+                    raise FileNotFoundError(f"GGUF for {self.model_name} not found at {path}")
+                llm = Llama(
+                    model_path=path,
+                    n_ctx=self.n_ctx,
+                    n_threads=self.n_threads,
+                    n_gpu_layers=self.n_gpu_layers,
+                    use_mmap=True,
+                    use_mlock=False,
+                    verbose=False,
+                )
+                if self.prompt_cache_bytes > 0:
+                    # Saved KV states keyed by prompt prefix: the constant
+                    # system prompts are evaluated once, not on every call
+                    from llama_cpp import LlamaRAMCache
+
+                    llm.set_cache(LlamaRAMCache(capacity_bytes=self.prompt_cache_bytes))
+                entry = (llm, threading.Lock())
+                self._models[path] = entry
+            return entry
+
+    def _prompt_text(self, llm: Any, path: str, messages: List[Dict[str, str]]) -> Tuple[str, bool]:
+        """The prompt as ``create_chat_completion`` renders it, and whether it is templated.
+
+        Uses the GGUF's own chat template, as llama-cpp-python does when no
+        ``chat_format`` is forced; without one, falls back to the joined contents.
+        """
+        formatter = self._formatters.get(path)
+        if formatter is None:
+            formatter = False
+            template = (getattr(llm, "metadata", None) or {}).get("tokenizer.chat_template")
+            if template:
+                from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+
+                def special(token: int) -> str:
+                    if token == -1:
+                        return ""
+                    return llm.detokenize([token], special=True).decode("utf-8", "ignore")
+
+                formatter = Jinja2ChatFormatter(
+                    template=template, eos_token=special(llm.token_eos()), bos_token=special(llm.token_bos())
+                )
+            self._formatters[path] = formatter
+        if formatter:
+            return formatter(messages=messages).prompt, True
+        return "\n".join(str(m.get("content", "")) for m in messages), False
+
+    def _prefix_stats(self, llm: Any, messages: List[Dict[str, str]]) -> Dict[str, int]:
+        """Approximate prefill reuse as the token prefix shared with the last prompt.
+
+        llama.cpp reuses exactly the longest common token prefix of the
+        evaluated context, so this mirrors what it skips. Caller holds the lock.
+        """
+        path = str(get_model_path(self.model_name))
+        text, templated = self._prompt_text(llm, path, messages)
+        if templated:
+            # The template writes BOS and the role markers out as text
+            tokens = llm.tokenize(text.encode("utf-8"), add_bos=False, special=True)
+        else:
+            tokens = llm.tokenize(text.encode("utf-8"), add_bos=False)
+        previous = self._last_prompt.get(path, [])
+        shared = 0
+        for a, b in zip(previous, tokens):
+            if a != b:
+                break
+            shared += 1
+        self._last_prompt[path] = tokens
+        return {"cache_n": shared, "prompt_n": len(tokens) - shared}
+
+    def complete(self, messages: List[Dict[str, str]], **kwargs: Any) -> Dict[str, Any]:
+        """Full OpenAI-shaped response (choices + usage, plus prefix ``timings``)."""
+        llm, lock = self._get_model()
+        with lock:
+            timings = self._prefix_stats(llm, messages)
+            response = llm.create_chat_completion(messages=messages, **kwargs)
+        response["timings"] = timings
+        return response
+
+    def chat(self, messages: List[Dict[str, str]], **kwargs: Any) -> str:
+        response = self.complete(messages, **kwargs)
+        return response["choices"][0]["message"]["content"]
+
+    def stream_chat(
+        self, messages: List[Dict[str, str]], **kwargs: Any
+    ) -> Generator[str, None, Optional[Dict[str, int]]]:
+        """Yield reply deltas, then return the prompt prefix ``timings``.
+
+        Generation runs on its own thread under the model lock and feeds an
+        unbounded queue, so a slow or disconnected consumer never holds the
+        lock; closing the generator stops generation at the next token.
+        """
+        llm, lock = self._get_model()
+        deltas: "queue.Queue[Any]" = queue.Queue()
+        stop = threading.Event()
+        timings: Dict[str, int] = {}
+
+        def generate() -> None:
+            try:
+                with lock:
+                    timings.update(self._prefix_stats(llm, messages))
+                    for chunk in llm.create_chat_completion(messages=messages, stream=True, **kwargs):
+                        if stop.is_set():
+                            break
+                        delta = chunk["choices"][0].get("delta", {}).get("content")
+                        if delta:
+                            deltas.put(delta)
+            except Exception as e:
+                deltas.put(e)
+            finally:
+                deltas.put(_END)
+
+        threading.Thread(target=generate, name="llamacpp-stream", daemon=True).start()
+        try:
+            while True:
+                item = deltas.get()
+                if item is _END:
+                    return timings or None
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
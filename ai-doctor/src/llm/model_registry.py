@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Dict
+from typing import Any, Dict, Iterable, List, Optional
 
 BASE_DIR = Path(__file__).resolve().parents[2]  # adjust if needed
 MODELS_DIR = BASE_DIR / "models"
@@ -8,9 +8,100 @@ MODEL_FILES: Dict[str, str] = {
     "openchat:3.5-q3": "reasoning/openchat-3.5-1210.Q3_K_S.gguf",
     "gemma:2b": "reasoning/gemma-2b.gguf",
     "qwen3:8b": "reasoning/qwen3-8b.gguf",
+    "llama3:8b": "explain/llama3-8b.Q4_K_M.gguf",
     "qwen2.5vl:7b": "vision/qwen2.5-vl-7b.gguf",
 }
 
+# Where download_gguf.py fetches each GGUF from. ``sha256`` pins the expected
+# digest; empty = trust the digest the source publishes (Hugging Face's
+# X-Linked-Etag, or a ``.sha256`` file on a mirror).
+# Models without a ``url`` can only be fetched from a mirror laid out like
+# MODELS_DIR (``--mirror`` / MODEL_MIRROR).
+MODEL_SOURCES: Dict[str, Dict[str, str]] = {
+    "openchat:3.5-q3": {
+        "url": "https://huggingface.co/TheBloke/openchat-3.5-1210-GGUF/resolve/main/openchat-3.5-1210.Q3_K_S.gguf",
+        "sha256": "",
+    },
+    "gemma:2b": {
+        "url": "https://huggingface.co/second-state/Gemma-2b-it-GGUF/resolve/main/gemma-2b-it-Q4_K_M.gguf",
+        "sha256": "",
+    },
+    "qwen3:8b": {
+        "url": "https://huggingface.co/Qwen/Qwen3-8B-GGUF/resolve/main/Qwen3-8B-Q4_K_M.gguf",
+        "sha256": "",
+    },
+    "llama3:8b": {
+        "url": "https://huggingface.co/QuantFactory/Meta-Llama-3-8B-Instruct-GGUF/resolve/main/Meta-Llama-3-8B-Instruct.Q4_K_M.gguf",
+        "sha256": "",
+    },
+    # Language model weights only; llama.cpp also needs the matching mmproj file for images
+    "qwen2.5vl:7b": {
+        "url": "https://huggingface.co/ggml-org/Qwen2.5-VL-7B-Instruct-GGUF/resolve/main/Qwen2.5-VL-7B-Instruct-Q4_K_M.gguf",
+        "sha256": "",
+    },
+}
+
+# Approximate weight size (GB) at the registered quantization, used when the
+# GGUF file is not on disk (e.g. the model is served by Ollama)
+MODEL_SIZE_HINTS_GB: Dict[str, float] = {
+    "openchat:3.5-q3": 3.2,
+    "gemma:2b": 1.7,
+    "qwen3:8b": 5.2,
+    "llama3:8b": 4.9,
+    "qwen2.5vl:7b": 6.0,
+}
+
+# Runtime overhead on top of the weights: KV cache, compute buffers
+RUNTIME_OVERHEAD_GB = 0.6
+
 def get_model_path(model_name: str) -> Path:
     rel = MODEL_FILES[model_name]
     return MODELS_DIR / rel
+
+def model_file_size_gb(model_name: str) -> Optional[float]:
+    """Size of the registered GGUF file, or None if it is not on disk."""
+    if model_name not in MODEL_FILES:
+        return None
+    path = get_model_path(model_name)
+    if not path.is_file():
+        return None
+    return path.stat().st_size / (1024**3)
+
+def is_model_available(model_name: str) -> bool:
+    return model_file_size_gb(model_name) is not None
+
+def estimate_footprint_gb(model_name: str) -> Optional[float]:
+    """Estimated resident memory for a loaded model, or None if unknown."""
+    size = model_file_size_gb(model_name)
+    if size is None:
+        size = MODEL_SIZE_HINTS_GB.get(model_name)
+    if size is None:
+        return None
+    return round(size * 1.05 + RUNTIME_OVERHEAD_GB, 2)
+
+def build_manifest(
+    models: Iterable[str], mirror: Optional[str] = None, models_dir: Optional[Path] = None
+) -> List[Dict[str, Any]]:
+    """Download entries (name, local path, url, sha256) for registered models.
+
+    A mirror, when given, takes precedence over the upstream url: a clinic
+    provisioning from a LAN share should not reach out to the internet.
+    """
+    entries: List[Dict[str, Any]] = []
+    for name in models:
+        if name not in MODEL_FILES:
+            continue
+        source = MODEL_SOURCES.get(name, {})
+        url = source.get("url", "")
+        if mirror:
+            url = mirror.rstrip("/") + "/" + MODEL_FILES[name]
+        entries.append(
+            {
+                "name": name,
+                "path": str(Path(models_dir or MODELS_DIR) / MODEL_FILES[name]),
+                "url": url,
+                "sha256": source.get("sha256", "").lower(),
+                "size_hint_gb": MODEL_SIZE_HINTS_GB.get(name),
+            }
+        )
+    return entries
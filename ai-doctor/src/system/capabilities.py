@@ -1,11 +1,49 @@
-import psutil  # make sure it's in requirements.txt
+import os
+from functools import lru_cache
+from typing import Dict
 
+# psutil (make sure it's in requirements.txt) is imported on first probe, and
+# facts that cannot change while the process runs are probed only once
+
+@lru_cache(maxsize=None)
 def get_total_ram_gb() -> float:
+    import psutil
+
     mem = psutil.virtual_memory()
     return mem.total / (1024**3)
 
-def classify_machine() -> str:
-    ram = get_total_ram_gb()
+def get_available_ram_gb() -> float:
+    """RAM that can be used without swapping (free + reclaimable cache)."""
+    import psutil
+
+    mem = psutil.virtual_memory()
+    return mem.available / (1024**3)
+
+@lru_cache(maxsize=None)
+def get_cpu_cores() -> int:
+    """Physical cores; falls back to logical CPUs when psutil can't tell."""
+    import psutil
+
+    return psutil.cpu_count(logical=False) or os.cpu_count() or 1
+
+@lru_cache(maxsize=None)
+def get_logical_cpus() -> int:
+    import psutil
+
+    return psutil.cpu_count(logical=True) or os.cpu_count() or 1
+
+def probe_resources() -> Dict[str, float]:
+    """Live snapshot of the resources the model planner cares about."""
+    return {
+        "total_ram_gb": round(get_total_ram_gb(), 2),
+        "available_ram_gb": round(get_available_ram_gb(), 2),
+        "cpu_cores": get_cpu_cores(),
+        "logical_cpus": get_logical_cpus(),
+    }
+
+def classify_machine(ram: float | None = None) -> str:
+    if ram is None:
+        ram = get_total_ram_gb()
 
     if ram < 6:
         return "LOW"
@@ -1,8 +1,27 @@
-from typing import Dict
-from .capabilities import classify_machine
+from typing import Any, Dict, List, Optional
+from .capabilities import classify_machine, probe_resources
+from src.llm.model_registry import MODEL_FILES, estimate_footprint_gb, is_model_available
 
-def plan_models() -> Dict[str, str]:
-    tier = classify_machine()
+ROLES = ("REASONING_MODEL", "EXPLAIN_MODEL", "VISION_MODEL")
+# Roles that must always have a model; VISION_MODEL may be switched off
+REQUIRED_ROLES = ("REASONING_MODEL", "EXPLAIN_MODEL")
+
+# Fallback ladder per role, largest first. The planner walks down from the
+# tier's preferred model until the estimated footprint fits in free RAM.
+ROLE_CANDIDATES: Dict[str, List[str]] = {
+    "REASONING_MODEL": ["qwen3:8b", "openchat:3.5-q3", "gemma:2b"],
+    "EXPLAIN_MODEL": ["qwen3:8b", "llama3:8b", "gemma:2b"],
+    "VISION_MODEL": ["qwen2.5vl:7b"],
+}
+
+# Memory kept free for the OS, the backend itself and page cache
+RESERVE_GB = 1.0
+# 7-8B models are too slow for interactive use below this many cores
+MIN_CORES_FOR_LARGE = 4
+LARGE_MODEL_GB = 4.0
+
+def plan_models(tier: Optional[str] = None) -> Dict[str, str]:
+    tier = tier or classify_machine()
 
     cfg: Dict[str, str] = {
         "REASONING_MODEL": "gemma:2b",   # always safe
@@ -19,3 +38,108 @@ def plan_models() -> Dict[str, str]:
         cfg["VISION_MODEL"] = "qwen2.5vl:7b"
 
     return cfg
+
+def _ladder(role: str, preferred: str) -> List[str]:
+    candidates = ROLE_CANDIDATES.get(role, [])
+    if preferred in candidates:
+        return candidates[candidates.index(preferred):]
+    return [preferred] + candidates if preferred else []
+
+def build_plan(
+    resources: Optional[Dict[str, float]] = None,
+    current: Optional[Dict[str, str]] = None,
+    upgrade_margin_gb: float = 1.0,
+    tier: Optional[str] = None,
+    require_files: bool = True,
+) -> Dict[str, Any]:
+    """Plan models from live resources instead of total RAM alone.
+
+    Starts from the tier plan (``plan_models``) and, per role, steps down the
+    candidate ladder while the estimated resident footprint does not fit in
+    available RAM or the CPU is too small for it. Models in ``current`` are
+    assumed to be loaded already, so their footprint is credited back to the
+    budget; moving to a larger model than ``current`` additionally needs
+    ``upgrade_margin_gb`` of headroom so the plan does not flap.
+
+    ``tier`` overrides the tier read from total RAM. With ``require_files``
+    off, GGUF files missing from disk do not rule a model out (the
+    downloader plans what to fetch this way).
+    """
+    resources = resources or probe_resources()
+    current = current or {}
+    tier = tier or classify_machine(resources["total_ram_gb"])
+    preferred = plan_models(tier)
+
+    loaded = {m for m in current.values() if m}
+    credit = sum(estimate_footprint_gb(m) or 0.0 for m in loaded)
+    budget = resources["available_ram_gb"] + credit - RESERVE_GB
+
+    # Only filter on presence when at least one registered GGUF is on disk;
+    # otherwise models are assumed to be managed by the LLM server (Ollama).
+    check_presence = require_files and any(is_model_available(m) for m in MODEL_FILES)
+
+    models: Dict[str, str] = {}
+    reasons: Dict[str, List[str]] = {}
+    footprints: Dict[str, Optional[float]] = {}
+    used: Dict[str, float] = {}
+
+    for role in ROLES:
+        role_reasons: List[str] = []
+        chosen = ""
+        for candidate in _ladder(role, preferred.get(role, "")):
+            size = estimate_footprint_gb(candidate)
+            # A model already used by another role costs nothing extra
+            extra = 0.0 if candidate in used else (size or 0.0)
+            remaining = budget - sum(used.values())
+            current_size = estimate_footprint_gb(current.get(role, "")) or 0.0
+            if current.get(role) and candidate not in loaded and (size or 0.0) > current_size:
+                remaining -= upgrade_margin_gb
+
+            if check_presence and candidate in MODEL_FILES and not is_model_available(candidate):
+                role_reasons.append(f"{candidate}: GGUF file not present")
+                continue
+            if size is not None and size >= LARGE_MODEL_GB and resources["cpu_cores"] < MIN_CORES_FOR_LARGE:
+                role_reasons.append(
+                    f"{candidate}: {resources['cpu_cores']} cores < {MIN_CORES_FOR_LARGE} needed for a {size} GB model"
+                )
+                continue
+            if extra > remaining:
+                role_reasons.append(
+                    f"{candidate}: needs ~{size} GB, only {max(remaining, 0):.1f} GB free"
+                )
+                continue
+
+            chosen = candidate
+            if size is not None:
+                used.setdefault(candidate, size)
+            if candidate != preferred.get(role):
+                role_reasons.append(f"downgraded from {preferred.get(role)} to {candidate}")
+            else:
+                role_reasons.append(f"{candidate}: tier {tier} default, fits (~{size} GB)")
+            break
+
+        if not chosen and preferred.get(role) and role in REQUIRED_ROLES:
+            # Share a model another role already loads, else take the smallest
+            ladder = _ladder(role, preferred[role])
+            shared = [m for m in ladder if m in used]
+            chosen = shared[0] if shared else ladder[-1]
+            used.setdefault(chosen, estimate_footprint_gb(chosen) or 0.0)
+            role_reasons.append(f"nothing fits; falling back to {chosen}")
+        elif not chosen and preferred.get(role):
+            role_reasons.append("no candidate fits; role disabled")
+        elif not preferred.get(role):
+            role_reasons.append(f"disabled for tier {tier}")
+
+        models[role] = chosen
+        reasons[role] = role_reasons
+        footprints[role] = estimate_footprint_gb(chosen) if chosen else None
+
+    return {
+        "tier": tier,
+        "resources": resources,
+        "budget_gb": round(budget, 2),
+        "estimated_footprint_gb": round(sum(used.values()), 2),
+        "models": models,
+        "footprints_gb": footprints,
+        "reasons": reasons,
+    }